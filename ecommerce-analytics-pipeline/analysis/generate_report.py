@@ -43,7 +43,7 @@ def generate():
             (SELECT COUNT(*) FROM fact_orders) AS total_orders,
             (SELECT ROUND(SUM(total), 2) FROM fact_orders) AS total_revenue,
             (SELECT ROUND(AVG(total), 2) FROM fact_orders) AS avg_order_value,
-            (SELECT COUNT(DISTINCT session_id) FROM fact_sessions) AS total_sessions
+            (SELECT COUNT(*) FROM fact_sessions) AS total_sessions
         FROM dim_customers
     """)
 
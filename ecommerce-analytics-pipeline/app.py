@@ -7,16 +7,17 @@ import streamlit as st
 import pandas as pd
 import plotly.express as px
 import plotly.graph_objects as go
-import sqlite3
 import os
 import sys
 import math
 
+sys.path.insert(0, os.path.dirname(__file__))
+from etl.transform import connect
+
 DB_PATH = os.path.join(os.path.dirname(__file__), 'data', 'warehouse.db')
 
 # generate warehouse if it doesn't exist yet
 if not os.path.exists(DB_PATH):
-    sys.path.insert(0, os.path.dirname(__file__))
     from etl.extract_load import main as run_etl
     from etl.transform import run_models
     run_etl()
@@ -66,7 +67,8 @@ def get_colors():
 
 @st.cache_data(ttl=600)
 def query(sql):
-    conn = sqlite3.connect(DB_PATH)
+    # the warehouse connection the models use, hll_* functions and all
+    conn = connect(DB_PATH)
     df = pd.read_sql_query(sql, conn)
     conn.close()
     return df
@@ -202,15 +204,19 @@ kpis = query("""
         (SELECT COUNT(*) FROM fact_orders) AS orders,
         (SELECT ROUND(SUM(total), 2) FROM fact_orders) AS revenue,
         (SELECT ROUND(AVG(total), 2) FROM fact_orders) AS aov,
-        (SELECT COUNT(DISTINCT session_id) FROM fact_sessions) AS sessions
+        (SELECT COUNT(*) FROM fact_sessions) AS sessions,
+        (SELECT hll_count(hll_merge(visitors_sketch)) FROM fact_daily_visits
+         WHERE session_date > DATE((SELECT MAX(session_date) FROM fact_daily_visits), '-30 days')) AS visitors_30d
 """).iloc[0]
 
-c1, c2, c3, c4, c5 = st.columns(5)
+c1, c2, c3, c4, c5, c6 = st.columns(6)
 c1.metric("Customers", f"{int(kpis['customers']):,}")
 c2.metric("Orders", f"{int(kpis['orders']):,}")
 c3.metric("Revenue", f"${kpis['revenue']:,.0f}")
 c4.metric("Avg Order Value", f"${kpis['aov']:,.2f}")
 c5.metric("Sessions", f"{int(kpis['sessions']):,}")
+# merged from the daily HyperLogLog sketches, within ~1%
+c6.metric("Visitors (30d)", f"~{int(kpis['visitors_30d'] or 0):,}")
 
 st.markdown("---")
 
@@ -287,6 +293,18 @@ with tab1:
         use_container_width=True, hide_index=True
     )
 
+    # multi-touch attribution: the same revenue under each model
+    mta = query("SELECT model, channel, attributed_revenue FROM analytics_attribution_models")
+    fig = px.bar(
+        mta, x='channel', y='attributed_revenue', color='model', barmode='group',
+        color_discrete_sequence=COLORS,
+        title='Revenue by channel under each attribution model (30-day lookback)'
+    )
+    fig.update_traces(marker_line_width=0)
+    clean_chart(fig)
+    fig.update_layout(showlegend=True, legend=dict(font_size=11, font_color=t['font_color'], orientation='h', y=-0.15))
+    st.plotly_chart(fig, use_container_width=True)
+
     # findings
     best = attr.loc[attr['conversion_rate'].idxmax()]
     biggest = attr.loc[attr['total_sessions'].idxmax()]
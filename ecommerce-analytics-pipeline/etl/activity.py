@@ -0,0 +1,180 @@
+"""
+Customer activity bitmaps — cohort retention without re-joining the orders.
+
+Each customer's activity is a bitmap of the days since signup: bit d is set
+when they ordered on day d after their signup day (day 0), packed eight
+days to a byte, least significant bit first. A year of history is at most
+46 bytes per customer, and a customer whose new orders arrive only needs
+their own bitmap rebuilt (models/marts/fact_customer_activity.sql).
+
+register(conn) adds these to a SQLite connection:
+  activity_bitmap(day)    aggregate, the bitmap BLOB of the days given
+  bitmap_count(bitmap)    how many days are set
+
+Retention.compute() turns the bitmaps into cohort retention at 'day',
+'week' (Monday to Sunday) or 'month' granularity, overall and per value of
+each breakdown column. The bitmaps are read in chunks and unpacked in numpy:
+a customer's set bits become periods since their cohort's, and a customer
+counts once per period they were active in. Cohort sizes come from the
+customers table, since most customers never order at all.
+"""
+
+import numpy as np
+
+CHUNK = 100_000  # customers unpacked at a time
+
+GRANULARITIES = ('day', 'week', 'month')
+
+RETENTION_COLUMNS = ['granularity TEXT', 'cohort TEXT', 'dimension TEXT', 'value TEXT',
+                     'periods_since_signup INTEGER', 'active_customers INTEGER',
+                     'total_in_cohort INTEGER', 'retention_rate REAL']
+
+
+def to_bytes(days):
+    """The bitmap BLOB of an iterable of day offsets (>= 0)."""
+    days = np.asarray(list(days), dtype=np.int64)
+    if not days.size:
+        return None
+    bits = np.zeros(int(days.max()) + 1, dtype=np.uint8)
+    bits[days] = 1
+    return np.packbits(bits, bitorder='little').tobytes()
+
+
+def days(blob):
+    """The day offsets set in a bitmap BLOB, ascending."""
+    bits = np.unpackbits(np.frombuffer(blob, dtype=np.uint8), bitorder='little')
+    return np.flatnonzero(bits)
+
+
+def period_keys(day_keys, granularity):
+    """Days since 1970-01-01 -> day, Monday-week or month number, same epoch."""
+    if granularity == 'day':
+        return day_keys
+    if granularity == 'week':
+        # 1970-01-01 was a Thursday
+        return (day_keys + 3) // 7
+    return day_keys.astype('datetime64[D]').astype('datetime64[M]').astype(np.int64)
+
+
+def period_label(key, granularity):
+    """First day of a period as 'YYYY-MM-DD', or 'YYYY-MM' for a month."""
+    if granularity == 'month':
+        return str(np.datetime64(int(key), 'M'))
+    return str(np.datetime64(int(key) * 7 - 3 if granularity == 'week' else int(key), 'D'))
+
+
+def _pct(part, whole):
+    return round(int(part) / int(whole) * 100, 2) if whole else None
+
+
+class _Bitmap:
+    # SQLite aggregate: the days are collected, the bitmap is built once
+    def __init__(self):
+        self.days = []
+
+    def step(self, day):
+        # NULLs and days before signup are skipped
+        if day is not None and day >= 0:
+            self.days.append(day)
+
+    def finalize(self):
+        return to_bytes(self.days)
+
+
+def _count(blob):
+    if blob is None:
+        return None
+    return int(np.unpackbits(np.frombuffer(blob, dtype=np.uint8)).sum())
+
+
+def register(conn):
+    """Add the activity bitmap functions to a sqlite3 connection. Returns it."""
+    conn.create_aggregate('activity_bitmap', 1, _Bitmap)
+    conn.create_function('bitmap_count', 1, _count, deterministic=True)
+    return conn
+
+
+class Retention:
+    """Cohort retention from activity bitmaps, at one granularity."""
+
+    def __init__(self, granularity='month', horizon=None):
+        if granularity not in GRANULARITIES:
+            raise ValueError(f"retention granularity must be one of {GRANULARITIES}, not {granularity!r}")
+        self.granularity = granularity
+        # periods since signup kept, None for all of them
+        self.horizon = horizon
+
+    def _active(self, signup_days, blobs):
+        """(customer index, periods since signup) once per period each customer was active in."""
+        sizes = np.array([len(b) for b in blobs], dtype=np.int64)
+        bits = np.unpackbits(np.frombuffer(b''.join(blobs), dtype=np.uint8), bitorder='little')
+        at = np.flatnonzero(bits)
+        ends = np.cumsum(sizes) * 8
+        customer = np.searchsorted(ends, at, side='right')
+        offset = at - (ends - sizes * 8)[customer]
+        day = signup_days[customer] + offset
+        period = period_keys(day, self.granularity) - period_keys(signup_days[customer], self.granularity)
+        # set bits come out in order per customer and periods never go back,
+        # so the repeats of a (customer, period) pair are next to each other
+        first = np.ones(len(at), dtype=bool)
+        first[1:] = (customer[1:] != customer[:-1]) | (period[1:] != period[:-1])
+        return customer[first], period[first]
+
+    def compute(self, conn, table='fact_customer_activity', customers='dim_customers', breakdowns=()):
+        """
+        Retention of every signup cohort. `table` has signup_day_key, activity
+        and the breakdown columns, one row per customer with any activity;
+        `customers` has first_seen_epoch and the breakdown columns for every
+        customer. Returns (column definitions, rows), one row per cohort,
+        breakdown value ('all' for everyone) and period with activity.
+        """
+        g = self.granularity
+        columns = ''.join(f', {b}' for b in breakdowns)
+
+        # cohort sizes: (cohort key, value per breakdown) -> customers
+        sizes = conn.execute(f"""
+            SELECT first_seen_epoch / 86400 AS signup_day{columns}, COUNT(*)
+            FROM {customers}
+            GROUP BY 1{''.join(f', {i}' for i in range(2, len(breakdowns) + 2))}
+        """).fetchall()
+        cohorts = period_keys(np.array([r[0] for r in sizes], dtype=np.int64), g)
+        totals = {}
+        for cohort, row in zip(cohorts.tolist(), sizes):
+            for dimension, value in [('all', 'all'), *zip(breakdowns, row[1:-1])]:
+                totals[cohort, dimension, value] = totals.get((cohort, dimension, value), 0) + row[-1]
+
+        # active customers: (cohort key, dimension, value, period) -> customers
+        active = {}
+        cur = conn.execute(f"SELECT signup_day_key, activity{columns} FROM {table} WHERE activity IS NOT NULL")
+        while True:
+            rows = cur.fetchmany(CHUNK)
+            if not rows:
+                break
+            signup_days = np.array([r[0] for r in rows], dtype=np.int64)
+            customer, period = self._active(signup_days, [r[1] for r in rows])
+            if self.horizon is not None:
+                keep = period <= self.horizon
+                customer, period = customer[keep], period[keep]
+            if not len(customer):
+                continue
+            cohort = period_keys(signup_days, g)[customer]
+            c0, n_cohorts, n_periods = int(cohort.min()), int(np.ptp(cohort)) + 1, int(period.max()) + 1
+            groups = [('all', ['all'] * len(rows))] + [(b, [r[2 + i] for r in rows]) for i, b in enumerate(breakdowns)]
+            for dimension, values in groups:
+                labels = sorted(set(values), key=lambda v: (v is None, str(v)))
+                index = {v: j for j, v in enumerate(labels)}
+                codes = np.array([index[v] for v in values], dtype=np.int64)[customer]
+                # one bincount over (cohort, value, period) codes
+                flat = ((cohort - c0) * len(labels) + codes) * n_periods + period
+                counts = np.bincount(flat, minlength=n_cohorts * len(labels) * n_periods)
+                for f in np.flatnonzero(counts).tolist():
+                    rest, p = divmod(f, n_periods)
+                    c, j = divmod(rest, len(labels))
+                    key = (c0 + c, dimension, labels[j], p)
+                    active[key] = active.get(key, 0) + int(counts[f])
+
+        out = []
+        for (cohort, dimension, value, p), n in sorted(active.items(), key=lambda kv: (kv[0][:2], str(kv[0][2]), kv[0][3])):
+            total = totals.get((cohort, dimension, value), 0)
+            out.append((g, period_label(cohort, g), dimension, value, p, n, total, _pct(n, total)))
+        return RETENTION_COLUMNS, out
@@ -0,0 +1,186 @@
+"""
+Multi-touch attribution — credit each order to the sessions that led to it.
+
+An order's touchpoints are its customer's sessions that started at or
+before it, within the lookback window (30 days by default). Each model
+splits the order, and its revenue, between them:
+
+- first_touch: all to the first session
+- last_touch: all to the last session before the order
+- linear: evenly across the sessions
+- time_decay: by 2^(-age / half_life), age being how long before the order
+  the session started (7-day half-life by default)
+- position_based: 40% first, 40% last, 20% split across the ones between
+  (half and half for two sessions)
+
+An order with no sessions in its window goes whole to its own channel.
+
+Sessions are streamed once, in (customer_id, session_start_epoch) order,
+which an index on fact_sessions gives SQLite for free, so nothing is
+sorted and only CHUNK sessions are held at a time. Orders are read once
+and sorted in numpy. For each chunk of customers the orders are matched
+to their window of sessions with searchsorted, and every model's credit
+for every touchpoint is computed at once; only per-channel totals are kept.
+"""
+
+import numpy as np
+
+CHUNK = 500_000  # sessions read at a time
+DAY = 86400
+
+MODELS = ('first_touch', 'last_touch', 'linear', 'time_decay', 'position_based')
+
+COLUMNS = ['model TEXT', 'channel TEXT', 'attributed_orders REAL', 'attributed_revenue REAL',
+           'revenue_share_pct REAL', 'touchpoints INTEGER', 'first_touches INTEGER', 'last_touches INTEGER']
+
+
+def _weights(model, position, length, age, order, half_life):
+    """Credit of each touchpoint, given its position in its order's path of `length`."""
+    first, last = position == 0, position == length - 1
+    if model == 'first_touch':
+        return first.astype(np.float64)
+    if model == 'last_touch':
+        return last.astype(np.float64)
+    if model == 'linear':
+        return 1.0 / length
+    if model == 'time_decay':
+        # ages from the order's newest touchpoint, so no path decays to all zeros
+        newest = np.arange(len(age)) - position + length - 1
+        decay = np.exp2(-(age - age[newest]) / half_life)
+        return decay / np.bincount(order, weights=decay)[order]
+    middle = 0.2 / np.maximum(length - 2, 1)
+    return np.where(length == 1, 1.0, np.where(length == 2, 0.5, np.where(first | last, 0.4, middle)))
+
+
+def _total(parts, n):
+    # per-chunk bincounts, padded to the n channels seen by the end
+    total = np.zeros(n)
+    for part in parts:
+        total[:len(part)] += part
+    return total
+
+
+class Attribution:
+    """Multi-touch attribution of orders to the sessions before them."""
+
+    def __init__(self, lookback_days=30, half_life_days=7, models=MODELS):
+        unknown = set(models) - set(MODELS)
+        if unknown:
+            raise ValueError(f"unknown attribution models {sorted(unknown)}, expected some of {MODELS}")
+        self.lookback = lookback_days * DAY if lookback_days is not None else None
+        self.half_life = half_life_days * DAY
+        self.models = list(models)
+        self.channels = {}
+
+    def _codes(self, values):
+        return np.array([self.channels.setdefault(v, len(self.channels)) for v in values], dtype=np.int64)
+
+    def _orders(self, conn, table):
+        """(customer_id, order_epoch, total, channel code) arrays, sorted by customer and time."""
+        rows = conn.execute(f"""
+            SELECT customer_id, order_epoch, total, order_channel
+            FROM {table}
+            WHERE customer_id IS NOT NULL
+        """).fetchall()
+        customer = np.array([r[0] for r in rows], dtype=np.int64)
+        when = np.array([r[1] for r in rows], dtype=np.int64)
+        revenue = np.array([r[2] for r in rows], dtype=np.float64)
+        order = np.lexsort((when, customer))
+        return customer[order], when[order], revenue[order], self._codes([rows[i][3] for i in order])
+
+    def _credit(self, orders, sessions):
+        """
+        Every touchpoint of the orders against their customers' sessions
+        (both sorted by customer and time): (channel code, position in the
+        path, path length, {model: share of the order}, order revenue).
+        """
+        customer, when, revenue, channel = orders
+        s_customer, s_when, s_channel = sessions
+        # customer_id in the high bits, epoch in the low 32: sorts like the pair
+        keys = (s_customer << 32) + s_when
+        end = np.searchsorted(keys, (customer << 32) + when, side='right')
+        if self.lookback is None:
+            start = np.searchsorted(s_customer, customer, side='left')
+        else:
+            start = np.searchsorted(keys, (customer << 32) + np.maximum(when - self.lookback, 0), side='left')
+        # an order without sessions is its own single touchpoint
+        alone = end == start
+        length = np.maximum(end - start, 1)
+
+        order = np.repeat(np.arange(len(customer)), length)
+        position = np.arange(len(order)) - np.repeat(np.cumsum(length) - length, length)
+        n = length[order]
+        alone = alone[order]
+        session = np.where(alone, len(s_channel), start[order] + position)
+        touch = np.where(alone, channel[order], np.append(s_channel, 0)[session])
+        age = np.where(alone, 0, when[order] - np.append(s_when, 0)[session]).astype(np.float64)
+        shares = {m: _weights(m, position, n, age, order, self.half_life) for m in self.models}
+        return touch, position, n, shares, revenue[order]
+
+    def compute(self, conn, sessions='fact_sessions', orders='fact_orders'):
+        """
+        Attribute every order in `orders` (customer_id, order_epoch, total,
+        order_channel) to the sessions in `sessions` (customer_id,
+        session_start_epoch, attribution_channel). Returns (column
+        definitions, rows), one row per model and channel.
+        """
+        self.channels = {}
+        o_customer, o_when, o_revenue, o_channel = self._orders(conn, orders)
+        parts = {key: [] for key in ['touchpoints', 'first', 'last',
+                                     *((m, 'orders') for m in self.models),
+                                     *((m, 'revenue') for m in self.models)]}
+
+        def attribute(s_customer, s_when, s_channel, lo, hi):
+            # the orders of customers lo..hi, all of whose sessions are in hand
+            a = np.searchsorted(o_customer, lo, side='left')
+            b = np.searchsorted(o_customer, hi, side='right')
+            if a == b:
+                return
+            touch, position, n, shares, revenue = self._credit(
+                (o_customer[a:b], o_when[a:b], o_revenue[a:b], o_channel[a:b]),
+                (s_customer, s_when, s_channel))
+            parts['touchpoints'].append(np.bincount(touch))
+            parts['first'].append(np.bincount(touch[position == 0]))
+            parts['last'].append(np.bincount(touch[position == n - 1]))
+            for m, share in shares.items():
+                parts[m, 'orders'].append(np.bincount(touch, weights=share))
+                parts[m, 'revenue'].append(np.bincount(touch, weights=share * revenue))
+
+        def arrays(rows):
+            return (np.array([r[0] for r in rows], dtype=np.int64),
+                    np.array([r[1] for r in rows], dtype=np.int64),
+                    self._codes([r[2] for r in rows]))
+
+        cur = conn.execute(f"""
+            SELECT customer_id, session_start_epoch, attribution_channel
+            FROM {sessions}
+            WHERE customer_id IS NOT NULL
+            ORDER BY customer_id, session_start_epoch
+        """)
+        carry, lo = [], np.iinfo(np.int64).min
+        while True:
+            rows = cur.fetchmany(CHUNK)
+            if not rows:
+                break
+            rows = carry + rows
+            # the last customer's sessions may go on in the next chunk
+            cut = len(rows)
+            while cut and rows[cut - 1][0] == rows[-1][0]:
+                cut -= 1
+            carry, rows = rows[cut:], rows[:cut]
+            if rows:
+                attribute(*arrays(rows), lo, rows[-1][0])
+                lo = rows[-1][0] + 1
+        attribute(*arrays(carry), lo, np.iinfo(np.int64).max)
+
+        names = list(self.channels)
+        totals = {key: _total(p, len(names)) for key, p in parts.items()}
+        out = []
+        for m in self.models:
+            revenue = totals[m, 'revenue']
+            whole = revenue.sum()
+            for j in np.argsort(-revenue, kind='stable'):
+                out.append((m, names[j], round(float(totals[m, 'orders'][j]), 2), round(float(revenue[j]), 2),
+                            round(float(revenue[j] / whole * 100), 2) if whole else None,
+                            int(totals['touchpoints'][j]), int(totals['first'][j]), int(totals['last'][j])))
+        return COLUMNS, out
@@ -0,0 +1,167 @@
+"""
+Idempotent ingest for raw_events.
+
+raw_events has an AUTOINCREMENT event_id and no natural key, so a replayed
+export or a retried batch post would land twice. EventDeduper keys every
+event on (session_id, event_type, product_id, event_timestamp) and keeps a
+Bloom filter of the keys already in the warehouse:
+
+- filter miss -> definitely new, insert without touching the table
+- filter hit  -> maybe a duplicate, confirm with one exact lookup on
+                 idx_raw_events_session
+
+The filter is stored in raw_events_bloom together with the last event_id it
+has seen, so the next run picks up where this one stopped and folds in rows
+that other loaders (the generators, a crashed run) added in the meantime.
+"""
+
+import hashlib
+import math
+
+import numpy as np
+
+FALSE_POSITIVE_RATE = 0.01
+MIN_CAPACITY = 1_000_000
+REBUILD_FETCH = 100_000
+
+EXISTS_SQL = """
+    SELECT 1 FROM raw_events
+    WHERE session_id = ? AND event_type = ? AND product_id IS ? AND event_timestamp = ?
+    LIMIT 1
+"""
+
+
+def event_key(session_id, event_type, product_id, event_timestamp):
+    """128-bit content key for one event."""
+    key = f"{session_id}\x1f{event_type}\x1f{'' if product_id is None else product_id}\x1f{event_timestamp}"
+    return hashlib.blake2b(key.encode(), digest_size=16).digest()
+
+
+class BloomFilter:
+    """Packed-bit Bloom filter over 128-bit keys, k probes by double hashing."""
+
+    def __init__(self, capacity, fp_rate=FALSE_POSITIVE_RATE, bits=None, count=0):
+        self.capacity = capacity
+        self.fp_rate = fp_rate
+        num_bits = int(-capacity * math.log(fp_rate) / math.log(2) ** 2)
+        self.num_bits = (num_bits + 7) // 8 * 8
+        self.num_hashes = max(1, round(self.num_bits / capacity * math.log(2)))
+        self.bits = bits if bits is not None else np.zeros(self.num_bits // 8, dtype=np.uint8)
+        self.count = count
+
+    def _probes(self, digests):
+        h = np.frombuffer(b''.join(digests), dtype='<u8').reshape(-1, 2)
+        steps = np.arange(self.num_hashes, dtype=np.uint64)
+        # uint64 wraps on overflow, which is fine for hashing
+        return (h[:, :1] + steps * h[:, 1:]) % np.uint64(self.num_bits)
+
+    def contains(self, digests):
+        """Bool array: True where the key may have been added, False where it never was."""
+        if not digests:
+            return np.zeros(0, dtype=bool)
+        probes = self._probes(digests)
+        return ((self.bits[probes >> 3] >> (probes & 7).astype(np.uint8)) & 1).all(axis=1)
+
+    def add(self, digests):
+        if not digests:
+            return
+        probes = self._probes(digests).ravel()
+        np.bitwise_or.at(self.bits, probes >> 3, np.left_shift(1, probes & 7).astype(np.uint8))
+        self.count += len(digests)
+
+
+class EventDeduper:
+    """
+    Filters raw_events rows (INSERT_EVENTS_SQL order, ids already mapped)
+    down to the ones not yet in the warehouse. Callers must write the kept
+    rows before the next filter() call so exact checks can see them, and
+    call save() after their last commit.
+    """
+
+    def __init__(self, conn):
+        self.conn = conn
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS raw_events_bloom (
+                id INTEGER PRIMARY KEY CHECK (id = 1),
+                capacity INTEGER NOT NULL,
+                fp_rate REAL NOT NULL,
+                item_count INTEGER NOT NULL,
+                covered_event_id INTEGER NOT NULL,
+                bits BLOB NOT NULL
+            )
+        """)
+        self.duplicates = 0
+        self.exact_checks = 0
+        self.false_positives = 0
+        self._load()
+
+    def _load(self):
+        state = self.conn.execute(
+            "SELECT capacity, fp_rate, item_count, covered_event_id, bits FROM raw_events_bloom"
+        ).fetchone()
+        total = self.conn.execute("SELECT COUNT(*) FROM raw_events").fetchone()[0]
+        if state and total <= state[0]:
+            capacity, fp_rate, count, covered, bits = state
+            self.bloom = BloomFilter(capacity, fp_rate, np.frombuffer(bits, dtype=np.uint8).copy(), count)
+            self.covered = covered
+        else:
+            # first run, or the table outgrew the filter: size for twice what is there now
+            self.bloom = BloomFilter(max(MIN_CAPACITY, 2 * total))
+            self.covered = 0
+        self._catch_up()
+
+    def _catch_up(self):
+        cur = self.conn.execute("""
+            SELECT event_id, session_id, event_type, product_id, event_timestamp
+            FROM raw_events WHERE event_id > ? ORDER BY event_id
+        """, (self.covered,))
+        while True:
+            rows = cur.fetchmany(REBUILD_FETCH)
+            if not rows:
+                break
+            digests = [event_key(*row[1:]) for row in rows]
+            # rows this deduper kept are in the filter already, don't count them twice
+            self.bloom.add([d for d, hit in zip(digests, self.bloom.contains(digests).tolist()) if not hit])
+            self.covered = rows[-1][0]
+
+    def filter(self, rows):
+        digests = [event_key(row[1], row[2], row[3], row[8]) for row in rows]
+        maybe = self.bloom.contains(digests)
+        seen = set()
+        kept, kept_digests = [], []
+        exists = self.conn.execute
+        for row, digest, hit in zip(rows, digests, maybe.tolist()):
+            if digest in seen:
+                self.duplicates += 1
+                continue
+            if hit:
+                self.exact_checks += 1
+                if exists(EXISTS_SQL, (row[1], row[2], row[3], row[8])).fetchone():
+                    self.duplicates += 1
+                    continue
+                self.false_positives += 1
+            seen.add(digest)
+            kept.append(row)
+            kept_digests.append(digest)
+        self.bloom.add(kept_digests)
+        return kept
+
+    def save(self):
+        """
+        Persist the filter. Rows other writers (the generators, another
+        loader) added since it was loaded are folded in first, so every row
+        up to the event_id it records as covered really is in the filter.
+        """
+        self._catch_up()
+        self.conn.execute(
+            "INSERT OR REPLACE INTO raw_events_bloom VALUES (1, ?, ?, ?, ?, ?)",
+            (self.bloom.capacity, self.bloom.fp_rate, self.bloom.count, self.covered, self.bloom.bits.tobytes()),
+        )
+        self.conn.commit()
+
+    def stats(self):
+        return {
+            'duplicates': self.duplicates,
+            'exact_checks': self.exact_checks,
+            'false_positives': self.false_positives,
+        }
@@ -0,0 +1,307 @@
+"""
+DuckDB backend — runs the same SQL model files on DuckDB's columnar,
+multi-threaded engine instead of SQLite's row store.
+
+The raw tables the models read are copied from the SQLite warehouse into
+data/warehouse.duckdb (through DuckDB's sqlite extension when it loads,
+through a CSV file otherwise), then the models are built in dependency order,
+each in one transaction. Every build is a full build: incremental
+materialization, the build cache, @indexes, @clustered_by and @partition_by
+are SQLite features and are ignored here. Python models get the DuckDB
+connection for their build(conn), so their SQL has to run on both; a
+SELECT they return for a table goes through translate() like model SQL.
+approx_count_distinct() is built into DuckDB (its own hash, so estimates
+differ a little). Models that use the HyperLogLog sketch functions
+(etl/hll.py) or the activity bitmaps (etl/activity.py) have no DuckDB
+equivalent and are skipped, along with the models downstream of them.
+
+The models are written in SQLite's dialect, so translate() shims it:
+strftime / DATE / julianday become macros with SQLite's argument order and
+text results, 'now' is the run's start time in UTC, REAL / INTEGER casts
+become DOUBLE / BIGINT and integer division truncates like SQLite's.
+
+compare_backends() is the parity check: every model table has the same
+columns and, up to float noise, the same rows on both backends.
+
+Usage: python etl/transform.py --backend duckdb [--parity]
+"""
+
+import csv
+import os
+import re
+import sqlite3
+import tempfile
+import time
+from datetime import datetime, timezone
+from decimal import Decimal
+
+import duckdb
+
+DUCKDB_PATH = os.path.join(os.path.dirname(__file__), '..', 'data', 'warehouse.duckdb')
+NULL_TOKEN = '\\N'
+
+# SQLite's date functions, as DuckDB macros. SQLite returns text from all of
+# them (strftime('%s') too) and takes modifiers like '+1 day' / '-3 days'
+SQLITE_MACROS = [
+    "CREATE OR REPLACE MACRO sqlite_strftime(fmt, v) AS strftime(CAST(v AS TIMESTAMP), fmt),"
+    " (fmt, v, m) AS strftime(CAST(v AS TIMESTAMP) + CAST(ltrim(m, '+') AS INTERVAL), fmt)",
+    "CREATE OR REPLACE MACRO sqlite_epoch(v) AS"
+    " CAST(CAST(floor(epoch(CAST(v AS TIMESTAMP))) AS BIGINT) AS VARCHAR)",
+    "CREATE OR REPLACE MACRO sqlite_date(v) AS strftime(CAST(v AS TIMESTAMP), '%Y-%m-%d'),"
+    " (v, m) AS strftime(CAST(v AS TIMESTAMP) + CAST(ltrim(m, '+') AS INTERVAL), '%Y-%m-%d')",
+    "CREATE OR REPLACE MACRO sqlite_julianday(v) AS epoch(CAST(v AS TIMESTAMP)) / 86400.0 + 2440587.5",
+    # SQLite rounds the decimal form (293.155 -> 293.16), DuckDB the binary
+    # double (293.15499.. -> 293.15); going through DECIMAL matches SQLite
+    "CREATE OR REPLACE MACRO sqlite_round(x) AS CAST(round(CAST(x AS DECIMAL(38, 12))) AS DOUBLE),"
+    " (x, n) AS CAST(round(CAST(x AS DECIMAL(38, 12)), n) AS DOUBLE)",
+]
+
+DIALECT = [
+    # DuckDB's strftime has no %s, epoch seconds get their own macro
+    (re.compile(r"\bstrftime\s*\(\s*'%s'\s*,", re.I), 'sqlite_epoch('),
+    (re.compile(r'\bstrftime\s*\(', re.I), 'sqlite_strftime('),
+    (re.compile(r'\bdate\s*\(', re.I), 'sqlite_date('),
+    (re.compile(r'\bjulianday\s*\(', re.I), 'sqlite_julianday('),
+    (re.compile(r'\bround\s*\(', re.I), 'sqlite_round('),
+    # REAL is a 4-byte float in DuckDB, INTEGER 4 bytes
+    (re.compile(r'\bAS\s+REAL\b', re.I), 'AS DOUBLE'),
+    (re.compile(r'\bAS\s+INTEGER\b', re.I), 'AS BIGINT'),
+]
+NOW_RE = re.compile(r"'now'", re.I)
+SQLITE_ONLY_RE = re.compile(r'\b(?:hll_sketch|hll_merge|hll_count|activity_bitmap|bitmap_count)\s*\(', re.I)
+COMMENT_RE = re.compile(r'--[^\n]*')
+
+
+def translate(sql, now):
+    """One SQLite model statement in DuckDB's dialect. `now` is a UTC 'YYYY-MM-DD HH:MM:SS'."""
+    sql = COMMENT_RE.sub('', sql)
+    for pattern, replacement in DIALECT:
+        sql = pattern.sub(replacement, sql)
+    return NOW_RE.sub(f"'{now}'", sql)
+
+
+def connect(path=None, threads=None):
+    """A DuckDB warehouse connection with the SQLite shims installed."""
+    con = duckdb.connect(path or DUCKDB_PATH)
+    if threads:
+        con.execute(f"SET threads = {int(threads)}")
+    con.execute("SET integer_division = true")
+    for sql in SQLITE_MACROS:
+        con.execute(sql)
+    return con
+
+
+def _duck_type(decl):
+    # SQLite's type affinity rules, roughly
+    decl = (decl or '').upper()
+    if 'INT' in decl:
+        return 'BIGINT'
+    if any(t in decl for t in ('CHAR', 'CLOB', 'TEXT')) or not decl:
+        return 'VARCHAR'
+    if 'BLOB' in decl:
+        return 'BLOB'
+    return 'DOUBLE'
+
+
+def _copy_via_csv(con, sqlite_conn, table):
+    # streaming through a CSV file and DuckDB's reader is ~100x faster than
+    # handing it Python rows, with or without numpy in between
+    cur = sqlite_conn.execute(f'SELECT * FROM "{table}"')
+    names = [d[0] for d in cur.description]
+    # table_xinfo, not table_info: the loader's time keys are generated columns
+    decls = {row[1]: row[2] for row in sqlite_conn.execute(f'PRAGMA table_xinfo("{table}")')}
+    types = ', '.join(f"'{n}': '{_duck_type(decls.get(n))}'" for n in names)
+    fd, path = tempfile.mkstemp(suffix='.csv')
+    try:
+        with os.fdopen(fd, 'w', newline='') as f:
+            csv.writer(f).writerows(
+                [NULL_TOKEN if v is None else v for v in row] for row in cur)
+        con.execute(f"""
+            CREATE OR REPLACE TABLE "{table}" AS
+            SELECT * FROM read_csv('{path}', header = false, nullstr = '{NULL_TOKEN}',
+                                   columns = {{{types}}})
+        """)
+    finally:
+        os.remove(path)
+
+
+def _attach_sqlite(con, sqlite_path):
+    try:
+        con.execute("INSTALL sqlite")
+        con.execute("LOAD sqlite")
+    except duckdb.Error:
+        return False
+    con.execute("DETACH DATABASE IF EXISTS warehouse")
+    con.execute(f"ATTACH '{sqlite_path}' AS warehouse (TYPE sqlite, READ_ONLY)")
+    return True
+
+
+def load_sources(con, sqlite_path, tables):
+    """Copy the given SQLite tables (or views) into DuckDB. Returns rows copied."""
+    sqlite_conn = sqlite3.connect(sqlite_path)
+    tables = [t for t in tables if sqlite_conn.execute(
+        "SELECT 1 FROM sqlite_master WHERE type IN ('table', 'view') AND name = ?", (t,)).fetchone()]
+    attached = _attach_sqlite(con, sqlite_path)
+    for table in tables:
+        if attached:
+            con.execute(f'CREATE OR REPLACE TABLE "{table}" AS SELECT * FROM warehouse."{table}"')
+        else:
+            _copy_via_csv(con, sqlite_conn, table)
+    if attached:
+        con.execute("DETACH warehouse")
+    sqlite_conn.close()
+    return sum(con.execute(f'SELECT COUNT(*) FROM "{t}"').fetchone()[0] for t in tables)
+
+
+def sqlite_only(models):
+    """
+    Names of the models that call functions only the SQLite side registers
+    (HyperLogLog sketches, activity bitmaps), and of every model downstream.
+    """
+    names = {name for name, m in models.items()
+             if not m.python and SQLITE_ONLY_RE.search(COMMENT_RE.sub('', m.sql))}
+    for name in _build_order(models):
+        if models[name].depends_on & names:
+            names.add(name)
+    return names
+
+
+def _load_python_model(con, model, now):
+    # build()'s tables go where the model's statements copy them from
+    for table, built in model.build(con).items():
+        if isinstance(built, str):
+            con.execute(f'CREATE OR REPLACE TEMP TABLE "{table}__build" AS {translate(built, now)}')
+            continue
+        columns, rows = built
+        decls = []
+        for column in columns:
+            name, _, decl = column.partition(' ')
+            decls.append(f'"{name}" {_duck_type(decl)}')
+        con.execute(f'CREATE OR REPLACE TEMP TABLE "{table}__build" ({", ".join(decls)})')
+        if rows:
+            con.executemany(f'INSERT INTO temp."{table}__build" VALUES ({", ".join("?" * len(columns))})',
+                            rows)
+
+
+def _build_order(models):
+    order, seen = [], set()
+
+    def visit(name):
+        if name not in seen:
+            seen.add(name)
+            for dep in sorted(models[name].depends_on):
+                visit(dep)
+            order.append(name)
+
+    for name in sorted(models):
+        visit(name)
+    return order
+
+
+def run_models(models, sqlite_path, duckdb_path=None, threads=None):
+    """
+    Build `models` (transform.load_models()) in DuckDB from the raw tables
+    of the SQLite warehouse at sqlite_path. One model at a time: DuckDB
+    spreads each query over `threads` cores (default: all). A failed
+    model's downstream models are skipped. Returns {name: report} like
+    transform.run_dag().
+    """
+    con = connect(duckdb_path, threads)
+    now = datetime.now(timezone.utc).strftime('%Y-%m-%d %H:%M:%S')
+    built = set()
+    for model in models.values():
+        built |= model.creates
+    started = time.perf_counter()
+    rows = load_sources(con, sqlite_path, sorted({t for m in models.values() for t in m.reads} - built))
+    print(f"  copied {rows:,} source rows in {time.perf_counter() - started:.2f}s")
+
+    skipped = sqlite_only(models)
+    results = {}
+    for name in _build_order(models):
+        model = models[name]
+        label = f"{model.group}/{os.path.basename(model.path)}"
+        if name in skipped:
+            results[name] = {'status': 'skipped', 'seconds': 0.0}
+            print(f"  SKIP {label} (SQLite-only functions, here or upstream)")
+            continue
+        failed = [d for d in model.depends_on if results[d]['status'] != 'ok']
+        if failed:
+            results[name] = {'status': 'skipped', 'seconds': 0.0}
+            print(f"  SKIP {label} (upstream {failed[0]} failed)")
+            continue
+        started = time.perf_counter()
+        con.execute("BEGIN")
+        try:
+            if model.python:
+                _load_python_model(con, model, now)
+            for stmt in model.statements:
+                con.execute(translate(stmt, now))
+            con.execute("COMMIT")
+        except duckdb.Error as e:
+            con.execute("ROLLBACK")
+            results[name] = {'status': 'error', 'seconds': 0.0, 'error': str(e)}
+            print(f"  ERR {label}: {e}")
+            continue
+        results[name] = {'status': 'ok', 'seconds': time.perf_counter() - started}
+        print(f"  OK  {label}  ({results[name]['seconds']:.2f}s)")
+    con.close()
+    return results
+
+
+def _normal(value):
+    # the same number can come back as int, float or Decimal, and sums
+    # in a different order differ in the last bits
+    if isinstance(value, bool):
+        return int(value)
+    if isinstance(value, (float, Decimal)):
+        value = float(value)
+        return int(value) if value.is_integer() else float(f'{value:.12g}')
+    if hasattr(value, 'isoformat'):
+        return value.isoformat()
+    return value
+
+
+def _table_rows(cur):
+    columns = [d[0] for d in cur.description]
+    rows = sorted((tuple(_normal(v) for v in row) for row in cur.fetchall()), key=repr)
+    return columns, rows
+
+
+def compare_backends(models, sqlite_path, duckdb_path=None):
+    """
+    Parity check between the model tables in the SQLite warehouse and in
+    DuckDB. Returns {table: what differs} for the tables that don't match.
+    Models that use 'now' can differ on rows near a cut-off (30 days since
+    the last order, ...) when the two were built at different times.
+    """
+    sqlite_conn = sqlite3.connect(sqlite_path)
+    con = duckdb.connect(duckdb_path or DUCKDB_PATH, read_only=True)
+    problems = {}
+    skipped = sqlite_only(models)
+    for table in sorted(t for name, m in models.items() if name not in skipped for t in m.creates):
+        try:
+            cols_a, rows_a = _table_rows(sqlite_conn.execute(f'SELECT * FROM "{table}"'))
+            cols_b, rows_b = _table_rows(con.execute(f'SELECT * FROM "{table}"'))
+        except (sqlite3.Error, duckdb.Error) as e:
+            problems[table] = f'missing: {e}'
+            continue
+        if cols_a != cols_b:
+            problems[table] = f'columns {cols_a} vs {cols_b}'
+        elif len(rows_a) != len(rows_b):
+            problems[table] = f'{len(rows_a):,} vs {len(rows_b):,} rows'
+        elif rows_a != rows_b:
+            diff = sum(1 for a, b in zip(rows_a, rows_b) if a != b)
+            first = next((a, b) for a, b in zip(rows_a, rows_b) if a != b)
+            problems[table] = f'{diff:,} rows differ, e.g. {first[0]} vs {first[1]}'
+    sqlite_conn.close()
+    con.close()
+    return problems
+
+
+def print_parity(models, problems):
+    skipped = sqlite_only(models)
+    tables = sorted(t for name, m in models.items() if name not in skipped for t in m.creates)
+    for table in tables:
+        print(f"  {'DIFF' if table in problems else 'same'}  {table}"
+              f"{': ' + problems[table] if table in problems else ''}")
+    print(f"  {len(tables) - len(problems)}/{len(tables)} tables match")
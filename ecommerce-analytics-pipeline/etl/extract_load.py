@@ -2,14 +2,23 @@
 Extract & Load — generates realistic ecommerce data and loads it into SQLite.
 Simulates what Fivetran/Stitch would do: pull raw data from source systems
 into a warehouse (we use SQLite as a local stand-in for Snowflake).
+
+Usage: python etl/extract_load.py [--customers N] [--vectorized | --shards N]
+                                  [--seed S] [--chunk-size ROWS] [--encoded]
+       python etl/extract_load.py --incremental [--seed S]
 """
 
+import argparse
 import sqlite3
 import random
 import hashlib
-from datetime import datetime, timedelta
+import time
+from contextlib import contextmanager
+from datetime import datetime, timedelta, timezone
 import os
 
+import numpy as np
+
 DB_PATH = os.path.join(os.path.dirname(__file__), '..', 'data', 'warehouse.db')
 
 CHANNELS = ['organic', 'paid_search', 'social_media', 'email', 'referral', 'direct']
@@ -67,12 +76,96 @@ LAST_NAMES = [
     'Carter', 'Roberts'
 ]
 
+STATUSES = ['delivered', 'delivered', 'delivered', 'shipped', 'processing', 'pending']
+EVENT_TYPES = ['page_view', 'product_view', 'add_to_cart', 'checkout_start',
+               'checkout_abandon', 'checkout_complete']
+
+# funnel probabilities — shared by the python and vectorized generators
+CART_RATE = 0.35
+CHECKOUT_RATE = 0.55
+ABANDON_RATE = 0.25
+
+# treatment effect per test — (base conversion rate, lift for treatment)
+AB_TEST_EFFECTS = {
+    1: (0.12, 0.035),   # checkout redesign: 12% -> ~15.5%
+    2: (0.08, 0.012),   # hero banner: smaller effect
+    3: (0.15, 0.045),   # free shipping: strong effect on AOV proxy
+    4: (0.10, 0.018),   # product page: moderate
+}
+
+INSERT_CUSTOMERS_SQL = 'INSERT INTO raw_customers VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)'
+INSERT_EVENTS_SQL = (
+    'INSERT INTO raw_events (customer_id, session_id, event_type, product_id, '
+    'attribution_channel, device_type, page_url, time_on_page, event_timestamp) '
+    'VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)'
+)
+INSERT_ORDERS_SQL = 'INSERT INTO raw_orders VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)'
+INSERT_ITEMS_SQL = (
+    'INSERT INTO raw_order_items (order_id, product_id, quantity, unit_price) '
+    'VALUES (?, ?, ?, ?)'
+)
+INSERT_ASSIGNMENTS_SQL = (
+    'INSERT INTO raw_ab_assignments (test_id, customer_id, variant, assigned_at, converted, conversion_value) '
+    'VALUES (?, ?, ?, ?, ?, ?)'
+)
+
+INSERT_SQL = {
+    'raw_customers': INSERT_CUSTOMERS_SQL,
+    'raw_events': INSERT_EVENTS_SQL,
+    'raw_orders': INSERT_ORDERS_SQL,
+    'raw_order_items': INSERT_ITEMS_SQL,
+    'raw_ab_assignments': INSERT_ASSIGNMENTS_SQL,
+}
+
+
+def _epoch_sql(col):
+    return f"CAST(strftime('%s', {col}) AS INTEGER)"
+
 
-def create_tables(conn):
-    """Create raw tables — these mimic what you'd get from a source system."""
+def _month_key_sql(col):
+    # months since year 0 (year * 12 + month - 1) — month diffs are plain subtraction
+    return f"CAST(substr({col}, 1, 4) AS INTEGER) * 12 + CAST(substr({col}, 6, 2) AS INTEGER) - 1"
+
+
+# integer epoch seconds and day/month keys, derived once when a row is
+# written so the models group and diff on integers instead of parsing the
+# ISO text on every read. day keys are days since 1970-01-01.
+TIME_KEY_COLUMNS = {
+    'raw_customers': [
+        ('created_epoch', _epoch_sql('created_at')),
+        ('last_active_epoch', _epoch_sql('last_active_at')),
+        ('created_month_key', _month_key_sql('created_at')),
+    ],
+    'raw_orders': [
+        ('created_epoch', _epoch_sql('created_at')),
+        ('created_day_key', 'created_epoch / 86400'),
+        ('created_month_key', _month_key_sql('created_at')),
+    ],
+    'raw_events': [
+        ('event_epoch', _epoch_sql('event_timestamp')),
+        ('event_day_key', 'event_epoch / 86400'),
+        ('event_month_key', _month_key_sql('event_timestamp')),
+    ],
+}
+
+
+def _time_key_ddl(table):
+    return ''.join(
+        f',\n        {name} INTEGER GENERATED ALWAYS AS ({expr}) STORED'
+        for name, expr in TIME_KEY_COLUMNS[table]
+    )
+
+
+def create_tables(conn, encoded=False):
+    """
+    Create raw tables — these mimic what you'd get from a source system.
+    encoded=True stores events dictionary-encoded (see create_encoded_events);
+    a warehouse that is already encoded stays that way.
+    """
     c = conn.cursor()
+    encoded = encoded or events_table(conn) == 'raw_events_encoded'
 
-    c.execute('''CREATE TABLE IF NOT EXISTS raw_customers (
+    c.execute(f'''CREATE TABLE IF NOT EXISTS raw_customers (
         customer_id INTEGER PRIMARY KEY,
         email TEXT NOT NULL,
         first_name TEXT,
@@ -81,7 +174,7 @@ def create_tables(conn):
         created_at TEXT,
         last_active_at TEXT,
         city TEXT,
-        state TEXT
+        state TEXT{_time_key_ddl('raw_customers')}
     )''')
 
     c.execute('''CREATE TABLE IF NOT EXISTS raw_products (
@@ -93,7 +186,7 @@ def create_tables(conn):
         created_at TEXT
     )''')
 
-    c.execute('''CREATE TABLE IF NOT EXISTS raw_orders (
+    c.execute(f'''CREATE TABLE IF NOT EXISTS raw_orders (
         order_id INTEGER PRIMARY KEY,
         customer_id INTEGER,
         subtotal REAL,
@@ -105,7 +198,7 @@ def create_tables(conn):
         attribution_channel TEXT,
         session_id TEXT,
         created_at TEXT,
-        completed_at TEXT,
+        completed_at TEXT{_time_key_ddl('raw_orders')},
         FOREIGN KEY (customer_id) REFERENCES raw_customers(customer_id)
     )''')
 
@@ -119,19 +212,22 @@ def create_tables(conn):
         FOREIGN KEY (product_id) REFERENCES raw_products(product_id)
     )''')
 
-    c.execute('''CREATE TABLE IF NOT EXISTS raw_events (
-        event_id INTEGER PRIMARY KEY AUTOINCREMENT,
-        customer_id INTEGER,
-        session_id TEXT,
-        event_type TEXT,
-        product_id INTEGER,
-        attribution_channel TEXT,
-        device_type TEXT,
-        page_url TEXT,
-        time_on_page INTEGER,
-        event_timestamp TEXT,
-        FOREIGN KEY (customer_id) REFERENCES raw_customers(customer_id)
-    )''')
+    if encoded:
+        create_encoded_events(c)
+    else:
+        c.execute(f'''CREATE TABLE IF NOT EXISTS raw_events (
+            event_id INTEGER PRIMARY KEY AUTOINCREMENT,
+            customer_id INTEGER,
+            session_id TEXT,
+            event_type TEXT,
+            product_id INTEGER,
+            attribution_channel TEXT,
+            device_type TEXT,
+            page_url TEXT,
+            time_on_page INTEGER,
+            event_timestamp TEXT{_time_key_ddl('raw_events')},
+            FOREIGN KEY (customer_id) REFERENCES raw_customers(customer_id)
+        )''')
 
     c.execute('''CREATE TABLE IF NOT EXISTS raw_ab_tests (
         test_id INTEGER PRIMARY KEY,
@@ -155,25 +251,290 @@ def create_tables(conn):
         FOREIGN KEY (customer_id) REFERENCES raw_customers(customer_id)
     )''')
 
+    add_time_key_columns(conn)
     conn.commit()
 
 
-def generate_data(conn, num_customers=200):
-    """Generate fake but realistic ecommerce data for the warehouse."""
-    c = conn.cursor()
-    now = datetime.now()
-    start_date = now - timedelta(days=365)  # one year of data
+def add_time_key_columns(conn):
+    """
+    Warehouses created before the time key columns existed get them added.
+    SQLite can only ALTER in VIRTUAL generated columns, so on those tables
+    they are computed on read until the next full rebuild.
+    """
+    for table, columns in TIME_KEY_COLUMNS.items():
+        if table == 'raw_events':
+            table = events_table(conn)
+        existing = {row[1] for row in conn.execute(f'PRAGMA table_xinfo({table})')}
+        for name, expr in columns:
+            if name not in existing:
+                conn.execute(f'ALTER TABLE {table} ADD COLUMN {name} INTEGER GENERATED ALWAYS AS ({expr}) VIRTUAL')
 
-    # --- Products ---
+
+# --- Encoded event storage ---
+# event_type, attribution_channel, device_type and page_url repeat on every
+# event. In encoded mode raw_events_encoded stores them as small integer codes
+# into lookup tables, and raw_events is a view that decodes them so anything
+# reading (or inserting into) raw_events keeps working.
+
+ENCODED_DIMS = [
+    # (raw_events column, lookup table, code column, values seeded up front)
+    ('event_type', 'lkp_event_type', 'event_type_code', EVENT_TYPES),
+    ('attribution_channel', 'lkp_attribution_channel', 'channel_code', CHANNELS),
+    ('device_type', 'lkp_device_type', 'device_code', DEVICES),
+    ('page_url', 'lkp_page_url', 'page_url_code',
+     ['/', '/checkout', '/checkout/success'] + [f'/product/{i}' for i in range(1, len(PRODUCTS) + 1)]),
+]
+
+INSERT_ENCODED_EVENTS_SQL = (
+    'INSERT INTO raw_events_encoded (customer_id, session_id, event_type_code, product_id, '
+    'channel_code, device_code, page_url_code, time_on_page, event_timestamp) '
+    'VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)'
+)
+
+
+def create_encoded_events(c):
+    for column, lookup, code_col, values in ENCODED_DIMS:
+        # normalized is LOWER()ed once per distinct value, not once per event
+        c.execute(f'''CREATE TABLE IF NOT EXISTS {lookup} (
+            code INTEGER PRIMARY KEY,
+            value TEXT NOT NULL UNIQUE,
+            normalized TEXT GENERATED ALWAYS AS (LOWER(value)) STORED
+        )''')
+        c.executemany(f'INSERT OR IGNORE INTO {lookup} (value) VALUES (?)', [(v,) for v in values])
+
+    c.execute(f'''CREATE TABLE IF NOT EXISTS raw_events_encoded (
+        event_id INTEGER PRIMARY KEY AUTOINCREMENT,
+        customer_id INTEGER,
+        session_id TEXT,
+        event_type_code INTEGER,
+        product_id INTEGER,
+        channel_code INTEGER,
+        device_code INTEGER,
+        page_url_code INTEGER,
+        time_on_page INTEGER,
+        event_timestamp TEXT{_time_key_ddl('raw_events')},
+        FOREIGN KEY (customer_id) REFERENCES raw_customers(customer_id)
+    )''')
+
+    decoded = {column: f'{lookup}.value' for column, lookup, _, _ in ENCODED_DIMS}
+    joins = '\n'.join(
+        f'    LEFT JOIN {lookup} ON {lookup}.code = e.{code_col}'
+        for _, lookup, code_col, _ in ENCODED_DIMS
+    )
+    c.execute(f'''CREATE VIEW IF NOT EXISTS raw_events AS
+    SELECT
+        e.event_id, e.customer_id, e.session_id,
+        {decoded['event_type']} AS event_type,
+        e.product_id,
+        {decoded['attribution_channel']} AS attribution_channel,
+        {decoded['device_type']} AS device_type,
+        {decoded['page_url']} AS page_url,
+        e.time_on_page, e.event_timestamp,
+        e.event_epoch, e.event_day_key, e.event_month_key
+    FROM raw_events_encoded e
+{joins}''')
+
+    # generic insert path (shard merges, ad-hoc loads); ChunkedWriter encodes in python instead
+    register = '\n'.join(
+        f'        INSERT OR IGNORE INTO {lookup} (value) SELECT NEW.{column} WHERE NEW.{column} IS NOT NULL;'
+        for column, lookup, _, _ in ENCODED_DIMS
+    )
+    code = {column: f'(SELECT code FROM {lookup} WHERE value = NEW.{column})'
+            for column, lookup, _, _ in ENCODED_DIMS}
+    c.execute(f'''CREATE TRIGGER IF NOT EXISTS raw_events_insert
+    INSTEAD OF INSERT ON raw_events
+    BEGIN
+{register}
+        INSERT INTO raw_events_encoded (customer_id, session_id, event_type_code, product_id,
+            channel_code, device_code, page_url_code, time_on_page, event_timestamp)
+        VALUES (NEW.customer_id, NEW.session_id, {code['event_type']}, NEW.product_id,
+            {code['attribution_channel']}, {code['device_type']}, {code['page_url']},
+            NEW.time_on_page, NEW.event_timestamp);
+    END''')
+
+
+def events_table(conn):
+    """Physical table behind raw_events — raw_events_encoded in encoded mode."""
+    encoded = conn.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'raw_events_encoded'"
+    ).fetchone()
+    return 'raw_events_encoded' if encoded else 'raw_events'
+
+
+class EventEncoder:
+    """
+    Loader-side dictionary encoding of raw_events rows: swaps the
+    low-cardinality strings for lookup codes, registering unseen values.
+    """
+
+    def __init__(self, conn):
+        self.conn = conn
+        self.codes = [dict(conn.execute(f'SELECT value, code FROM {lookup}'))
+                      for _, lookup, _, _ in ENCODED_DIMS]
+
+    def code(self, dim, value):
+        if value is None:
+            return None
+        codes = self.codes[dim]
+        if value not in codes:
+            lookup = ENCODED_DIMS[dim][1]
+            self.conn.execute(f'INSERT OR IGNORE INTO {lookup} (value) VALUES (?)', (value,))
+            codes[value] = self.conn.execute(f'SELECT code FROM {lookup} WHERE value = ?', (value,)).fetchone()[0]
+        return codes[value]
+
+    def encode(self, rows):
+        """raw_events value tuples (INSERT_EVENTS_SQL order) -> INSERT_ENCODED_EVENTS_SQL tuples."""
+        types, channels, devices, urls = self.codes
+        code = self.code
+        return [
+            (cid, sid,
+             types[etype] if etype in types else code(0, etype),
+             pid,
+             channels[channel] if channel in channels else code(1, channel),
+             devices[device] if device in devices else code(2, device),
+             urls[url] if url in urls else code(3, url),
+             time_on, ts)
+            for cid, sid, etype, pid, channel, device, url, time_on, ts in rows
+        ]
+
+
+# secondary indexes on the raw layer — built after a bulk load, not row by row
+RAW_INDEXES = {
+    'idx_raw_events_customer': ('raw_events', 'customer_id'),
+    'idx_raw_events_session': ('raw_events', 'session_id'),
+    'idx_raw_orders_customer': ('raw_orders', 'customer_id'),
+    'idx_raw_order_items_order': ('raw_order_items', 'order_id'),
+    'idx_raw_ab_assignments_test': ('raw_ab_assignments', 'test_id, customer_id'),
+}
+
+
+def create_indexes(conn):
+    events = events_table(conn)
+    for name, (table, columns) in RAW_INDEXES.items():
+        table = events if table == 'raw_events' else table
+        conn.execute(f'CREATE INDEX IF NOT EXISTS {name} ON {table} ({columns})')
+    conn.commit()
+
+
+@contextmanager
+def bulk_load(conn, cache_mb=256, defer_indexes=True):
+    """
+    Bulk-load profile for the raw layer. For the duration of the load:
+    WAL journaling, synchronous=OFF (no fsync per commit), a large page
+    cache, in-memory temp storage, FK checks off, and — with defer_indexes —
+    no secondary indexes, which are rebuilt in one pass afterwards.
+    On exit the connection gets its previous synchronous, cache, temp store
+    and foreign_keys settings back, and the WAL is checkpointed. WAL itself
+    is kept, so dashboards can keep reading while later loads write.
+    A load that fails is rolled back and its error raised as is, without
+    building the indexes; the next load that succeeds builds them.
+    """
+    settings = {name: conn.execute(f'PRAGMA {name}').fetchone()[0]
+                for name in ('synchronous', 'cache_size', 'temp_store', 'foreign_keys')}
+    if defer_indexes:
+        for name in RAW_INDEXES:
+            conn.execute(f'DROP INDEX IF EXISTS {name}')
+    conn.execute('PRAGMA journal_mode=WAL')
+    conn.execute('PRAGMA synchronous=OFF')
+    conn.execute(f'PRAGMA cache_size=-{cache_mb * 1024}')
+    conn.execute('PRAGMA temp_store=MEMORY')
+    conn.execute('PRAGMA foreign_keys=OFF')
+    try:
+        yield
+        conn.commit()
+        started = time.perf_counter()
+        create_indexes(conn)
+        if defer_indexes:
+            print(f"  Built {len(RAW_INDEXES)} raw indexes in {time.perf_counter() - started:.2f}s")
+    except BaseException:
+        conn.rollback()
+        raise
+    finally:
+        # foreign_keys can't change inside a transaction
+        for name, value in settings.items():
+            conn.execute(f'PRAGMA {name}={value}')
+        conn.execute('PRAGMA wal_checkpoint(TRUNCATE)')
+
+
+def load_products(c, start_date, rand=random):
+    """Insert the static product catalog."""
     for i, (name, cat, price, compare) in enumerate(PRODUCTS, 1):
         c.execute(
             'INSERT INTO raw_products VALUES (?, ?, ?, ?, ?, ?)',
             (i, name, cat, price, compare,
-             (start_date - timedelta(days=random.randint(0, 90))).isoformat())
+             (start_date - timedelta(days=rand.randint(0, 90))).isoformat())
         )
 
-    # --- Customers ---
-    customers = []
+
+class ChunkedWriter:
+    """
+    Buffers generated rows per raw table and writes each buffer with
+    executemany in fixed-size chunks as it fills, so memory stays flat no
+    matter how many customers we generate. chunk_size=None holds everything
+    until flush(), which is the old all-at-the-end behaviour.
+    """
+
+    def __init__(self, conn, chunk_size=None):
+        self.conn = conn
+        self.chunk_size = chunk_size
+        self.buffers = {table: [] for table in INSERT_SQL}
+        self.counts = {table: 0 for table in INSERT_SQL}
+        self.seconds = {table: 0.0 for table in INSERT_SQL}
+        self.encoder = EventEncoder(conn) if events_table(conn) == 'raw_events_encoded' else None
+
+    def add(self, table, row):
+        buf = self.buffers[table]
+        buf.append(row)
+        if self.chunk_size and len(buf) >= self.chunk_size:
+            self._write(table)
+
+    def extend(self, table, rows):
+        self.buffers[table].extend(rows)
+        if self.chunk_size and len(self.buffers[table]) >= self.chunk_size:
+            self._write(table)
+
+    def _write(self, table, final=False):
+        buf = self.buffers[table]
+        size = self.chunk_size or len(buf)
+        started = time.perf_counter()
+        while buf and (final or len(buf) >= size):
+            chunk = buf[:size]
+            if table == 'raw_events' and self.encoder:
+                self.conn.executemany(INSERT_ENCODED_EVENTS_SQL, self.encoder.encode(chunk))
+            else:
+                self.conn.executemany(INSERT_SQL[table], chunk)
+            self.counts[table] += len(chunk)
+            del buf[:size]
+        self.conn.commit()
+        self.seconds[table] += time.perf_counter() - started
+
+    def flush(self):
+        """Write out whatever is still buffered."""
+        for table in self.buffers:
+            self._write(table, final=True)
+
+    def stats(self):
+        """{table: (rows written, seconds spent writing)}"""
+        return {table: (self.counts[table], self.seconds[table]) for table in self.counts}
+
+
+def generate_data(conn, num_customers=200, chunk_size=None):
+    """
+    Generate fake but realistic ecommerce data for the warehouse.
+    With chunk_size set, rows are flushed to the raw tables every
+    chunk_size rows instead of being held until the end.
+    """
+    c = conn.cursor()
+    writer = ChunkedWriter(conn, chunk_size)
+    now = datetime.now()
+    start_date = now - timedelta(days=365)  # one year of data
+
+    # --- Products ---
+    load_products(c, start_date)
+
+    # --- Customers + Events + Orders ---
+    order_id = 0
+
     for i in range(1, num_customers + 1):
         days_ago = random.randint(1, 350)
         created = now - timedelta(days=days_ago)
@@ -186,24 +547,16 @@ def generate_data(conn, num_customers=200):
         # make email from name
         email = f"{fname.lower()}.{lname.lower()}{i}@example.com"
 
-        c.execute(
-            'INSERT INTO raw_customers VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)',
-            (i, email, fname, lname, channel,
-             created.isoformat(), last_active.isoformat(),
-             CITIES[city_idx], STATES[city_idx])
-        )
-        customers.append({
+        writer.add('raw_customers', (
+            i, email, fname, lname, channel,
+            created.isoformat(), last_active.isoformat(),
+            CITIES[city_idx], STATES[city_idx]
+        ))
+        cust = {
             'id': i, 'created': created, 'last_active': last_active,
             'channel': channel
-        })
-
-    # --- Events + Orders ---
-    order_id = 0
-    all_events = []
-    all_orders = []
-    all_items = []
+        }
 
-    for cust in customers:
         # each customer has 1-12 sessions
         num_sessions = random.randint(1, 12)
 
@@ -218,7 +571,7 @@ def generate_data(conn, num_customers=200):
             device = random.choice(DEVICES)
 
             # page view event
-            all_events.append((
+            writer.add('raw_events', (
                 cust['id'], session_id, 'page_view', None,
                 channel, device, '/', None, session_start.isoformat()
             ))
@@ -230,32 +583,32 @@ def generate_data(conn, num_customers=200):
             for j, pid in enumerate(viewed_products):
                 t = session_start + timedelta(seconds=30 * (j + 1))
                 time_on = random.randint(5, 180)
-                all_events.append((
+                writer.add('raw_events', (
                     cust['id'], session_id, 'product_view', pid,
                     channel, device, f'/product/{pid}', time_on, t.isoformat()
                 ))
 
             # add to cart — 35% chance per viewed product
-            carted = [p for p in viewed_products if random.random() < 0.35]
+            carted = [p for p in viewed_products if random.random() < CART_RATE]
             for pid in carted:
                 t = session_start + timedelta(seconds=random.randint(120, 300))
-                all_events.append((
+                writer.add('raw_events', (
                     cust['id'], session_id, 'add_to_cart', pid,
                     channel, device, f'/product/{pid}', None, t.isoformat()
                 ))
 
             # checkout flow
-            if carted and random.random() < 0.55:
+            if carted and random.random() < CHECKOUT_RATE:
                 t_start = session_start + timedelta(seconds=random.randint(300, 600))
-                all_events.append((
+                writer.add('raw_events', (
                     cust['id'], session_id, 'checkout_start', None,
                     channel, device, '/checkout', None, t_start.isoformat()
                 ))
 
                 # 25% abandon
-                if random.random() < 0.25:
+                if random.random() < ABANDON_RATE:
                     t_abandon = t_start + timedelta(seconds=random.randint(30, 300))
-                    all_events.append((
+                    writer.add('raw_events', (
                         cust['id'], session_id, 'checkout_abandon', None,
                         channel, device, '/checkout', None, t_abandon.isoformat()
                     ))
@@ -275,87 +628,39 @@ def generate_data(conn, num_customers=200):
                     tax = round(subtotal * 0.08, 2)
                     shipping = 0.0 if subtotal > 50 else 9.99
                     total = round(subtotal + tax + shipping, 2)
-                    status = random.choice(['delivered', 'delivered', 'delivered', 'shipped', 'processing', 'pending'])
+                    status = random.choice(STATUSES)
 
-                    all_events.append((
+                    writer.add('raw_events', (
                         cust['id'], session_id, 'checkout_complete', None,
                         channel, device, '/checkout/success', None, t_complete.isoformat()
                     ))
 
-                    all_orders.append((
+                    writer.add('raw_orders', (
                         order_id, cust['id'], round(subtotal, 2), tax, shipping, total,
                         status, random.choice(PAYMENT_METHODS), channel,
                         session_id, t_complete.isoformat(), t_complete.isoformat()
                     ))
-                    all_items.extend(items)
+                    writer.extend('raw_order_items', items)
 
-    # bulk insert everything
-    c.executemany(
-        'INSERT INTO raw_events (customer_id, session_id, event_type, product_id, '
-        'attribution_channel, device_type, page_url, time_on_page, event_timestamp) '
-        'VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)',
-        all_events
-    )
-
-    c.executemany(
-        'INSERT INTO raw_orders VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
-        all_orders
-    )
-
-    c.executemany(
-        'INSERT INTO raw_order_items (order_id, product_id, quantity, unit_price) '
-        'VALUES (?, ?, ?, ?)',
-        all_items
-    )
-
-    conn.commit()
+    writer.flush()
 
     # --- A/B Tests ---
-    # define a few realistic experiments
-    ab_tests = [
-        (1, 'Checkout Flow Redesign', 'Simplified single-page checkout vs multi-step',
-         'conversion_rate', (now - timedelta(days=90)).date().isoformat(),
-         (now - timedelta(days=30)).date().isoformat(), 'completed'),
-        (2, 'Homepage Hero Banner', 'Product carousel vs lifestyle image hero',
-         'conversion_rate', (now - timedelta(days=60)).date().isoformat(),
-         (now - timedelta(days=15)).date().isoformat(), 'completed'),
-        (3, 'Free Shipping Threshold', '$50 free shipping vs $35 free shipping threshold',
-         'avg_order_value', (now - timedelta(days=45)).date().isoformat(),
-         (now - timedelta(days=5)).date().isoformat(), 'completed'),
-        (4, 'Product Page Layout', 'Larger images with sticky add-to-cart vs standard layout',
-         'conversion_rate', (now - timedelta(days=20)).date().isoformat(),
-         None, 'running'),
-    ]
-
+    ab_tests = build_ab_tests(now)
     c.executemany(
         'INSERT INTO raw_ab_tests VALUES (?, ?, ?, ?, ?, ?, ?)',
         ab_tests
     )
 
     # assign customers to tests and simulate outcomes
-    ab_assignments = []
-    # build a lookup of which customers placed orders (for realistic conversion)
-    ordering_customers = set()
-    for order in all_orders:
-        ordering_customers.add(order[1])  # customer_id is index 1
-
     for test_id, name, desc, metric, start, end, status in ab_tests:
         test_start = datetime.fromisoformat(start)
         test_end = datetime.fromisoformat(end) if end else now
 
         # pick a random subset of customers for this test (60-80%)
         pool_size = int(num_customers * (0.6 + random.random() * 0.2))
-        pool = random.sample(range(1, num_customers + 1), pool_size)
-
-        # treatment effect — how much better the variant converts
-        if test_id == 1:
-            base_rate, lift = 0.12, 0.035   # checkout redesign: 12% -> ~15.5%
-        elif test_id == 2:
-            base_rate, lift = 0.08, 0.012   # hero banner: smaller effect
-        elif test_id == 3:
-            base_rate, lift = 0.15, 0.045   # free shipping: strong effect on AOV proxy
-        else:
-            base_rate, lift = 0.10, 0.018   # product page: moderate
+        pool = _selection_sample(num_customers, pool_size)
+
+        base_rate, lift = AB_TEST_EFFECTS[test_id]
 
         for cid in pool:
             variant = 'control' if random.random() < 0.5 else 'treatment'
@@ -378,28 +683,754 @@ def generate_data(conn, num_customers=200):
             else:
                 value = 0.0
 
-            ab_assignments.append((
+            writer.add('raw_ab_assignments', (
                 test_id, cid, variant,
                 assigned_at.isoformat(),
                 converted, round(value, 2)
             ))
 
-    c.executemany(
-        'INSERT INTO raw_ab_assignments (test_id, customer_id, variant, assigned_at, converted, conversion_value) '
-        'VALUES (?, ?, ?, ?, ?, ?)',
-        ab_assignments
-    )
+    writer.flush()
 
-    conn.commit()
+    counts = writer.counts
+    print_summary(num_customers, counts['raw_events'], counts['raw_orders'],
+                  counts['raw_order_items'], len(ab_tests), counts['raw_ab_assignments'])
+    return writer.stats()
+
+
+def _selection_sample(n, k):
+    """
+    Pick k of the ids 1..n uniformly without replacement, streaming them in
+    ascending order with O(1) memory (Knuth's selection sampling).
+    """
+    for cid in range(1, n + 1):
+        if k == 0:
+            return
+        if random.random() * (n - cid + 1) < k:
+            k -= 1
+            yield cid
+
+
+# --- Vectorized generator ---
+# same shapes and funnel probabilities as generate_data, but built with numpy
+# array ops over blocks of customers instead of per-row python loops
+
+# page_url lookup: '/', '/checkout', '/checkout/success', then one url per product
+PAGE_URLS = np.array(
+    ['/', '/checkout', '/checkout/success'] + [f'/product/{i}' for i in range(1, len(PRODUCTS) + 1)],
+    dtype=object
+)
+# page_url index for the non-product event types, by event type code
+_TYPE_URL = np.array([0, 0, 0, 1, 1, 2])
+_PRICES = np.array([p[2] for p in PRODUCTS])
+
+
+def _seconds(values):
+    """Whole seconds -> numpy microsecond timedeltas."""
+    return (np.asarray(values, dtype=np.int64) * 1_000_000).astype('timedelta64[us]')
+
+
+def _concat_str(*parts):
+    """Element-wise string concatenation of scalars and arrays."""
+    out = np.asarray(parts[0]).astype(str)
+    for part in parts[1:]:
+        out = np.char.add(out, np.asarray(part).astype(str))
+    return out
+
+
+def _vectorized_customers(rng, ids, now64):
+    """Customer attributes for an array of customer ids."""
+    n = len(ids)
+    days_ago = rng.integers(1, 351, n)
+    created = now64 - days_ago.astype('timedelta64[D]')
+    last_active = created + rng.integers(0, days_ago + 1).astype('timedelta64[D]')
+    return {
+        'id': ids,
+        'created': created,
+        'last_active': last_active,
+        'channel': rng.integers(0, len(CHANNELS), n),
+        'city': rng.integers(0, len(CITIES), n),
+        'first_name': rng.integers(0, len(FIRST_NAMES), n),
+        'last_name': rng.integers(0, len(LAST_NAMES), n),
+    }
+
+
+def _customer_rows(cust):
+    created = np.datetime_as_string(cust['created'], unit='us').tolist()
+    last_active = np.datetime_as_string(cust['last_active'], unit='us').tolist()
+    rows = []
+    for k, cid in enumerate(cust['id'].tolist()):
+        fname = FIRST_NAMES[cust['first_name'][k]]
+        lname = LAST_NAMES[cust['last_name'][k]]
+        city = cust['city'][k]
+        rows.append((
+            cid, f"{fname.lower()}.{lname.lower()}{cid}@example.com", fname, lname,
+            CHANNELS[cust['channel'][k]], created[k], last_active[k],
+            CITIES[city], STATES[city]
+        ))
+    return rows
+
+
+def _vectorized_activity(rng, cust, now64, utc_offset, first_order_id, n_sessions=None):
+    """
+    Sessions, events, orders and line items for a block of customers.
+    Sessions start between each customer's `created` and now64; n_sessions
+    overrides the default 1-12 per customer.
+    Returns (events, orders, items) as dicts of column arrays.
+    """
+    n = len(cust['id'])
+
+    # --- Sessions: 1-12 per customer, somewhere between signup and now ---
+    if n_sessions is None:
+        n_sessions = rng.integers(1, 13, n)
+    s_cust = np.repeat(np.arange(n), n_sessions)
+    num_sessions = len(s_cust)
+    s_num = np.arange(num_sessions) - np.repeat(np.cumsum(n_sessions) - n_sessions, n_sessions)
+    created = cust['created'][s_cust]
+    span = (now64 - created).astype(np.int64)
+    s_start = created + (rng.random(num_sessions) * span).astype(np.int64).astype('timedelta64[us]')
+
+    # int(session_start.timestamp()) — naive datetimes are local time
+    epoch = (s_start - np.datetime64(0, 'us')).astype('timedelta64[s]').astype(np.int64) - utc_offset
+    s_id = _concat_str('s_', cust['id'][s_cust], '_', s_num, '_', epoch)
+
+    # 60% chance they use their original channel, 40% random
+    own = rng.random(num_sessions) < 0.6
+    s_channel = np.where(own, cust['channel'][s_cust], rng.integers(0, len(CHANNELS), num_sessions))
+    s_device = rng.integers(0, len(DEVICES), num_sessions)
+
+    # --- Product views: 1-6 distinct products per session ---
+    num_views = rng.integers(1, 7, num_sessions)
+    picks = np.argsort(rng.random((num_sessions, len(PRODUCTS)), dtype=np.float32), axis=1)[:, :6]
+    v_sess = np.repeat(np.arange(num_sessions), num_views)
+    v_pos = np.arange(len(v_sess)) - np.repeat(np.cumsum(num_views) - num_views, num_views)
+    v_pid = picks[v_sess, v_pos] + 1
+    v_ts = s_start[v_sess] + _seconds(30 * (v_pos + 1))
+    v_time_on = rng.integers(5, 181, len(v_sess))
 
+    # --- Add to cart, checkout, abandon: bernoulli draws over whole arrays ---
+    carted = rng.random(len(v_sess)) < CART_RATE
+    c_sess = v_sess[carted]
+    c_pid = v_pid[carted]
+    c_ts = s_start[c_sess] + _seconds(rng.integers(120, 301, len(c_sess)))
+
+    has_cart = np.bincount(c_sess, minlength=num_sessions) > 0
+    checkout = has_cart & (rng.random(num_sessions) < CHECKOUT_RATE)
+    abandon = checkout & (rng.random(num_sessions) < ABANDON_RATE)
+    complete = checkout & ~abandon
+
+    k_sess = np.flatnonzero(checkout)
+    k_ts = s_start[k_sess] + _seconds(rng.integers(300, 601, len(k_sess)))
+    a_sess = np.flatnonzero(abandon)
+    a_ts = k_ts[abandon[k_sess]] + _seconds(rng.integers(30, 301, len(a_sess)))
+    o_sess = np.flatnonzero(complete)
+    o_ts = k_ts[complete[k_sess]] + _seconds(rng.integers(60, 601, len(o_sess)))
+
+    # --- Orders + line items ---
+    num_orders = len(o_sess)
+    order_idx = np.full(num_sessions, -1)
+    order_idx[o_sess] = np.arange(num_orders)
+    order_ids = first_order_id + np.arange(num_orders)
+
+    in_order = complete[c_sess]
+    i_order = order_idx[c_sess[in_order]]
+    i_pid = c_pid[in_order]
+    i_qty = rng.integers(1, 4, len(i_pid))
+    i_price = _PRICES[i_pid - 1]
+
+    subtotal = np.bincount(i_order, weights=i_price * i_qty, minlength=num_orders)
+    tax = np.round(subtotal * 0.08, 2)
+    shipping = np.where(subtotal > 50, 0.0, 9.99)
+    orders = {
+        'order_id': order_ids,
+        'customer_id': cust['id'][s_cust[o_sess]],
+        'subtotal': np.round(subtotal, 2),
+        'tax': tax,
+        'shipping': shipping,
+        'total': np.round(subtotal + tax + shipping, 2),
+        'status': rng.integers(0, len(STATUSES), num_orders),
+        'payment_method': rng.integers(0, len(PAYMENT_METHODS), num_orders),
+        'channel': s_channel[o_sess],
+        'session_id': s_id[o_sess],
+        'created_at': o_ts,
+    }
+    items = {
+        'order_id': order_ids[i_order],
+        'product_id': i_pid,
+        'quantity': i_qty,
+        'unit_price': i_price,
+    }
+
+    # --- Events: stable sort by session keeps page_view -> views -> carts -> checkout ---
+    e_sess = np.concatenate([np.arange(num_sessions), v_sess, c_sess, k_sess, a_sess, o_sess])
+    e_type = np.repeat(np.arange(len(EVENT_TYPES)),
+                       [num_sessions, len(v_sess), len(c_sess), len(k_sess), len(a_sess), num_orders])
+    e_pid = np.concatenate([np.zeros(num_sessions, dtype=np.int64), v_pid, c_pid,
+                            np.zeros(len(k_sess) + len(a_sess) + num_orders, dtype=np.int64)])
+    e_time_on = np.concatenate([np.full(num_sessions, -1), v_time_on,
+                                np.full(len(e_sess) - num_sessions - len(v_sess), -1)])
+    e_ts = np.concatenate([s_start, v_ts, c_ts, k_ts, a_ts, o_ts])
+
+    order = np.argsort(e_sess, kind='stable')
+    e_sess = e_sess[order]
+    e_type = e_type[order]
+    e_pid = e_pid[order]
+    events = {
+        'customer_id': cust['id'][s_cust[e_sess]],
+        'session_id': s_id[e_sess],
+        'event_type': e_type,
+        'product_id': e_pid,
+        'channel': s_channel[e_sess],
+        'device': s_device[e_sess],
+        'page_url': np.where(e_pid > 0, e_pid + 2, _TYPE_URL[e_type]),
+        'time_on_page': e_time_on[order],
+        'event_timestamp': e_ts[order],
+    }
+    return events, orders, items
+
+
+def _nullable(values, null_mask):
+    out = values.astype(object)
+    out[null_mask] = None
+    return out.tolist()
+
+
+def _event_rows(ev):
+    return list(zip(
+        ev['customer_id'].tolist(),
+        ev['session_id'].tolist(),
+        np.array(EVENT_TYPES, dtype=object)[ev['event_type']].tolist(),
+        _nullable(ev['product_id'], ev['product_id'] == 0),
+        np.array(CHANNELS, dtype=object)[ev['channel']].tolist(),
+        np.array(DEVICES, dtype=object)[ev['device']].tolist(),
+        PAGE_URLS[ev['page_url']].tolist(),
+        _nullable(ev['time_on_page'], ev['time_on_page'] < 0),
+        np.datetime_as_string(ev['event_timestamp'], unit='us').tolist(),
+    ))
+
+
+def _order_rows(orders):
+    created = np.datetime_as_string(orders['created_at'], unit='us').tolist()
+    return list(zip(
+        orders['order_id'].tolist(),
+        orders['customer_id'].tolist(),
+        orders['subtotal'].tolist(),
+        orders['tax'].tolist(),
+        orders['shipping'].tolist(),
+        orders['total'].tolist(),
+        np.array(STATUSES, dtype=object)[orders['status']].tolist(),
+        np.array(PAYMENT_METHODS, dtype=object)[orders['payment_method']].tolist(),
+        np.array(CHANNELS, dtype=object)[orders['channel']].tolist(),
+        orders['session_id'].tolist(),
+        created,
+        created,
+    ))
+
+
+def _item_rows(items):
+    return list(zip(
+        items['order_id'].tolist(),
+        items['product_id'].tolist(),
+        items['quantity'].tolist(),
+        items['unit_price'].tolist(),
+    ))
+
+
+def _vectorized_assignments(rng, num_customers, ab_tests, now, block_size):
+    """
+    A/B test pools, variants and outcomes — same logic as generate_data.
+    Yields rows one block of customer ids at a time; the pool is split across
+    blocks with hypergeometric draws so it never needs all ids in memory.
+    """
+    now64 = np.datetime64(now, 'us')
+    for test_id, name, desc, metric, start, end, status in ab_tests:
+        test_start = np.datetime64(start, 'us')
+        test_end = np.datetime64(end, 'us') if end else now64
+        span = (test_end - test_start).astype(np.int64)
+        base_rate, lift = AB_TEST_EFFECTS[test_id]
+
+        # pick a random subset of customers for this test (60-80%)
+        remaining = int(num_customers * (0.6 + rng.random() * 0.2))
+
+        for first_id in range(1, num_customers + 1, block_size):
+            block = min(block_size, num_customers + 1 - first_id)
+            rest = num_customers + 1 - first_id - block
+            take = rng.hypergeometric(block, rest, remaining) if rest else remaining
+            remaining -= take
+            pool = rng.choice(block, take, replace=False) + first_id
+
+            treatment = rng.random(take) >= 0.5
+            assigned_at = test_start + (rng.random(take) * span).astype(np.int64).astype('timedelta64[us]')
+
+            conv_rate = np.where(treatment, base_rate + lift, base_rate)
+            converted = rng.random(take) < conv_rate
+            if metric == 'avg_order_value':
+                value = (60 + rng.random(take) * 80) * np.where(treatment, 1.12, 1.0)
+            else:
+                value = 40 + rng.random(take) * 120
+            value = np.where(converted, np.round(value, 2), 0.0)
+
+            yield list(zip(
+                [test_id] * take,
+                pool.tolist(),
+                np.where(treatment, 'treatment', 'control').tolist(),
+                np.datetime_as_string(assigned_at, unit='us').tolist(),
+                converted.astype(int).tolist(),
+                value.tolist(),
+            ))
+
+
+# rough events per customer (~6.5 sessions x ~6.5 events), used to size
+# customer blocks so one block produces about chunk_size event rows
+EVENTS_PER_CUSTOMER = 42
+
+
+def _utc_offset(now):
+    """Seconds to add to a naive-as-UTC epoch to get datetime.timestamp()."""
+    return round((now - datetime(1970, 1, 1)).total_seconds() - now.timestamp())
+
+
+def _generate_customer_range(writer, rng, first_id, last_id, now, block_size):
+    """Vectorized customers, events, orders and items for ids first_id..last_id."""
+    now64 = np.datetime64(now, 'us')
+    utc_offset = _utc_offset(now)
+
+    for block_start in range(first_id, last_id + 1, block_size):
+        ids = np.arange(block_start, min(block_start + block_size, last_id + 1))
+        cust = _vectorized_customers(rng, ids, now64)
+        first_order_id = writer.counts['raw_orders'] + len(writer.buffers['raw_orders']) + 1
+        events, orders, items = _vectorized_activity(rng, cust, now64, utc_offset, first_order_id)
+
+        writer.extend('raw_customers', _customer_rows(cust))
+        writer.extend('raw_events', _event_rows(events))
+        writer.extend('raw_orders', _order_rows(orders))
+        writer.extend('raw_order_items', _item_rows(items))
+    writer.flush()
+
+
+def _block_size(chunk_size):
+    return max(1, chunk_size // EVENTS_PER_CUSTOMER) if chunk_size else 50_000
+
+
+def generate_data_vectorized(conn, num_customers=200, seed=None, chunk_size=None, as_of=None):
+    """
+    Vectorized version of generate_data — same tables, event/order shapes and
+    funnel probabilities, generated with numpy over blocks of customers.
+    """
+    c = conn.cursor()
+    writer = ChunkedWriter(conn, chunk_size)
+    block_size = _block_size(chunk_size)
+    rng = np.random.default_rng(seed)
+    now = as_of or datetime.now()
+    start_date = now - timedelta(days=365)
+
+    load_products(c, start_date)
+    _generate_customer_range(writer, rng, 1, num_customers, now, block_size)
+
+    ab_tests = build_ab_tests(now)
+    c.executemany('INSERT INTO raw_ab_tests VALUES (?, ?, ?, ?, ?, ?, ?)', ab_tests)
+    for rows in _vectorized_assignments(rng, num_customers, ab_tests, now, block_size):
+        writer.extend('raw_ab_assignments', rows)
+    writer.flush()
+
+    counts = writer.counts
+    print_summary(num_customers, counts['raw_events'], counts['raw_orders'],
+                  counts['raw_order_items'], len(ab_tests), counts['raw_ab_assignments'])
+    return writer.stats()
+
+
+# --- Sharded generator ---
+# splits the customer id range across a process pool; every worker writes its
+# own shard database which the parent merges into the warehouse in shard order
+
+def _shard_path(shard_dir, shard_id):
+    return os.path.join(shard_dir, f'warehouse.shard{shard_id}.db')
+
+
+def _generate_shard(args):
+    """Worker: generate one contiguous customer range into a shard-local db."""
+    path, shard_seed, first_id, last_id, now, chunk_size = args
+    if os.path.exists(path):
+        os.remove(path)
+    conn = sqlite3.connect(path)
+    create_tables(conn)
+    writer = ChunkedWriter(conn, chunk_size)
+    rng = np.random.default_rng(shard_seed)
+    _generate_customer_range(writer, rng, first_id, last_id, now, _block_size(chunk_size))
+    conn.close()
+    return path
+
+
+def merge_events_sql(c, encoder, source='shard.raw_events'):
+    """
+    INSERT ... SELECT that copies `source` (raw_events columns, event_id
+    giving the order) into raw_events. In encoded mode it goes straight
+    into raw_events_encoded, codes looked up in one join per dimension,
+    instead of through the view's trigger row by row; the encoder
+    registers the source's unseen values first.
+    """
+    columns = ('customer_id, session_id, event_type, product_id, attribution_channel, '
+               'device_type, page_url, time_on_page, event_timestamp')
+    if not encoder:
+        return (f'INSERT INTO raw_events ({columns}) '
+                f'SELECT {columns} FROM {source} ORDER BY event_id')
+    for dim, (column, _, _, _) in enumerate(ENCODED_DIMS):
+        for (value,) in c.execute(f'SELECT DISTINCT {column} FROM {source}').fetchall():
+            encoder.code(dim, value)
+    code = {column: f'{lookup}.code' for column, lookup, _, _ in ENCODED_DIMS}
+    joins = ' '.join(f'LEFT JOIN {lookup} ON {lookup}.value = e.{column}'
+                     for column, lookup, _, _ in ENCODED_DIMS)
+    return ('INSERT INTO raw_events_encoded (customer_id, session_id, event_type_code, product_id, '
+            'channel_code, device_code, page_url_code, time_on_page, event_timestamp) '
+            f"SELECT e.customer_id, e.session_id, {code['event_type']}, e.product_id, "
+            f"{code['attribution_channel']}, {code['device_type']}, {code['page_url']}, "
+            f'e.time_on_page, e.event_timestamp FROM {source} e {joins} ORDER BY e.event_id')
+
+
+def generate_data_sharded(conn, num_customers=200, num_shards=4, seed=0, chunk_size=None,
+                          as_of=None, workers=None, shard_dir=None):
+    """
+    Generate the warehouse across num_shards worker processes.
+
+    Each shard gets a contiguous range of customer ids and its own RNG stream
+    spawned from `seed`, so the output is bit-identical for a given seed,
+    shard count and as_of (which defaults to midnight today — pass it
+    explicitly to compare runs across days). Shard-local order ids are
+    offset during the merge to stay globally unique, and A/B assignments
+    are drawn once in the parent over the full customer range.
+    """
+    from concurrent.futures import ProcessPoolExecutor
+
+    c = conn.cursor()
+    now = as_of or datetime.combine(datetime.now().date(), datetime.min.time())
+    shard_dir = shard_dir or os.path.dirname(DB_PATH)
+    ab_seed, *shard_seeds = np.random.SeedSequence(seed).spawn(num_shards + 1)
+
+    load_products(c, now - timedelta(days=365), rand=random.Random(seed))
+
+    bounds = np.linspace(0, num_customers, num_shards + 1).astype(int)
+    jobs = [
+        (_shard_path(shard_dir, k), shard_seeds[k], int(bounds[k]) + 1, int(bounds[k + 1]), now, chunk_size)
+        for k in range(num_shards)
+    ]
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        shard_paths = list(pool.map(_generate_shard, jobs))
+
+    # merge in shard order — event_id and order_id come out deterministic
+    order_offset = 0
+    merge_stats = {table: (0, 0.0) for table in INSERT_SQL}
+
+    encoder = EventEncoder(conn) if events_table(conn) == 'raw_events_encoded' else None
+
+    def timed(table, sql, params=()):
+        # rows counted at the source: rowcount is 0 through an INSTEAD OF trigger
+        started = time.perf_counter()
+        c.execute(sql, params)
+        rows = c.execute(f'SELECT COUNT(*) FROM shard.{table}').fetchone()[0]
+        count, seconds = merge_stats[table]
+        merge_stats[table] = (count + rows, seconds + time.perf_counter() - started)
+
+    for path in shard_paths:
+        c.execute('ATTACH DATABASE ? AS shard', (path,))
+        timed(
+            'raw_customers',
+            'INSERT INTO raw_customers SELECT customer_id, email, first_name, last_name, '
+            'acquisition_channel, created_at, last_active_at, city, state FROM shard.raw_customers'
+        )
+        timed('raw_events', merge_events_sql(c, encoder))
+        timed(
+            'raw_orders',
+            'INSERT INTO raw_orders SELECT order_id + ?, customer_id, subtotal, tax, shipping, total, '
+            'status, payment_method, attribution_channel, session_id, created_at, completed_at '
+            'FROM shard.raw_orders ORDER BY order_id',
+            (order_offset,)
+        )
+        timed(
+            'raw_order_items',
+            'INSERT INTO raw_order_items (order_id, product_id, quantity, unit_price) '
+            'SELECT order_id + ?, product_id, quantity, unit_price FROM shard.raw_order_items ORDER BY item_id',
+            (order_offset,)
+        )
+        order_offset += c.execute('SELECT COUNT(*) FROM shard.raw_orders').fetchone()[0]
+        conn.commit()
+        c.execute('DETACH DATABASE shard')
+        os.remove(path)
+
+    writer = ChunkedWriter(conn, chunk_size)
+    ab_tests = build_ab_tests(now)
+    c.executemany('INSERT INTO raw_ab_tests VALUES (?, ?, ?, ?, ?, ?, ?)', ab_tests)
+    rng = np.random.default_rng(ab_seed)
+    for rows in _vectorized_assignments(rng, num_customers, ab_tests, now, _block_size(chunk_size)):
+        writer.extend('raw_ab_assignments', rows)
+    writer.flush()
+
+    merge_stats['raw_ab_assignments'] = writer.stats()['raw_ab_assignments']
+    print_summary(num_customers, merge_stats['raw_events'][0], order_offset,
+                  merge_stats['raw_order_items'][0], len(ab_tests), writer.counts['raw_ab_assignments'])
+    return merge_stats
+
+
+def build_ab_tests(now):
+    """Define a few realistic experiments relative to `now`."""
+    return [
+        (1, 'Checkout Flow Redesign', 'Simplified single-page checkout vs multi-step',
+         'conversion_rate', (now - timedelta(days=90)).date().isoformat(),
+         (now - timedelta(days=30)).date().isoformat(), 'completed'),
+        (2, 'Homepage Hero Banner', 'Product carousel vs lifestyle image hero',
+         'conversion_rate', (now - timedelta(days=60)).date().isoformat(),
+         (now - timedelta(days=15)).date().isoformat(), 'completed'),
+        (3, 'Free Shipping Threshold', '$50 free shipping vs $35 free shipping threshold',
+         'avg_order_value', (now - timedelta(days=45)).date().isoformat(),
+         (now - timedelta(days=5)).date().isoformat(), 'completed'),
+        (4, 'Product Page Layout', 'Larger images with sticky add-to-cart vs standard layout',
+         'conversion_rate', (now - timedelta(days=20)).date().isoformat(),
+         None, 'running'),
+    ]
+
+
+def print_load_rates(stats):
+    """rows/sec per raw table from a {table: (rows, seconds)} dict."""
+    for table, (rows, seconds) in stats.items():
+        if rows:
+            rate = rows / seconds if seconds else float('inf')
+            print(f"  {table:<20} {rows:>10} rows  {seconds:7.2f}s  {rate:>12,.0f} rows/sec")
+
+
+def print_summary(num_customers, num_events, num_orders, num_items, num_tests, num_assignments):
     print(f"Loaded {num_customers} customers")
     print(f"Loaded {len(PRODUCTS)} products")
-    print(f"Loaded {len(all_events)} behavior events")
-    print(f"Loaded {len(all_orders)} orders with {len(all_items)} line items")
-    print(f"Loaded {len(ab_tests)} A/B tests with {len(ab_assignments)} assignments")
+    print(f"Loaded {num_events} behavior events")
+    print(f"Loaded {num_orders} orders with {num_items} line items")
+    print(f"Loaded {num_tests} A/B tests with {num_assignments} assignments")
+
+
+# --- Incremental loads ---
+# append only the activity after the last load instead of rebuilding the
+# warehouse. etl_load_state keeps a high-water mark per raw table; a run loads
+# the window (mark, window_end] and moves every mark to at least window_end,
+# so re-running the same window is a no-op. Marks are compared as instants:
+# the raw layer has timestamps with and without microseconds, and platform
+# ones with a 'Z', whose text doesn't sort in time order.
+
+# timestamp column each incrementally loaded table is tracked on
+HIGH_WATER_COLUMNS = {
+    'raw_customers': 'created_at',
+    'raw_events': 'event_timestamp',
+    'raw_orders': 'created_at',
+    'raw_ab_assignments': 'assigned_at',
+}
+
+# the full generator spreads ~6.5 sessions over a customer's ~175 days of history
+SESSIONS_PER_CUSTOMER_DAY = 6.5 / 175
+
+
+def create_load_state(conn):
+    conn.execute('''CREATE TABLE IF NOT EXISTS etl_load_state (
+        table_name TEXT PRIMARY KEY,
+        high_water_mark TEXT,
+        loaded_at TEXT
+    )''')
+    conn.commit()
+
+
+def _parse_timestamp(text):
+    """A raw ISO timestamp as a naive datetime; one with a zone is converted to UTC, as the epoch columns do."""
+    ts = datetime.fromisoformat(text)
+    return ts.astimezone(timezone.utc).replace(tzinfo=None) if ts.tzinfo else ts
+
+
+def _newest(conn, table, col):
+    """Newest timestamp in a table's column, as a datetime, or None for an empty table."""
+    row = conn.execute(
+        f'SELECT {col} FROM {table} WHERE {col} IS NOT NULL ORDER BY julianday({col}) DESC, {col} DESC LIMIT 1'
+    ).fetchone()
+    return _parse_timestamp(row[0]) if row else None
 
 
-def main():
+def _stored_marks(conn):
+    create_load_state(conn)
+    return {table: _parse_timestamp(mark)
+            for table, mark in conn.execute('SELECT table_name, high_water_mark FROM etl_load_state')
+            if mark is not None}
+
+
+def get_high_water_marks(conn):
+    """Per-table high-water marks as datetimes, bootstrapped from the data for older warehouses."""
+    marks = _stored_marks(conn)
+    for table, col in HIGH_WATER_COLUMNS.items():
+        if marks.get(table) is None:
+            marks[table] = _newest(conn, table, col)
+    return marks
+
+
+def set_high_water_marks(conn, window_end):
+    """Advance every mark to max(window_end, newest loaded timestamp)."""
+    marks = _stored_marks(conn)
+    loaded_at = datetime.now().isoformat()
+    for table, col in HIGH_WATER_COLUMNS.items():
+        mark = max(m for m in (marks.get(table), _newest(conn, table, col), window_end) if m is not None)
+        conn.execute(
+            '''INSERT INTO etl_load_state (table_name, high_water_mark, loaded_at) VALUES (?, ?, ?)
+            ON CONFLICT (table_name) DO UPDATE SET
+                high_water_mark = excluded.high_water_mark,
+                loaded_at = excluded.loaded_at''',
+            (table, mark.isoformat(timespec='microseconds'), loaded_at)
+        )
+    conn.commit()
+
+
+def _channel_codes(conn, ids):
+    """acquisition_channel codes for existing customer ids, in ids order."""
+    lookup = {}
+    for k in range(0, len(ids), 500):
+        batch = ids[k:k + 500].tolist()
+        marks = ', '.join('?' * len(batch))
+        lookup.update(conn.execute(
+            f'SELECT customer_id, acquisition_channel FROM raw_customers WHERE customer_id IN ({marks})',
+            batch
+        ))
+    codes = {channel: i for i, channel in enumerate(CHANNELS)}
+    # platform ingest brings channels the generator doesn't know, and ids
+    # with no customer row: their sessions come in as direct, as untagged
+    # platform traffic does
+    direct = codes['direct']
+    return np.array([codes.get(lookup.get(cid), direct) for cid in ids.tolist()], dtype=np.int64)
+
+
+def _clip_to_window(events, orders, items, end64, first_order_id):
+    """
+    Drop the events and orders of a block that fall after end64: a session
+    still going at the end of the window is loaded as far as it got. The
+    orders left are renumbered from first_order_id, so ids stay contiguous.
+    """
+    events = {k: v[events['event_timestamp'] <= end64] for k, v in events.items()}
+    placed = orders['created_at'] <= end64
+    new_id = first_order_id + np.cumsum(placed) - 1
+    orders = {k: v[placed] for k, v in orders.items()}
+    orders['order_id'] = first_order_id + np.arange(len(orders['order_id']))
+    index = items['order_id'] - first_order_id
+    items = {k: v[placed[index]] for k, v in items.items()}
+    items['order_id'] = new_id[index[placed[index]]]
+    return events, orders, items
+
+
+def load_incremental(conn, window_end=None, seed=None, new_customers_per_day=None, chunk_size=None):
+    """
+    Append customers, events, orders and A/B assignments for the window since
+    the last load. Cost scales with the window, not with the history: new
+    sessions are sampled for a Poisson-sized set of existing customers and
+    only those customers are looked up.
+    """
+    c = conn.cursor()
+    writer = ChunkedWriter(conn, chunk_size)
+    rng = np.random.default_rng(seed)
+    window_end = window_end or datetime.now()
+
+    marks = get_high_water_marks(conn)
+    if marks['raw_events'] is None:
+        raise RuntimeError('warehouse has no events yet — run a full load first')
+    window_start = marks['raw_events']
+    if window_end <= window_start:
+        print(f"Nothing to load: warehouse is current through {window_start.isoformat()}")
+        return
+
+    days = (window_end - window_start).total_seconds() / 86400
+    start64 = np.datetime64(window_start, 'us')
+    end64 = np.datetime64(window_end, 'us')
+    span = (end64 - start64).astype(np.int64)
+    utc_offset = _utc_offset(window_end)
+
+    max_customer = c.execute('SELECT COALESCE(MAX(customer_id), 0) FROM raw_customers').fetchone()[0]
+    next_order_id = c.execute('SELECT COALESCE(MAX(order_id), 0) FROM raw_orders').fetchone()[0] + 1
+    if new_customers_per_day is None:
+        new_customers_per_day = max_customer / 350
+
+    # --- Existing customers: sessions land uniformly in the window ---
+    num_sessions = rng.poisson(SESSIONS_PER_CUSTOMER_DAY * max_customer * days)
+    active, n_sessions = np.unique(rng.integers(1, max_customer + 1, num_sessions), return_counts=True)
+    returning = {
+        'id': active,
+        'created': np.full(len(active), start64),
+        'channel': _channel_codes(conn, active),
+    }
+
+    # --- New customers: signed up inside the window ---
+    num_new = rng.poisson(new_customers_per_day * days)
+    new_ids = np.arange(max_customer + 1, max_customer + 1 + num_new)
+    new = _vectorized_customers(rng, new_ids, end64)
+    new['created'] = start64 + (rng.random(num_new) * span).astype(np.int64).astype('timedelta64[us]')
+    new['last_active'] = new['created'] + (
+        rng.random(num_new) * (end64 - new['created']).astype(np.int64)
+    ).astype(np.int64).astype('timedelta64[us]')
+    remaining_days = (end64 - new['created']).astype(np.int64) / 86_400_000_000
+    new_sessions = np.maximum(1, rng.poisson(SESSIONS_PER_CUSTOMER_DAY * remaining_days))
+    writer.extend('raw_customers', _customer_rows(new))
+
+    for cust, counts in ((returning, n_sessions), (new, new_sessions)):
+        first_order_id = next_order_id + writer.counts['raw_orders'] + len(writer.buffers['raw_orders'])
+        events, orders, items = _clip_to_window(*_vectorized_activity(
+            rng, cust, end64, utc_offset, first_order_id, n_sessions=counts
+        ), end64, first_order_id)
+        writer.extend('raw_events', _event_rows(events))
+        writer.extend('raw_orders', _order_rows(orders))
+        writer.extend('raw_order_items', _item_rows(items))
+
+    # --- A/B: new customers join tests that overlap the window (60-80%) ---
+    for test_id, test_name, metric, start, end in c.execute(
+        'SELECT test_id, test_name, metric, start_date, end_date FROM raw_ab_tests ORDER BY test_id'
+    ).fetchall():
+        test_start = max(np.datetime64(start, 'us'), start64)
+        test_end = min(np.datetime64(end, 'us'), end64) if end else end64
+        eligible = new_ids[(new['created'] < test_end)] if test_end > test_start else new_ids[:0]
+        joins = eligible[rng.random(len(eligible)) < 0.6 + rng.random() * 0.2]
+        if not len(joins):
+            continue
+
+        base_rate, lift = AB_TEST_EFFECTS.get(test_id, (0.10, 0.0))
+        take = len(joins)
+        treatment = rng.random(take) >= 0.5
+        assigned_at = test_start + (
+            rng.random(take) * (test_end - test_start).astype(np.int64)
+        ).astype(np.int64).astype('timedelta64[us]')
+        converted = rng.random(take) < np.where(treatment, base_rate + lift, base_rate)
+        if metric == 'avg_order_value':
+            value = (60 + rng.random(take) * 80) * np.where(treatment, 1.12, 1.0)
+        else:
+            value = 40 + rng.random(take) * 120
+        value = np.where(converted, np.round(value, 2), 0.0)
+        writer.extend('raw_ab_assignments', list(zip(
+            [test_id] * take,
+            joins.tolist(),
+            np.where(treatment, 'treatment', 'control').tolist(),
+            np.datetime_as_string(assigned_at, unit='us').tolist(),
+            converted.astype(int).tolist(),
+            value.tolist(),
+        )))
+
+    writer.flush()
+    set_high_water_marks(conn, window_end)
+
+    counts = writer.counts
+    print(f"Loaded window {window_start.isoformat()} -> {window_end.isoformat()}")
+    print(f"  +{counts['raw_customers']} customers, +{counts['raw_events']} events, "
+          f"+{counts['raw_orders']} orders ({counts['raw_order_items']} items), "
+          f"+{counts['raw_ab_assignments']} A/B assignments")
+    return writer.stats()
+
+
+def main(num_customers=200, vectorized=False, seed=None, chunk_size=None, shards=None,
+         incremental=False, encoded=False):
+    if incremental and os.path.exists(DB_PATH):
+        # append the new window, keep serving the existing warehouse
+        conn = sqlite3.connect(DB_PATH)
+        create_tables(conn)
+        print("Loading new data since last run...")
+        with bulk_load(conn, defer_indexes=False):
+            stats = load_incremental(conn, seed=seed, chunk_size=chunk_size)
+        if stats:
+            print_load_rates(stats)
+        conn.close()
+        return
+
     # wipe and rebuild
     if os.path.exists(DB_PATH):
         os.remove(DB_PATH)
@@ -408,14 +1439,57 @@ def main():
     conn = sqlite3.connect(DB_PATH)
 
     print("Creating raw tables...")
-    create_tables(conn)
+    create_tables(conn, encoded=encoded)
 
     print("Generating ecommerce data...")
-    generate_data(conn, num_customers=200)
+    with bulk_load(conn):
+        if shards:
+            stats = generate_data_sharded(conn, num_customers=num_customers, num_shards=shards,
+                                          seed=seed or 0, chunk_size=chunk_size)
+        elif vectorized:
+            stats = generate_data_vectorized(conn, num_customers=num_customers, seed=seed,
+                                             chunk_size=chunk_size)
+        else:
+            stats = generate_data(conn, num_customers=num_customers, chunk_size=chunk_size)
+        set_high_water_marks(conn, datetime.now())
+    print_load_rates(stats)
 
     conn.close()
     print(f"\nWarehouse ready: {DB_PATH}")
 
 
+def add_load_arguments(parser):
+    """main()'s options as command-line flags, on an argparse parser (run_pipeline.py shares them)."""
+    parser.add_argument('--customers', type=int, default=200,
+                        help='customers to generate in a full load (default: 200)')
+    parser.add_argument('--vectorized', action='store_true',
+                        help='generate with the numpy generator instead of row by row')
+    parser.add_argument('--shards', type=int, metavar='N',
+                        help='generate in N processes, each with its own seed (vectorized)')
+    parser.add_argument('--seed', type=int,
+                        help='random seed for the vectorized, sharded and incremental generators')
+    parser.add_argument('--chunk-size', type=int, metavar='ROWS',
+                        help='rows buffered per table before each insert')
+    parser.add_argument('--incremental', action='store_true',
+                        help='append the activity since the last load instead of rebuilding the warehouse')
+    parser.add_argument('--encoded', action='store_true',
+                        help='store raw_events dictionary-encoded (full loads only)')
+    return parser
+
+
+def load_options(args):
+    """main() keyword arguments from flags parsed with add_load_arguments()."""
+    return {
+        'num_customers': args.customers,
+        'vectorized': args.vectorized,
+        'seed': args.seed,
+        'chunk_size': args.chunk_size,
+        'shards': args.shards,
+        'incremental': args.incremental,
+        'encoded': args.encoded,
+    }
+
+
 if __name__ == '__main__':
-    main()
+    parser = add_load_arguments(argparse.ArgumentParser(description='Generate ecommerce data into the raw tables.'))
+    main(**load_options(parser.parse_args()))
@@ -0,0 +1,179 @@
+"""
+Funnel engine — conversion funnels over behavior events, in one pass.
+
+The events table is read once, grouped by session: each session comes back
+as one row with its funnel events packed as 'epoch * steps + step' numbers, and grouping
+on (session_id, customer_id, <breakdowns>) follows the index stg_events
+already has, so SQLite streams it without a sort. The matching is then
+vectorized in numpy over every event at once, linear in the event count:
+
+- order='none' (the default): each stage counts on its own, a session
+  reaches step k at its first step-k event whatever else it did, which is
+  what the five per-stage counts of the dashboard always were. With a
+  window, only events within it of the session's first funnel event count.
+- order='strict': a session reaches step k at its first step-k event at or
+  after the moment it reached step k-1. The conversion window (seconds)
+  counts from its first step-1 event.
+- order='any': a session reaches step k once it has had every one of steps
+  1..k, in any order; with a window, the first occurrences of those steps
+  must all fall inside it.
+
+Funnel.compute() returns three tables: the funnel (sessions and distinct
+customers per stage), the same per value of each breakdown column, and the
+distribution of the time it took to get from each stage to the next. The
+timing always follows order='strict', whatever order the counts use: the
+time from a stage to the next is only meaningful when the next came after
+it, so the other orders would mix in negative gaps.
+"""
+
+from itertools import chain
+
+import numpy as np
+
+NOT_REACHED = np.iinfo(np.int64).max
+
+FUNNEL_COLUMNS = ['stage TEXT', 'stage_order INTEGER', 'unique_users INTEGER',
+                  'unique_sessions INTEGER', 'pct_of_total REAL', 'users_at_stage INTEGER']
+BREAKDOWN_COLUMNS = ['dimension TEXT', 'value TEXT', 'stage TEXT', 'stage_order INTEGER',
+                     'unique_users INTEGER', 'unique_sessions INTEGER', 'pct_of_total REAL']
+TIMING_COLUMNS = ['from_stage TEXT', 'stage TEXT', 'stage_order INTEGER', 'sessions INTEGER',
+                  'avg_seconds REAL', 'p25_seconds REAL', 'median_seconds REAL',
+                  'p75_seconds REAL', 'p90_seconds REAL']
+
+
+def _pct(part, whole):
+    return round(int(part) / int(whole) * 100, 2) if whole else None
+
+
+class Funnel:
+    """An ordered list of event types, matched per session."""
+
+    def __init__(self, steps, order='none', window=None):
+        if order not in ('none', 'strict', 'any'):
+            raise ValueError(f"funnel order must be 'none', 'strict' or 'any', not {order!r}")
+        if len(set(steps)) != len(steps) or not steps:
+            raise ValueError("funnel steps must be a non-empty list of distinct event types")
+        self.steps = list(steps)
+        self.order = order
+        self.window = window
+
+    def _read(self, conn, table, breakdowns):
+        # one row per session: session, customer, breakdown values, event count, packed events
+        n = len(self.steps)
+        case = ' '.join(f'WHEN ? THEN {k}' for k in range(n))
+        group = ', '.join(['session_id', 'customer_id', *breakdowns])
+        sql = f"""
+            SELECT session_id, customer_id{''.join(f', {b}' for b in breakdowns)}, COUNT(*),
+                   group_concat(event_epoch * {n} + CASE event_type {case} END, ' ')
+            FROM {table}
+            WHERE event_type IN ({', '.join('?' * len(self.steps))})
+            GROUP BY {group}
+        """
+        return conn.execute(sql, (*self.steps, *self.steps)).fetchall()
+
+    def _reached(self, rows, order=None):
+        """(steps x sessions) array: epoch second each session reached each stage, or NOT_REACHED."""
+        order = order or self.order
+        reached = np.full((len(self.steps), len(rows)), NOT_REACHED, dtype=np.int64)
+        if not rows:
+            return reached
+        counts = np.array([row[-2] for row in rows], dtype=np.int64)
+        # straight from each session's own string, never one joined copy of them all
+        packed = np.fromiter(chain.from_iterable(row[-1].split(' ') for row in rows),
+                             dtype=np.int64, count=int(counts.sum()))
+        when, step = np.divmod(packed, len(self.steps))
+        session = np.repeat(np.arange(len(rows)), counts)
+
+        if order == 'strict':
+            first = step == 0
+            np.minimum.at(reached[0], session[first], when[first])
+            for k in range(1, len(self.steps)):
+                mask = step == k
+                s, t = session[mask], when[mask]
+                # an unreached previous stage is NOT_REACHED, which no event time passes
+                ok = t >= reached[k - 1][s]
+                if self.window is not None:
+                    ok &= t - reached[0][s] <= self.window
+                np.minimum.at(reached[k], s[ok], t[ok])
+            return reached
+
+        for k in range(len(self.steps)):
+            mask = step == k
+            np.minimum.at(reached[k], session[mask], when[mask])
+        if order == 'none':
+            if self.window is not None:
+                reached[reached - reached.min(axis=0) > self.window] = NOT_REACHED
+            return reached
+        start = np.minimum.accumulate(reached, axis=0)
+        # stage k is reached when the last of steps 1..k first happened;
+        # a missing step leaves NOT_REACHED for every stage after it
+        reached = np.maximum.accumulate(reached, axis=0)
+        if self.window is not None:
+            reached[reached - start > self.window] = NOT_REACHED
+        return reached
+
+    def _counts(self, reached, users, sessions, codes, n_values):
+        """(stages x values) distinct customers and sessions reaching each stage, sessions grouped by codes."""
+        n_users = int(users.max()) + 2 if len(users) else 1
+        n_sessions = int(sessions.max()) + 1 if len(sessions) else 1
+        user_counts = np.zeros((len(self.steps), n_values), dtype=np.int64)
+        session_counts = np.zeros((len(self.steps), n_values), dtype=np.int64)
+        for k in range(len(self.steps)):
+            hit = reached[k]
+            # a session_id can span rows (one per customer/breakdown combination)
+            pairs = np.unique(codes[hit] * n_sessions + sessions[hit])
+            session_counts[k] = np.bincount(pairs // n_sessions, minlength=n_values)
+            known = hit & (users >= 0)
+            pairs = np.unique(codes[known] * n_users + users[known])
+            user_counts[k] = np.bincount(pairs // n_users, minlength=n_values)
+        return user_counts, session_counts
+
+    def compute(self, conn, table='stg_events', breakdowns=()):
+        """
+        Run the funnel over `table` (session_id, customer_id, event_type,
+        event_epoch and the breakdown columns). Returns
+        {'funnel' | 'breakdown' | 'timing': (column definitions, rows)}.
+        """
+        rows = self._read(conn, table, breakdowns)
+        at = self._reached(rows)
+        reached = at != NOT_REACHED
+        # customers and session ids as small ints, -1 for anonymous sessions
+        ids, session_ids = {}, {}
+        users = np.array([-1 if row[1] is None else ids.setdefault(row[1], len(ids)) for row in rows],
+                         dtype=np.int64)
+        sessions = np.array([session_ids.setdefault(row[0], len(session_ids)) for row in rows], dtype=np.int64)
+
+        user_counts, session_counts = self._counts(reached, users, sessions,
+                                                   np.zeros(len(rows), dtype=np.int64), 1)
+        funnel = [(stage, k + 1, int(user_counts[k, 0]), int(session_counts[k, 0]),
+                   _pct(user_counts[k, 0], user_counts[0, 0]), int(user_counts[k, 0]))
+                  for k, stage in enumerate(self.steps)]
+
+        breakdown = []
+        for i, column in enumerate(breakdowns, start=2):
+            values = [row[i] for row in rows]
+            labels = sorted(set(values), key=lambda v: (v is None, str(v)))
+            index = {v: j for j, v in enumerate(labels)}
+            codes = np.array([index[v] for v in values], dtype=np.int64)
+            user_counts, session_counts = self._counts(reached, users, sessions, codes, len(labels))
+            for j, value in enumerate(labels):
+                breakdown += [(column, value, stage, k + 1, int(user_counts[k, j]), int(session_counts[k, j]),
+                               _pct(user_counts[k, j], user_counts[0, j]))
+                              for k, stage in enumerate(self.steps)]
+
+        # strict whatever order the counts use, so no gap is negative
+        path = at if self.order == 'strict' else self._reached(rows, 'strict')
+        timing = []
+        for k in range(1, len(self.steps)):
+            hit = path[k] != NOT_REACHED
+            gaps = (path[k][hit] - path[k - 1][hit]).astype(np.float64)
+            stats = [None] * 5
+            if gaps.size:
+                stats = [round(float(v), 1) for v in (gaps.mean(), *np.percentile(gaps, [25, 50, 75, 90]))]
+            timing.append((self.steps[k - 1], self.steps[k], k + 1, int(gaps.size), *stats))
+
+        return {
+            'funnel': (FUNNEL_COLUMNS, funnel),
+            'breakdown': (BREAKDOWN_COLUMNS, breakdown),
+            'timing': (TIMING_COLUMNS, timing),
+        }
@@ -0,0 +1,189 @@
+"""
+HyperLogLog — approximate distinct counts in a few KB, as SQLite functions.
+
+COUNT(DISTINCT x) builds a temp B-tree over every value. A HyperLogLog
+sketch keeps 2^precision one-byte registers instead. Its standard error is
+1.04 / sqrt(2^precision): 0.81% at the default precision of 14, 1.6% at 12.
+Sketches of the same precision merge losslessly. Sketches stored per day
+can therefore be merged into a count for any range of days without going
+back to the rows they were built from.
+
+register(conn) adds these to a SQLite connection:
+  approx_count_distinct(x [, precision])   aggregate, the estimate
+  hll_sketch(x [, precision])              aggregate, a sketch BLOB
+  hll_merge(sketch)                        aggregate, the union of sketches
+  hll_count(sketch)                        the estimate from a sketch
+
+NULLs are skipped, like COUNT(DISTINCT) does. Values are hashed the same
+way in every process (no salted hash()), so stored sketches stay mergeable.
+"""
+
+import hashlib
+import math
+import struct
+import zlib
+
+import numpy as np
+
+DEFAULT_PRECISION = 14
+MIN_PRECISION, MAX_PRECISION = 11, 16  # ranks stay exact in a float64 from 11 up
+BATCH = 100_000  # values buffered per aggregate before they're hashed in one go
+
+
+def standard_error(precision=DEFAULT_PRECISION):
+    return 1.04 / math.sqrt(1 << precision)
+
+
+def _mix(x):
+    # splitmix64's finalizer, on uint64 arrays (wraps around, as it should)
+    x = x + np.uint64(0x9E3779B97F4A7C15)
+    x = (x ^ (x >> np.uint64(30))) * np.uint64(0xBF58476D1CE4E5B9)
+    x = (x ^ (x >> np.uint64(27))) * np.uint64(0x94D049BB133111EB)
+    return x ^ (x >> np.uint64(31))
+
+
+def _digest(value):
+    if isinstance(value, str):
+        value = value.encode()
+    elif isinstance(value, float):
+        value = struct.pack('<d', value)
+    return int.from_bytes(hashlib.blake2b(value, digest_size=8).digest(), 'little')
+
+
+def hash_values(values):
+    """64-bit hashes (uint64 array) of SQLite values: integers mixed in numpy, the rest blake2b."""
+    ints = [v for v in values if type(v) is int]
+    others = [_digest(v) for v in values if type(v) is not int and v is not None]
+    hashes = _mix(np.array(ints, dtype=np.int64).view(np.uint64))
+    return np.concatenate([hashes, np.array(others, dtype=np.uint64)])
+
+
+def _sigma(x):
+    if x == 1:
+        return math.inf
+    y, z = 1.0, x
+    while True:
+        x *= x
+        z_old, z = z, z + x * y
+        y += y
+        if z == z_old:
+            return z
+
+
+def _tau(x):
+    if x == 0 or x == 1:
+        return 0.0
+    y, z = 1.0, 1 - x
+    while True:
+        x = math.sqrt(x)
+        z_old = z
+        y *= 0.5
+        z -= (1 - x) ** 2 * y
+        if z == z_old:
+            return z / 3
+
+
+class HyperLogLog:
+    """A sketch of a set of values, 2^precision registers."""
+
+    def __init__(self, precision=DEFAULT_PRECISION, registers=None):
+        if not MIN_PRECISION <= precision <= MAX_PRECISION:
+            raise ValueError(f"HyperLogLog precision must be {MIN_PRECISION}..{MAX_PRECISION}, not {precision}")
+        self.precision = precision
+        self.registers = np.zeros(1 << precision, dtype=np.uint8) if registers is None else registers
+
+    def add_hashes(self, hashes):
+        p = self.precision
+        index = (hashes >> np.uint64(64 - p)).astype(np.int64)
+        rest = hashes & np.uint64((1 << (64 - p)) - 1)
+        # rank = position of the first 1 bit in the remaining 64 - p bits
+        rank = (64 - p + 1) - np.frexp(rest.astype(np.float64))[1]
+        np.maximum.at(self.registers, index, rank.astype(np.uint8))
+
+    def update(self, values):
+        self.add_hashes(hash_values(values))
+
+    def merge(self, other):
+        if other.precision != self.precision:
+            raise ValueError(f"can't merge HyperLogLog sketches of precision {self.precision} and {other.precision}")
+        np.maximum(self.registers, other.registers, out=self.registers)
+
+    def count(self):
+        # Ertl's improved estimator ("New cardinality estimation algorithms for
+        # HyperLogLog sketches", 2017): unbiased from empty to huge without
+        # switching to linear counting or HLL++'s empirical bias tables
+        m, q = len(self.registers), 64 - self.precision
+        counts = np.bincount(self.registers, minlength=q + 2)
+        z = m * _tau(1 - counts[q + 1] / m)
+        for k in range(q, 0, -1):
+            z = 0.5 * (z + counts[k])
+        z += m * _sigma(counts[0] / m)
+        return 0 if math.isinf(z) else round(m * m / (2 * math.log(2)) / z)
+
+    def to_bytes(self):
+        # mostly-empty registers (small days, small segments) compress well
+        return bytes([self.precision]) + zlib.compress(self.registers.tobytes())
+
+    @classmethod
+    def from_bytes(cls, blob):
+        registers = np.frombuffer(zlib.decompress(blob[1:]), dtype=np.uint8).copy()
+        return cls(blob[0], registers)
+
+
+class _Sketch:
+    # SQLite aggregate: values are buffered and hashed BATCH at a time
+    def __init__(self):
+        self.sketch = None
+        self.values = []
+
+    def step(self, value, precision=DEFAULT_PRECISION):
+        if self.sketch is None:
+            self.sketch = HyperLogLog(precision)
+        if value is not None:
+            self.values.append(value)
+            if len(self.values) >= BATCH:
+                self.sketch.update(self.values)
+                self.values = []
+
+    def _done(self):
+        sketch = self.sketch or HyperLogLog()
+        sketch.update(self.values)
+        return sketch
+
+    def finalize(self):
+        return self._done().to_bytes()
+
+
+class _ApproxCountDistinct(_Sketch):
+    def finalize(self):
+        return self._done().count()
+
+
+class _Merge:
+    def __init__(self):
+        self.sketch = None
+
+    def step(self, blob):
+        if blob is None:
+            return
+        if self.sketch is None:
+            self.sketch = HyperLogLog.from_bytes(blob)
+        else:
+            self.sketch.merge(HyperLogLog.from_bytes(blob))
+
+    def finalize(self):
+        return None if self.sketch is None else self.sketch.to_bytes()
+
+
+def _count(blob):
+    return None if blob is None else HyperLogLog.from_bytes(blob).count()
+
+
+def register(conn):
+    """Add the HyperLogLog functions to a sqlite3 connection. Returns it."""
+    for narg in (1, 2):
+        conn.create_aggregate('approx_count_distinct', narg, _ApproxCountDistinct)
+        conn.create_aggregate('hll_sketch', narg, _Sketch)
+    conn.create_aggregate('hll_merge', 1, _Merge)
+    conn.create_function('hll_count', 1, _count, deterministic=True)
+    return conn
@@ -0,0 +1,351 @@
+"""
+Platform ingest — streams BehaviorEvent exports from the ecommerce-platform
+(MongoDB, via mongoexport JSON Lines) into raw_events.
+
+The file is read in fixed-size batches of lines, so memory stays flat no
+matter how big the export is, and encoded warehouses work unchanged. Mongo
+ObjectIds for users and products are mapped to stable integer ids in
+platform_id_map. JSON is decoded with orjson when it is installed.
+
+In one process each batch is decoded and written through the same
+ChunkedWriter the generators use. With workers, decoding is the part that
+runs in parallel: each worker decodes a batch into a shard database of its
+own, ObjectIds unresolved, and this process merges the shards in file
+order with INSERT ... SELECT, ids resolved by a join on platform_id_map,
+like the sharded generator does. The merge never goes through Python row
+by row, so the decoding workers are what set the pace until it runs out
+of cores. Only a few batches are in flight at a time.
+
+Usage: python etl/ingest_platform.py events.jsonl[.gz] [--workers N] [--dedup]
+"""
+
+import argparse
+import sys
+import os
+import gc
+import gzip
+import json
+import sqlite3
+import time
+from datetime import datetime, timezone
+from collections import deque
+from itertools import islice
+from multiprocessing import Pool
+
+try:
+    import orjson
+    _loads = orjson.loads
+except ImportError:  # optional: the stdlib decoder gives the same documents, about 2.5x slower
+    _loads = json.loads
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from etl.extract_load import (DB_PATH, INSERT_SQL, ChunkedWriter, EventEncoder, create_tables, bulk_load,
+                              events_table, merge_events_sql, print_load_rates)
+from etl.dedup import EventDeduper
+
+BATCH_SIZE = 50_000
+
+# platform vocab -> warehouse vocab. event types pass through as they are:
+# the platform sends its own checkout_start, and checkout_shipping and
+# checkout_payment are later steps of the same checkout, not new ones
+CHANNEL_MAP = {'social': 'social_media'}
+
+# platform ids live in their own range so they never collide with the
+# synthetic customers/products the generators hand out from 1
+PLATFORM_ID_BASE = 1_000_000_000
+
+
+def open_export(path):
+    """Open a mongoexport file, gzipped or not."""
+    if path.endswith('.gz'):
+        return gzip.open(path, 'rb')
+    return open(path, 'rb')
+
+
+def _oid(value):
+    # {"$oid": "..."} in mongoexport output, a bare string if someone
+    # exported with --jsonFormat=relaxed through another tool
+    if isinstance(value, dict):
+        return value.get('$oid')
+    return value
+
+
+def _timestamp(value):
+    """Mongo date (ISO string, epoch millis or $numberLong) -> naive UTC ISO string."""
+    if isinstance(value, dict):
+        value = value.get('$date')
+        if isinstance(value, dict):
+            value = int(value['$numberLong'])
+    if isinstance(value, str):
+        if value.endswith('Z'):
+            return value[:-1]
+        if value.endswith('+00:00'):
+            return value[:-6]
+        parsed = datetime.fromisoformat(value)
+        if parsed.tzinfo is None:
+            # no offset means UTC, as with Mongo's own dates, not the ingesting host's zone
+            parsed = parsed.replace(tzinfo=timezone.utc)
+        return parsed.astimezone(timezone.utc).replace(tzinfo=None).isoformat()
+    if value is None:
+        return None
+    return datetime.fromtimestamp(value / 1000, timezone.utc).replace(tzinfo=None).isoformat()
+
+
+def platform_row(doc):
+    """
+    Map one BehaviorEvent document onto the raw_events column order, with
+    the user and product ObjectIds left as hex strings for PlatformIds.
+    Missing fields fall back to the same defaults the mongoose schema uses.
+    """
+    meta = doc.get('metadata') or {}
+    time_on_page = meta.get('timeOnPage')
+    channel = doc.get('attributionChannel') or 'direct'
+    return (
+        _oid(doc.get('user')),
+        doc.get('sessionId') or 'unknown',
+        doc['eventType'],
+        _oid(doc.get('product') or doc.get('productId')),
+        CHANNEL_MAP.get(channel, channel),
+        doc.get('deviceType') or 'desktop',
+        meta.get('page'),
+        int(time_on_page) if time_on_page is not None else None,
+        _timestamp(doc.get('timestamp')),
+    )
+
+
+def _parse_lines(lines):
+    # runs in the pool workers too, so it has to stay module level
+    loads = _loads
+    return [platform_row(loads(line)) for line in lines if line.strip()]
+
+
+def _parse_to_shard(args):
+    """Worker: decode one batch of lines into a shard db of its own, ObjectIds unresolved."""
+    lines, path = args
+    if os.path.exists(path):
+        os.remove(path)
+    conn = sqlite3.connect(path)
+    # a scratch file read once by the merge, nothing to journal or sync
+    conn.execute('PRAGMA journal_mode=OFF')
+    conn.execute('PRAGMA synchronous=OFF')
+    conn.execute('CREATE TABLE events (user_oid TEXT, session_id TEXT, event_type TEXT, product_oid TEXT, '
+                 'attribution_channel TEXT, device_type TEXT, page_url TEXT, time_on_page INTEGER, '
+                 'event_timestamp TEXT)')
+    conn.executemany('INSERT INTO events VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)', _parse_lines(lines))
+    conn.commit()
+    conn.close()
+    return path
+
+
+def _in_order(pool, func, jobs, window):
+    """pool.imap() that keeps at most `window` jobs in flight instead of queueing the whole input."""
+    pending = deque()
+    for job in jobs:
+        pending.append(pool.apply_async(func, (job,)))
+        if len(pending) >= window:
+            yield pending.popleft().get()
+    while pending:
+        yield pending.popleft().get()
+
+
+class PlatformIds:
+    """
+    Hands out integer ids for Mongo ObjectIds and remembers them in
+    platform_id_map, so re-ingesting an export maps every user and product
+    to the same customer_id/product_id as last time.
+    """
+
+    def __init__(self, conn):
+        self.conn = conn
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS platform_id_map (
+                kind TEXT NOT NULL,
+                object_id TEXT NOT NULL,
+                local_id INTEGER NOT NULL,
+                PRIMARY KEY (kind, object_id)
+            ) WITHOUT ROWID
+        """)
+        self.ids = {'user': {}, 'product': {}}
+        for kind, object_id, local_id in conn.execute(
+                "SELECT kind, object_id, local_id FROM platform_id_map"):
+            self.ids[kind][object_id] = local_id
+        self.next_id = {kind: PLATFORM_ID_BASE + len(ids) + 1 for kind, ids in self.ids.items()}
+        self.new = []
+
+    def local_id(self, kind, object_id):
+        if object_id is None:
+            return None
+        ids = self.ids[kind]
+        local_id = ids.get(object_id)
+        if local_id is None:
+            local_id = ids[object_id] = self.next_id[kind]
+            self.next_id[kind] += 1
+            self.new.append((kind, object_id, local_id))
+        return local_id
+
+    def map_rows(self, rows):
+        users, products = self.ids['user'], self.ids['product']
+        local_id = self.local_id
+        out = []
+        for user, session, event_type, product, *rest in rows:
+            # dict hits are the common case, only fall back to local_id() for new ids
+            customer_id = users.get(user) if user is not None else None
+            if customer_id is None and user is not None:
+                customer_id = local_id('user', user)
+            product_id = products.get(product) if product is not None else None
+            if product_id is None and product is not None:
+                product_id = local_id('product', product)
+            out.append((customer_id, session, event_type, product_id, *rest))
+        return out
+
+    def save(self):
+        if self.new:
+            self.conn.executemany("INSERT INTO platform_id_map VALUES (?, ?, ?)", self.new)
+            self.new = []
+
+    def register(self, source, columns=(('user', 'user_oid'), ('product', 'product_oid'))):
+        """
+        Give the ObjectIds in `source` (a table of unresolved rows) that have
+        no id yet one each, in SQL, in order of first appearance as
+        local_id() would have.
+        """
+        self.save()
+        for kind, column in columns:
+            self.conn.execute(f"""
+                INSERT INTO platform_id_map (kind, object_id, local_id)
+                SELECT ?, {column}, ? + ROW_NUMBER() OVER (ORDER BY first) - 1
+                FROM (SELECT {column}, MIN(rowid) AS first FROM {source}
+                      WHERE {column} IS NOT NULL GROUP BY {column})
+                WHERE NOT EXISTS (SELECT 1 FROM platform_id_map m WHERE m.kind = ? AND m.object_id = {column})
+            """, (kind, self.next_id[kind], kind))
+            for object_id, local_id in self.conn.execute(
+                    "SELECT object_id, local_id FROM platform_id_map WHERE kind = ? AND local_id >= ?",
+                    (kind, self.next_id[kind])):
+                self.ids[kind][object_id] = local_id
+                self.next_id[kind] = max(self.next_id[kind], local_id + 1)
+
+
+def _line_batches(f, batch_size):
+    while True:
+        lines = list(islice(f, batch_size))
+        if not lines:
+            return
+        yield lines
+
+
+def _merge_shard(conn, ids, encoder, path):
+    """Merge one worker's shard into raw_events, ids resolved on the way. Returns rows merged."""
+    conn.execute('ATTACH DATABASE ? AS shard', (path,))
+    try:
+        ids.register('shard.events')
+        conn.execute("""
+            CREATE TEMP VIEW platform_batch AS
+            SELECT e.rowid AS event_id, u.local_id AS customer_id, e.session_id, e.event_type,
+                   p.local_id AS product_id, e.attribution_channel, e.device_type, e.page_url,
+                   e.time_on_page, e.event_timestamp
+            FROM shard.events e
+            LEFT JOIN platform_id_map u ON u.kind = 'user' AND u.object_id = e.user_oid
+            LEFT JOIN platform_id_map p ON p.kind = 'product' AND p.object_id = e.product_oid
+        """)
+        conn.execute(merge_events_sql(conn, encoder, 'temp.platform_batch'))
+        rows = conn.execute('SELECT COUNT(*) FROM shard.events').fetchone()[0]
+        conn.execute('DROP VIEW temp.platform_batch')
+        conn.commit()
+    finally:
+        conn.execute('DETACH DATABASE shard')
+    os.remove(path)
+    return rows
+
+
+def ingest_file(conn, path, batch_size=BATCH_SIZE, workers=None, deduper=None, shard_dir=None):
+    """
+    Stream a BehaviorEvent export into raw_events, batch_size lines at a
+    time. With workers set, a process pool decodes the batches into shard
+    dbs (in shard_dir, next to the warehouse by default) that this process
+    merges; batches still land in file order. With a deduper
+    (etl.dedup.EventDeduper), events already in the warehouse are dropped,
+    which needs the rows in Python: the workers then hand back rows instead
+    of shards. Returns {table: (rows written, seconds spent writing)}.
+    """
+    ids = PlatformIds(conn)
+    writer = ChunkedWriter(conn, batch_size)
+
+    def write(rows):
+        rows = ids.map_rows(rows)
+        # new mappings go in before the rows that use them commit
+        ids.save()
+        if deduper:
+            writer.extend('raw_events', deduper.filter(rows))
+            # the next batch's exact checks need to see these rows
+            writer.flush()
+        else:
+            writer.extend('raw_events', rows)
+
+    # decoded documents are plain acyclic dicts that refcounting frees as soon
+    # as the batch is mapped; letting the cycle collector walk every batch of
+    # them roughly halves decode throughput
+    gc_was_enabled = gc.isenabled()
+    gc.disable()
+    try:
+        with open_export(path) as f:
+            batches = _line_batches(f, batch_size)
+            if workers and workers > 1 and not deduper:
+                shard_dir = shard_dir or os.path.dirname(DB_PATH)
+                encoder = EventEncoder(conn) if events_table(conn) == 'raw_events_encoded' else None
+                merged, seconds = 0, 0.0
+                # shard names cycle through the window, a name is merged and removed before it comes round
+                jobs = ((lines, os.path.join(shard_dir, f'platform.shard{k % (2 * workers)}.db'))
+                        for k, lines in enumerate(batches))
+                with Pool(workers) as pool:
+                    for shard in _in_order(pool, _parse_to_shard, jobs, 2 * workers):
+                        started = time.perf_counter()
+                        merged += _merge_shard(conn, ids, encoder, shard)
+                        seconds += time.perf_counter() - started
+                stats = {table: (0, 0.0) for table in INSERT_SQL}
+                stats['raw_events'] = (merged, seconds)
+                return stats
+            if workers and workers > 1:
+                with Pool(workers) as pool:
+                    for rows in _in_order(pool, _parse_lines, batches, 2 * workers):
+                        write(rows)
+            else:
+                for lines in batches:
+                    write(_parse_lines(lines))
+        writer.flush()
+        if deduper:
+            deduper.save()
+    finally:
+        if gc_was_enabled:
+            gc.enable()
+    return writer.stats()
+
+
+def main(path, workers=None, dedup=False):
+    conn = sqlite3.connect(DB_PATH)
+    create_tables(conn)
+    print(f"Ingesting platform events from {path}...")
+    started = time.perf_counter()
+    with bulk_load(conn, defer_indexes=False):
+        deduper = EventDeduper(conn) if dedup else None
+        stats = ingest_file(conn, path, workers=workers, deduper=deduper)
+    elapsed = time.perf_counter() - started
+    print_load_rates({'raw_events': stats['raw_events']})
+    rows = stats['raw_events'][0]
+    print(f"  end to end: {rows:,} events in {elapsed:.1f}s ({rows / max(elapsed, 1e-9):,.0f}/s)")
+    if deduper:
+        d = deduper.stats()
+        print(f"  dedup: {d['duplicates']:,} duplicates dropped, "
+              f"{d['exact_checks']:,} exact checks ({d['false_positives']:,} false positives)")
+    conn.close()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Ingest a BehaviorEvent export into raw_events.')
+    parser.add_argument('path', help='mongoexport JSON Lines file, optionally gzipped')
+    parser.add_argument('--workers', type=int, metavar='N',
+                        help='processes decoding the export in parallel (default: decode in this one)')
+    parser.add_argument('--dedup', action='store_true',
+                        help='drop events already in the warehouse (etl/dedup.py)')
+    args = parser.parse_args()
+    main(args.path, workers=args.workers, dedup=args.dedup)
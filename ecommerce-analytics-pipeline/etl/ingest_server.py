@@ -0,0 +1,291 @@
+"""
+Ingest server — a small local HTTP endpoint that takes the same payload as
+the platform's POST /api/track/batch and appends it to raw_events.
+
+Request threads only parse and enqueue; one writer thread owns the SQLite
+connection and drains whatever is queued into a single transaction (group
+commit), so concurrent posts share one commit instead of paying for one
+each. The queue is bounded: when the writer can't keep up, posts get a 503
+with Retry-After instead of piling up in memory.
+
+Endpoints:
+  POST /api/track/batch   {"events": [...]}, headers x-session-id,
+                          x-attribution, x-device-type as on the platform
+  GET  /metrics           queue depth, commit latency, batch sizes
+
+Usage: python etl/ingest_server.py [port] [--dedup]
+"""
+
+import sys
+import os
+import json
+import queue
+import sqlite3
+import threading
+import time
+from collections import deque
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from etl.extract_load import DB_PATH, ChunkedWriter, create_tables
+from etl.ingest_platform import PlatformIds, platform_row
+from etl.dedup import EventDeduper
+
+PORT = 8765
+QUEUE_BATCHES = 1000       # posts waiting for the writer before we push back
+GROUP_EVENTS = 20_000      # stop draining the queue once a group is this big
+ENQUEUE_TIMEOUT = 0.5      # how long a post waits for queue space before a 503
+COMMIT_TIMEOUT = 30        # how long a post waits for its group to commit
+MAX_BODY_BYTES = 16 * 1024 * 1024
+DEDUP_SAVE_SECONDS = 60    # how often the dedup filter is persisted while running
+
+
+class _Pending:
+    """One accepted post waiting for the group commit that contains it."""
+
+    def __init__(self, rows):
+        self.rows = rows
+        self.done = threading.Event()
+        self.error = None
+
+
+class IngestMetrics:
+    """Counters plus the last 1000 commits, for /metrics."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.accepted = 0
+        self.rejected = 0
+        self.committed = 0
+        self.commits = 0
+        self.duplicates = 0
+        self.latencies = deque(maxlen=1000)
+        self.batch_sizes = deque(maxlen=1000)
+
+    def record_commit(self, rows, seconds):
+        with self.lock:
+            self.committed += rows
+            self.commits += 1
+            self.latencies.append(seconds)
+            self.batch_sizes.append(rows)
+
+    def snapshot(self, q):
+        with self.lock:
+            latencies = sorted(self.latencies)
+            sizes = sorted(self.batch_sizes)
+            return {
+                'queue_depth': q.qsize(),
+                'queue_capacity': q.maxsize,
+                'events_accepted': self.accepted,
+                'events_rejected': self.rejected,
+                'events_committed': self.committed,
+                'events_duplicate': self.duplicates,
+                'commits': self.commits,
+                'commit_latency_ms': _summary([s * 1000 for s in latencies]),
+                'batch_size': _summary(sizes),
+            }
+
+
+def _summary(values):
+    # values come in sorted
+    if not values:
+        return {'avg': None, 'p50': None, 'p95': None, 'max': None}
+    n = len(values)
+    return {
+        'avg': round(sum(values) / n, 2),
+        'p50': round(values[n // 2], 2),
+        'p95': round(values[min(n - 1, int(n * 0.95))], 2),
+        'max': round(values[-1], 2),
+    }
+
+
+def batch_rows(payload, headers, now=None):
+    """
+    Enrich a trackBatch payload the same way the platform controller does
+    (headers win for session fallback, attribution and device) and map it
+    onto raw_events rows, ObjectIds still unresolved.
+    """
+    now = now or datetime.now(timezone.utc).replace(tzinfo=None).isoformat(timespec='milliseconds') + 'Z'
+    session = headers.get('x-session-id')
+    channel = headers.get('x-attribution') or 'direct'
+    device = headers.get('x-device-type') or 'desktop'
+    rows = []
+    for i, event in enumerate(payload['events']):
+        row = platform_row({
+            **event,
+            'sessionId': event.get('sessionId') or session or 'unknown',
+            'attributionChannel': channel,
+            'deviceType': device,
+            'timestamp': event.get('timestamp') or now,
+        })
+        # reject here rather than let one bad event fail everyone's group commit
+        if not all(v is None or isinstance(v, (str, int, float)) for v in row):
+            raise ValueError(f'event {i} has a non-scalar field')
+        rows.append(row)
+    return rows
+
+
+class GroupCommitWriter(threading.Thread):
+    """
+    Drains the queue into raw_events. Each loop blocks for the first post,
+    grabs whatever else is already queued (up to GROUP_EVENTS rows), writes
+    them all in one transaction and then wakes every post in the group.
+    """
+
+    def __init__(self, db_path, q, metrics, dedup=False):
+        super().__init__(name='ingest-writer', daemon=True)
+        self.db_path = db_path
+        self.queue = q
+        self.metrics = metrics
+        self.dedup = dedup
+        self.stopping = threading.Event()
+
+    def run(self):
+        conn = sqlite3.connect(self.db_path)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        create_tables(conn)
+        ids = PlatformIds(conn)
+        writer = ChunkedWriter(conn)
+        deduper = EventDeduper(conn) if self.dedup else None
+        saved_at = time.monotonic()
+        while not (self.stopping.is_set() and self.queue.empty()):
+            try:
+                group = [self.queue.get(timeout=0.1)]
+            except queue.Empty:
+                continue
+            size = len(group[0].rows)
+            while size < GROUP_EVENTS:
+                try:
+                    pending = self.queue.get_nowait()
+                except queue.Empty:
+                    break
+                group.append(pending)
+                size += len(pending.rows)
+
+            started = time.perf_counter()
+            try:
+                rows = [row for pending in group for row in ids.map_rows(pending.rows)]
+                ids.save()
+                if deduper:
+                    # a retried post still gets its 201, its events just aren't written twice
+                    rows = deduper.filter(rows)
+                writer.extend('raw_events', rows)
+                writer.flush()
+            except Exception as e:
+                # anything, a bad ObjectId as much as a locked database, fails
+                # this group's posts only: the writer must outlive it
+                conn.rollback()
+                # cached ids/codes may point at rolled back rows, start over from the db
+                ids = PlatformIds(conn)
+                writer = ChunkedWriter(conn)
+                for pending in group:
+                    pending.error = f'{type(e).__name__}: {e}'
+            else:
+                self.metrics.record_commit(len(rows), time.perf_counter() - started)
+                if deduper:
+                    self.metrics.duplicates = deduper.duplicates
+            for pending in group:
+                pending.done.set()
+            if deduper and time.monotonic() - saved_at > DEDUP_SAVE_SECONDS:
+                deduper.save()
+                saved_at = time.monotonic()
+        if deduper:
+            deduper.save()
+            self.metrics.duplicates = deduper.duplicates
+        conn.close()
+
+    def stop(self):
+        self.stopping.set()
+        self.join()
+
+
+class IngestHandler(BaseHTTPRequestHandler):
+    # self.server.queue / .metrics are set up by make_server()
+    server_version = 'IngestServer/1.0'
+    protocol_version = 'HTTP/1.1'  # keep-alive, trackers post in a loop
+
+    def log_message(self, format, *args):
+        # one line per post would drown the terminal at these rates
+        pass
+
+    def _send_json(self, status, body, headers=None):
+        data = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self):
+        if self.path == '/metrics':
+            self._send_json(200, self.server.metrics.snapshot(self.server.queue))
+        else:
+            self._send_json(404, {'error': 'not found'})
+
+    def do_POST(self):
+        if self.path != '/api/track/batch':
+            self._send_json(404, {'error': 'not found'})
+            return
+        length = int(self.headers.get('Content-Length') or 0)
+        if length > MAX_BODY_BYTES:
+            self._send_json(413, {'error': 'payload too large'})
+            return
+        try:
+            payload = json.loads(self.rfile.read(length))
+            rows = batch_rows(payload, self.headers)
+        except (ValueError, KeyError, TypeError, AttributeError) as e:
+            self._send_json(400, {'error': f'bad payload: {e}'})
+            return
+
+        metrics = self.server.metrics
+        pending = _Pending(rows)
+        try:
+            self.server.queue.put(pending, timeout=ENQUEUE_TIMEOUT)
+        except queue.Full:
+            with metrics.lock:
+                metrics.rejected += len(rows)
+            self._send_json(503, {'error': 'ingest queue full'}, {'Retry-After': '1'})
+            return
+        with metrics.lock:
+            metrics.accepted += len(rows)
+
+        if not pending.done.wait(COMMIT_TIMEOUT):
+            self._send_json(504, {'error': 'commit timed out'})
+        elif pending.error:
+            self._send_json(500, {'error': pending.error})
+        else:
+            self._send_json(201, {'count': len(rows)})
+
+
+def make_server(port=PORT, db_path=None, queue_batches=QUEUE_BATCHES, dedup=False):
+    """Build the HTTP server and start its writer thread (not yet serving)."""
+    server = ThreadingHTTPServer(('127.0.0.1', port), IngestHandler)
+    server.daemon_threads = True
+    server.queue = queue.Queue(maxsize=queue_batches)
+    server.metrics = IngestMetrics()
+    server.writer = GroupCommitWriter(db_path or DB_PATH, server.queue, server.metrics, dedup)
+    server.writer.start()
+    return server
+
+
+def main(port=PORT, dedup=False):
+    server = make_server(port, dedup=dedup)
+    print(f"Ingest server listening on http://127.0.0.1:{port}/api/track/batch")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        server.writer.stop()
+        print(f"Stopped. {server.metrics.committed:,} events committed.")
+
+
+if __name__ == '__main__':
+    args = [a for a in sys.argv[1:] if a != '--dedup']
+    main(int(args[0]) if args else PORT, dedup='--dedup' in sys.argv)
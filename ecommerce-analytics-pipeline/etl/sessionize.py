@@ -0,0 +1,109 @@
+"""
+Sessionization — sessions derived from who did what when, not from the
+session_id the client sends.
+
+Client session ids can't be trusted: platform events without a session
+header all arrive as 'unknown', which would make one session out of every
+such visit. Here a session is a run of one customer's events, in time
+order, that ends when the customer goes quiet for longer than the gap (30
+minutes by default) and, with split_at_midnight, at midnight UTC.
+Anonymous events have nothing but the client session_id to tell visitors
+apart, so they are sessionized per session_id the same way, which still
+breaks up an 'unknown' pile into its separate visits.
+
+Events are streamed once in (customer_id, event_epoch) order, which an
+index on stg_events gives SQLite without a sort, CHUNK rows at a time. A
+chunk's session starts are found in numpy with one comparison of each
+event against the one before it, so the whole pass is linear. The session
+still open at the end of a chunk is carried into the next.
+
+A visitor's key is 'c:<customer_id>', or 's:<session_id>' for an anonymous
+one, and a session's key is its visitor's key plus ':<start epoch>': the
+same events always give the same key. Each session also carries the
+largest event_id among its events, so an incremental run can tell which
+visitors' sessions a newly loaded event went into.
+"""
+
+import numpy as np
+
+CHUNK = 500_000  # events read at a time
+DAY = 86400
+
+SESSION_COLUMNS = ['session_key TEXT', 'visitor_key TEXT', 'customer_id INTEGER', 'client_session_id TEXT',
+                   'session_start_epoch INTEGER', 'session_end_epoch INTEGER', 'events INTEGER',
+                   'attribution_channel TEXT', 'device_type TEXT', 'last_event_id INTEGER']
+
+
+class Sessionizer:
+    """Splits each visitor's time-ordered events into sessions."""
+
+    def __init__(self, gap_minutes=30, split_at_midnight=True):
+        if gap_minutes <= 0:
+            raise ValueError(f"session gap must be positive, not {gap_minutes}")
+        self.gap = gap_minutes * 60
+        self.split_at_midnight = split_at_midnight
+
+    def starts(self, visitor, epoch):
+        """Whether each event (sorted by visitor, then time) starts a session."""
+        start = np.ones(len(epoch), dtype=bool)
+        if len(epoch) > 1:
+            start[1:] = (visitor[1:] != visitor[:-1]) | (epoch[1:] - epoch[:-1] > self.gap)
+            if self.split_at_midnight:
+                start[1:] |= epoch[1:] // DAY != epoch[:-1] // DAY
+        return start
+
+    def _sessions(self, rows, prefix, anonymous, final=False):
+        """Session rows for the sessions in a chunk, and the events of the one left open."""
+        visitor = np.array([r[0] for r in rows], dtype=object if anonymous else np.int64)
+        epoch = np.array([r[1] for r in rows], dtype=np.int64)
+        event_id = np.array([r[5] for r in rows], dtype=np.int64)
+        first = np.flatnonzero(self.starts(visitor, epoch))
+        last = np.append(first[1:] - 1, len(rows) - 1)
+        # a late event has a higher id than events after it in time
+        newest = np.maximum.reduceat(event_id, first)
+        carry = []
+        if not final:
+            # the last session may go on in the next chunk
+            carry, first, last, newest = rows[first[-1]:], first[:-1], last[:-1], newest[:-1]
+        out = []
+        for a, z, n in zip(first.tolist(), last.tolist(), newest.tolist()):
+            v, start, client, channel, device, _ = rows[a]
+            out.append((f'{prefix}:{v}:{start}', f'{prefix}:{v}', None if anonymous else v, client,
+                        start, rows[z][1], z - a + 1, channel, device, n))
+        return out, carry
+
+    def _stream(self, cur, prefix, anonymous):
+        out, carry = [], []
+        while True:
+            rows = cur.fetchmany(CHUNK)
+            if not rows:
+                break
+            sessions, carry = self._sessions(carry + rows, prefix, anonymous)
+            out += sessions
+        if carry:
+            out += self._sessions(carry, prefix, anonymous, final=True)[0]
+        return out
+
+    def compute(self, conn, table='stg_events'):
+        """
+        Sessions of every event in `table` (event_id, customer_id,
+        session_id, event_epoch, attribution_channel, device_type). Returns (column
+        definitions, rows), one row per session, with the channel and
+        device of its first event.
+        """
+        columns = 'event_epoch, session_id, attribution_channel, device_type, event_id'
+        known = conn.execute(f"""
+            SELECT customer_id, {columns}
+            FROM {table}
+            WHERE customer_id IS NOT NULL
+            ORDER BY customer_id, event_epoch, event_id
+        """)
+        sessions = self._stream(known, 'c', anonymous=False)
+        anonymous = conn.execute(f"""
+            SELECT session_id, {columns}
+            FROM {table}
+            WHERE customer_id IS NULL
+            ORDER BY session_id, event_epoch, event_id
+        """)
+        sessions += self._stream(anonymous, 's', anonymous=True)
+        return SESSION_COLUMNS, sessions
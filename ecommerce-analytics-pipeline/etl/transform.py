@@ -2,14 +2,113 @@
 Transform layer — reads SQL model files and executes them against the warehouse.
 This is a simplified version of what dbt does: run SQL transformations
 in dependency order to build staging tables, dimensional models, and analytics views.
+
+Dependencies come from the SQL itself: a model depends on every other model
+whose table it reads (FROM / JOIN). Models whose dependencies are done run
+concurrently, each on its own WAL connection.
+
+Models can carry config in a header of `-- @key: value` lines:
+  -- @depends_on: dim_date, fact_orders   extra upstream models the parser can't see
+  -- @materialized: incremental           only process new rows (see _run_incremental)
+  -- @source: raw_events                  the upstream table new rows come from
+  -- @watermark: event_id                 source column that only grows
+  -- @unique_key: event_id                rows sharing a key are rebuilt together
+  -- @lookback: 3 days                    reprocess this far behind the watermark
+  -- @cache: false                        always rebuild, never skip on fingerprint
+  -- @cache: daily                        rebuild once a day, for a model that reads the clock
+  -- @indexes: customer_id, (cohort_month, customer_id)
+                                          indexes to create on the model's table
+  -- @clustered_by: customer_id           store the table WITHOUT ROWID, keyed on
+                                          these columns (unique and never NULL)
+  -- @partition_by: order_month           one table per value of this column (a
+                                          month), behind a UNION ALL view
+
+Models can call approx_count_distinct() and the HyperLogLog sketch
+functions hll_sketch / hll_merge / hll_count (etl/hll.py), and the
+activity bitmap functions activity_bitmap / bitmap_count (etl/activity.py),
+which every warehouse connection registers.
+
+Indexes are created right after the table is built, and the table is
+ANALYZEd so the models that read it get planned with real statistics.
+
+A partitioned model's table is a view over "<table>__p<value>" tables, one
+per month. Each branch of the view has the partition column as a constant,
+so a query filtering on it only reads the matching partitions. Incremental
+runs rewrite only the partitions the new rows touch, and --keep-months
+drops old months by dropping their tables.
+
+Tables are built under a shadow name and renamed into place, indexes and
+all, in one short transaction. The warehouse is in WAL mode, so dashboards
+reading during a run keep getting the previous version of every table
+until its replacement is complete, and never wait on the writer.
+
+Each build is fingerprinted from the model's SQL plus the fingerprints of
+the models it reads and the row-versions of the raw tables it reads
+(etl_model_state). Unchanged models are skipped; --full-refresh rebuilds all.
+--check-incremental rebuilds each incremental model in full after the run
+and reports the tables that differ from what incremental runs have kept.
+
+--select runs part of the DAG: `fact_sessions` (one model), `fact_sessions+`
+(it and everything downstream), `+fact_sessions` (it and everything it
+reads from), or a folder (`marts`, which takes the + operators too). Models
+outside the selection are read as they are.
+
+Every run writes output/run_results.json (time, rows, bytes and query plan
+per model) and shows which models got faster or slower than in the previous run.
+
+A model can also be a Python file, for work that SQL does badly. Its
+header (`# @key: value` lines) names the tables it reads and creates:
+  # @reads: stg_events
+  # @creates: analytics_funnel, analytics_funnel_breakdown
+and its build(conn) returns {table: (column definitions, rows)}, or
+{table: a SELECT} for a table SQLite can compute itself once Python has
+worked out the query. Both are built into TEMP tables and published like a SQL model's, shadow
+tables and all. A Python model that creates one table can be incremental
+too: its build() reads @source through the same filtered view a SQL
+model's SELECT does.
+
+With --backend duckdb the same model files run on DuckDB instead, see
+etl/duckdb_backend.py; --parity compares the two warehouses' model tables.
 """
 
-import sqlite3
+import argparse
+import hashlib
+import json
 import os
 import glob
+import importlib.util
+import re
+import sqlite3
+import sys
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from etl import activity, hll
 
 DB_PATH = os.path.join(os.path.dirname(__file__), '..', 'data', 'warehouse.db')
 MODELS_DIR = os.path.join(os.path.dirname(__file__), '..', 'models')
+RUN_RESULTS_PATH = os.path.join(os.path.dirname(__file__), '..', 'output', 'run_results.json')
+
+# folders are just for organisation now, the DAG decides the order
+MODEL_GROUPS = ['staging', 'marts', 'analytics']
+
+CONFIG_RE = re.compile(r'^\s*(?:--|#)\s*@(\w+)\s*:\s*(.*?)\s*$')
+COMMENT_RE = re.compile(r'--[^\n]*')
+CREATE_RE = re.compile(r'\bCREATE\s+(?:TEMP\w*\s+)?(?:TABLE|VIEW)\s+(?:IF\s+NOT\s+EXISTS\s+)?(\w+)', re.I)
+CTAS_RE = re.compile(r'^\s*CREATE\s+TABLE\s+(\w+)\s+AS\s+(.*)$', re.I | re.S)
+READ_RE = re.compile(r'\b(?:FROM|JOIN)\s+(\w+)', re.I)
+DROP_RE = re.compile(r'^\s*DROP\s+(?:TABLE|VIEW)\s+(?:IF\s+EXISTS\s+)?(\w+)\s*$', re.I)
+CTE_RE = re.compile(r'(?:\bWITH(?:\s+RECURSIVE)?|,)\s*(\w+)\s*(?:\([^)]*\))?\s+AS\s*\(', re.I)
+ETL_IMPORT_RE = re.compile(r'\bfrom\s+etl\s+import\s+(\w+)|\bfrom\s+etl\.(\w+)\s+import|\bimport\s+etl\.(\w+)')
+INDEX_RE = re.compile(r'\(([^)]*)\)|([^,()\s]+)')  # `a, (b, c)` -> [a], [b, c]
+
+
+def split_statements(sql):
+    """Split a SQL file into statements on ';'."""
+    return [s.strip() for s in sql.split(';') if s.strip()]
 
 
 def run_sql_file(conn, filepath):
@@ -18,39 +117,1086 @@ def run_sql_file(conn, filepath):
         sql = f.read()
 
     # support multiple statements separated by semicolons
-    statements = [s.strip() for s in sql.split(';') if s.strip()]
-    for stmt in statements:
+    for stmt in split_statements(sql):
         conn.execute(stmt)
     conn.commit()
 
 
-def run_models():
-    """Run all SQL models in order: staging -> marts -> analytics."""
-    conn = sqlite3.connect(DB_PATH)
+def model_config(sql):
+    """The `-- @key: value` (or `# @key: value`) lines at the top of a model, as a dict."""
+    config = {}
+    for line in sql.splitlines():
+        if not line.strip():
+            continue
+        match = CONFIG_RE.match(line)
+        if match:
+            config[match.group(1)] = match.group(2)
+        elif not line.lstrip().startswith(('--', '#')):
+            break  # header ends at the first line of SQL (or Python)
+    return config
+
+
+def _config_list(value):
+    return [v.strip() for v in (value or '').split(',') if v.strip()]
+
+
+def model_files(conn, group_dir):
+    """
+    SQL and Python model files for a model group, in name order. When the
+    warehouse stores events dictionary-encoded, <model>.encoded.sql
+    replaces <model>.sql.
+    """
+    encoded = conn.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'raw_events_encoded'"
+    ).fetchone()
+    files = {}
+    for filepath in sorted(glob.glob(os.path.join(group_dir, '*.sql')) +
+                           glob.glob(os.path.join(group_dir, '*.py'))):
+        name = os.path.basename(filepath)
+        if not name.endswith('.encoded.sql'):
+            files[name] = filepath
+    if encoded:
+        for filepath in glob.glob(os.path.join(group_dir, '*.encoded.sql')):
+            files[os.path.basename(filepath).replace('.encoded.sql', '.sql')] = filepath
+    return [files[name] for name in sorted(files)]
+
 
-    # order matters — staging first, then dims/facts, then analytics
-    model_groups = ['staging', 'marts', 'analytics']
+class Model:
+    """One SQL (or Python) model file plus what the DAG needs to know about it."""
 
-    for group in model_groups:
-        group_dir = os.path.join(MODELS_DIR, group)
+    def __init__(self, path, group):
+        self.path = path
+        self.group = group
+        self.name = os.path.basename(path).split('.')[0]
+        with open(path) as f:
+            self.sql = f.read()
+        self.config = model_config(self.sql)
+        self.python = path.endswith('.py')
+        if self.python:
+            self._init_python()
+        else:
+            self.sql_hash = hashlib.sha256(self.sql.encode()).hexdigest()
+            self.statements = split_statements(self.sql)
+            body = COMMENT_RE.sub('', self.sql)
+            self.creates = {n.lower() for n in CREATE_RE.findall(body)}
+            ctes = {n.lower() for n in CTE_RE.findall(body)}
+            self.reads = {n.lower() for n in READ_RE.findall(body)} - ctes - self.creates
+        self.depends_on = set()  # model names, filled in by load_models()
+        # @indexes and @clustered_by apply to the model's table, its first CREATE TABLE ... AS
+        targets = _ctas_targets(self)
+        self.table = targets[0][0] if targets else None
+        self.indexes = [_config_list(cols or col)
+                        for cols, col in INDEX_RE.findall(self.config.get('indexes', ''))]
+        self.clustered_by = _config_list(self.config.get('clustered_by'))
+        self.partition_by = self.config.get('partition_by')
+        if self.partition_by and (self.clustered_by or not self.table):
+            raise ValueError(f"{self.name}: @partition_by needs a CREATE TABLE ... AS "
+                             f"and can't be combined with @clustered_by")
+
+    def _init_python(self):
+        # the tables come from the header; each is published by statements
+        # that copy it from the TEMP table _build_python() loads it into
+        tables = _config_list(self.config.get('creates'))
+        if not tables:
+            raise ValueError(f"{self.name}: a Python model needs a `# @creates:` header")
+        self.creates = {t.lower() for t in tables}
+        self.reads = {t.lower() for t in _config_list(self.config.get('reads'))} - self.creates
+        self.statements = [sql for t in tables for sql in (
+            f'DROP TABLE IF EXISTS {t}', f'CREATE TABLE {t} AS SELECT * FROM temp."{t}__build"')]
+        # editing the etl module a model imports changes its output too
+        digest = hashlib.sha256(self.sql.encode())
+        etl_dir = os.path.dirname(os.path.abspath(__file__))
+        for names in ETL_IMPORT_RE.findall(self.sql):
+            module = os.path.join(etl_dir, f"{''.join(names)}.py")
+            if os.path.exists(module):
+                with open(module) as f:
+                    digest.update(f.read().encode())
+        self.sql_hash = digest.hexdigest()
+
+    def build(self, conn):
+        """Run a Python model's build(conn): {table: (column definitions, rows) or a SELECT}."""
+        spec = importlib.util.spec_from_file_location(f'models.{self.group}.{self.name}', self.path)
+        module = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(module)
+        tables = {t.lower(): v for t, v in module.build(conn).items()}
+        missing = self.creates - set(tables)
+        if missing:
+            raise ValueError(f"{self.name}: build() returned no {', '.join(sorted(missing))}")
+        return tables
+
+    def __repr__(self):
+        return f'Model({self.group}/{self.name})'
+
+
+def load_models(conn, models_dir=None):
+    """All models keyed by name, with depends_on resolved from table reads."""
+    models_dir = models_dir or MODELS_DIR
+    models = {}
+    for group in MODEL_GROUPS:
+        group_dir = os.path.join(models_dir, group)
         if not os.path.isdir(group_dir):
             print(f"  Skipping {group}/ (not found)")
             continue
+        for filepath in model_files(conn, group_dir):
+            model = Model(filepath, group)
+            models[model.name] = model
+
+    producers = {}
+    for model in models.values():
+        for table in model.creates:
+            producers[table] = model.name
+    for model in models.values():
+        upstream = {producers[t] for t in model.reads if t in producers}
+        for name in _config_list(model.config.get('depends_on')):
+            if name not in models:
+                raise ValueError(f"{model.name}: @depends_on names unknown model '{name}'")
+            upstream.add(name)
+        model.depends_on = upstream - {model.name}
+    _check_acyclic(models)
+    return models
+
+
+def _check_acyclic(models):
+    state = {}  # name -> 'visiting' | 'done'
+
+    def visit(name, path):
+        if state.get(name) == 'done':
+            return
+        if state.get(name) == 'visiting':
+            cycle = path[path.index(name):] + [name]
+            raise ValueError("model dependency cycle: " + ' -> '.join(cycle))
+        state[name] = 'visiting'
+        for dep in models[name].depends_on:
+            visit(dep, path + [name])
+        state[name] = 'done'
+
+    for name in sorted(models):
+        visit(name, [])
+
+
+def _upstream(models, name):
+    out, frontier = set(), set(models[name].depends_on)
+    while frontier:
+        out |= frontier
+        frontier = {d for m in frontier for d in models[m].depends_on} - out
+    return out
+
+
+def select_models(models, selectors):
+    """
+    Names of the models picked by any of the selectors: a model name, or a
+    folder (staging / marts / analytics), with a trailing + to add
+    everything downstream and a leading + to add everything upstream.
+    """
+    selected = set()
+    for selector in selectors:
+        base = selector.strip('+').rstrip('/')
+        if base in models:
+            picked = {base}
+        elif any(m.group == base for m in models.values()):
+            picked = {name for name, m in models.items() if m.group == base}
+        else:
+            raise ValueError(f"--select '{selector}' matches no model or folder")
+        for name in list(picked):
+            if selector.startswith('+'):
+                picked |= _upstream(models, name)
+            if selector.endswith('+'):
+                picked |= _downstream(models, name)
+        selected |= picked
+    return selected
+
+
+def connect(db_path=None):
+    """A warehouse connection set up for running alongside other model builds."""
+    conn = sqlite3.connect(db_path or DB_PATH, timeout=60, isolation_level=None)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA busy_timeout=60000")
+    # ANALYZE samples each index instead of reading all of it
+    conn.execute("PRAGMA analysis_limit=1000")
+    # renaming a shadow table into place must not check or rewrite views that
+    # read the table it replaces (already dropped in the same transaction)
+    conn.execute("PRAGMA legacy_alter_table=ON")
+    # approx_count_distinct() and the hll_* sketch functions
+    hll.register(conn)
+    # activity_bitmap() and bitmap_count()
+    activity.register(conn)
+    return conn
+
+
+MODEL_STATE_COLUMNS = {'watermark': '', 'fingerprint': 'TEXT', 'sql_hash': 'TEXT'}
+
+
+def create_model_state(conn):
+    """Per-model bookkeeping: incremental watermarks and build fingerprints."""
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS etl_model_state (
+            model TEXT PRIMARY KEY,
+            watermark,
+            fingerprint TEXT,
+            sql_hash TEXT,
+            updated_at TEXT NOT NULL
+        )
+    """)
+    # warehouses from before the build cache only have the watermark
+    have = {row[1] for row in conn.execute("PRAGMA table_info(etl_model_state)")}
+    for column, decl in MODEL_STATE_COLUMNS.items():
+        if column not in have:
+            conn.execute(f"ALTER TABLE etl_model_state ADD COLUMN {column} {decl}")
+
+
+def _record_state(conn, model, **values):
+    """Upsert some of etl_model_state's columns for a model."""
+    values['updated_at'] = time.strftime('%Y-%m-%dT%H:%M:%S')
+    cols = ', '.join(values)
+    updates = ', '.join(f'{c} = excluded.{c}' for c in values)
+    conn.execute(
+        f"INSERT INTO etl_model_state (model, {cols}) VALUES (?{', ?' * len(values)}) "
+        f"ON CONFLICT (model) DO UPDATE SET {updates}",
+        (model.name, *values.values()),
+    )
+
+
+def model_states(conn):
+    """{model: (watermark, fingerprint, sql_hash)} as last recorded."""
+    return {row[0]: row[1:] for row in conn.execute(
+        "SELECT model, watermark, fingerprint, sql_hash FROM etl_model_state")}
+
+
+def _table_exists(conn, name):
+    return conn.execute(
+        "SELECT 1 FROM sqlite_master WHERE type IN ('table', 'view') AND name = ?", (name,)
+    ).fetchone() is not None
+
+
+def _ctas_targets(model):
+    """(target, select) for each CREATE TABLE ... AS statement, in file order."""
+    matches = (CTAS_RE.match(COMMENT_RE.sub('', stmt)) for stmt in model.statements)
+    return [m.groups() for m in matches if m]
+
+
+def _partition_name(table, value):
+    return f'{table}__p' + re.sub(r'\W', '_', str(value))
+
+
+def _partitions(conn, table):
+    """The partition tables behind a @partition_by model's view, in name order."""
+    return [name for (name,) in conn.execute(
+        "SELECT name FROM sqlite_master WHERE type = 'table' AND name GLOB ? "
+        "AND name NOT GLOB '*__shadow' ORDER BY name", (f'{table}__p*',))]
+
+
+def _partition_values(conn, model):
+    """{partition: value} for a partitioned model's non-empty partitions."""
+    values = {}
+    for partition in _partitions(conn, model.table):
+        row = conn.execute(f'SELECT "{model.partition_by}" FROM main."{partition}" LIMIT 1').fetchone()
+        if row is not None:
+            values[partition] = row[0]
+    return values
+
+
+def _partition_view(conn, model):
+    """
+    (Re)create a partitioned model's table as a UNION ALL view over its
+    partitions. Each branch selects the partition column as a constant, so
+    the WHERE of a query on the view, pushed down into every branch, is
+    constant false for the other partitions and their scans are skipped.
+    Partitions emptied by an incremental run are dropped.
+    """
+    table, column = model.table, model.partition_by
+    partitions = _partitions(conn, table)
+    values = _partition_values(conn, model)
+    for partition in partitions:
+        if partition not in values and len(partitions) > 1:
+            conn.execute(f'DROP TABLE main."{partition}"')
+    branches = []
+    for partition in _partitions(conn, table):
+        columns = []
+        for _, name, decl, *_ in conn.execute(f'PRAGMA main.table_info("{partition}")'):
+            if name == column and partition in values:
+                literal = conn.execute("SELECT quote(?)", (values[partition],)).fetchone()[0]
+                # the cast keeps the column's type for the tables built from the view
+                columns.append(f'CAST({literal} AS {decl}) AS "{name}"' if decl else f'{literal} AS "{name}"')
+            else:
+                columns.append(f'"{name}"')
+        branches.append(f'SELECT {", ".join(columns)} FROM main."{partition}"')
+    conn.execute(f'DROP VIEW IF EXISTS main."{table}"')
+    conn.execute(f'CREATE VIEW main."{table}" AS\n' + '\nUNION ALL\n'.join(branches))
+
+
+def _drop_target(conn, table):
+    """Drop a model's table, or its partition view and partitions."""
+    row = conn.execute("SELECT type FROM sqlite_master WHERE name = ? AND type IN ('table', 'view')",
+                       (table,)).fetchone()
+    if row:
+        conn.execute(f'DROP {row[0].upper()} main."{table}"')
+    for partition in _partitions(conn, table):
+        conn.execute(f'DROP TABLE main."{partition}"')
+
+
+def _fill_partitions(conn, model, temp_name):
+    """
+    Copy a partitioned model's temp build into one shadow table per value of
+    its partition column. Returns [(shadow, partition)].
+    """
+    column = model.partition_by
+    # left over from a build that failed before its swap
+    for (name,) in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table' AND name GLOB ?",
+                                (f'{model.table}__p*__shadow',)).fetchall():
+        conn.execute(f'DROP TABLE main."{name}"')
+    values = [v for (v,) in conn.execute(f'SELECT DISTINCT "{column}" FROM temp."{temp_name}"')]
+    shadows = []
+    # an empty build still gets one (empty) partition, the view needs a table to select from
+    for value in values or [None]:
+        partition = _partition_name(model.table, value)
+        conn.execute(f'CREATE TABLE main."{partition}__shadow" AS '
+                     f'SELECT * FROM temp."{temp_name}" WHERE "{column}" IS ?', (value,))
+        shadows.append((f'{partition}__shadow', partition))
+    return shadows
 
-        sql_files = sorted(glob.glob(os.path.join(group_dir, '*.sql')))
-        print(f"\n--- {group.upper()} ({len(sql_files)} models) ---")
 
-        for filepath in sql_files:
-            name = os.path.basename(filepath)
+def query_plan(conn, model):
+    """
+    EXPLAIN QUERY PLAN of the model's main SELECT (its first CREATE TABLE
+    ... AS) as indented lines, plus the lines worth a look: full scans and
+    temp B-trees for GROUP BY / DISTINCT.
+    """
+    targets = _ctas_targets(model)
+    if not targets or model.python:
+        return [], []
+    rows = conn.execute(f'EXPLAIN QUERY PLAN {targets[0][1]}').fetchall()
+    depth = {0: -1}
+    plan, flags = [], []
+    for node, parent, _, detail in rows:
+        depth[node] = depth.get(parent, -1) + 1
+        plan.append('  ' * depth[node] + detail)
+        if (detail.startswith('SCAN ') and detail != 'SCAN CONSTANT ROW') \
+                or re.match(r'USE TEMP B-TREE FOR (GROUP BY|DISTINCT)', detail):
+            flags.append(detail)
+    return plan, flags
+
+
+def _table_bytes(conn, tables):
+    """Bytes the given tables and their indexes take up, or None without dbstat."""
+    size = 0
+    try:
+        for table in [p for t in tables for p in [t, *_partitions(conn, t)]]:
+            for (name,) in conn.execute(
+                    "SELECT name FROM sqlite_master WHERE tbl_name = ? AND type IN ('table', 'index')",
+                    (table,)):
+                size += conn.execute(
+                    "SELECT pgsize FROM dbstat WHERE name = ? AND aggregate = TRUE", (name,)
+                ).fetchone()[0] or 0
+    except sqlite3.OperationalError:
+        return None
+    return size
+
+
+def _build_temp(conn, model):
+    """
+    Compute each CREATE TABLE ... AS SELECT of the model into a TEMP table,
+    outside any write transaction. Returns {statement index: (target, temp name)}.
+    """
+    if model.python:
+        return _build_python(conn, model)
+    built = {}
+    for i, stmt in enumerate(model.statements):
+        match = CTAS_RE.match(COMMENT_RE.sub('', stmt))
+        if match:
+            target, select = match.groups()
+            temp_name = f'{target}__build'
+            conn.execute(f'DROP TABLE IF EXISTS temp."{temp_name}"')
+            conn.execute(f'CREATE TEMP TABLE "{temp_name}" AS {select}')
+            if target == model.table and model.partition_by:
+                # partitions are cut out of the build one value at a time
+                conn.execute(f'CREATE INDEX temp."{temp_name}_partition" '
+                             f'ON "{temp_name}" ("{model.partition_by}")')
+            built[i] = (target, temp_name)
+    return built
+
+
+def _build_python(conn, model):
+    """_build_temp() for a Python model: its build() output loaded into TEMP tables."""
+    tables = model.build(conn)
+    built = {}
+    for i, stmt in enumerate(model.statements):
+        match = CTAS_RE.match(stmt)
+        if match:
+            target = match.group(1)
+            temp_name = f'{target}__build'
+            conn.execute(f'DROP TABLE IF EXISTS temp."{temp_name}"')
+            built[i] = (target, temp_name)
+            if isinstance(tables[target.lower()], str):
+                conn.execute(f'CREATE TEMP TABLE "{temp_name}" AS {tables[target.lower()]}')
+                continue
+            columns, rows = tables[target.lower()]
+            conn.execute(f'CREATE TEMP TABLE "{temp_name}" ({", ".join(columns)})')
+            conn.execute("BEGIN")
+            conn.executemany(f'INSERT INTO temp."{temp_name}" VALUES ({", ".join("?" * len(columns))})', rows)
+            conn.execute("COMMIT")
+    return built
+
+
+def _publish_sql(conn, model, target, temp_name, dest):
+    """
+    Statements that create table dest for a target from its temp build: a
+    plain copy, or for a @clustered_by table an explicit WITHOUT ROWID table
+    with the same column types the copy would have had, filled from the build.
+    """
+    if target != model.table or not model.clustered_by:
+        return [f'CREATE TABLE main."{dest}" AS SELECT * FROM temp."{temp_name}"']
+    columns = ', '.join(f'"{name}" {decl}'.rstrip()
+                        for _, name, decl, *_ in conn.execute(f'PRAGMA temp.table_info("{temp_name}")'))
+    key = ', '.join(f'"{c}"' for c in model.clustered_by)
+    return [f'CREATE TABLE main."{dest}" ({columns}, PRIMARY KEY ({key})) WITHOUT ROWID',
+            f'INSERT INTO main."{dest}" SELECT * FROM temp."{temp_name}"']
+
+
+def _index_table(conn, model, extra=(), tables=None):
+    """
+    Create the model's @indexes (and any extra column lists) on its table,
+    or on each of `tables` (default: all its partitions) when it is
+    partitioned, then ANALYZE them.
+    """
+    if not model.table:
+        return
+    if tables is None:
+        tables = _partitions(conn, model.table) if model.partition_by else [model.table]
+    for table in tables:
+        for cols in [*model.indexes, *extra]:
+            name = f'idx_{table}_' + '_'.join(cols)
+            columns = ', '.join(f'"{c}"' for c in cols)
+            conn.execute(f'CREATE INDEX IF NOT EXISTS "{name}" ON "{table}" ({columns})')
+        conn.execute(f'ANALYZE main."{table}"')
+
+
+def _run_statements(conn, model, staged, on_commit=None, report=None, extra_indexes=()):
+    """
+    Full build, done so that readers never see a missing or half-built
+    table. Each CREATE TABLE ... AS first fills a shadow table,
+    "<target>__shadow", and commits it. Then one short transaction runs the
+    model's statements in file order, with each CREATE TABLE ... AS
+    replaced by dropping the old table and renaming its shadow into place,
+    and builds the indexes and statistics and calls on_commit. In WAL mode
+    readers keep their snapshot of the previous version until that commits.
+    A partitioned table gets one shadow per partition, and the swap
+    replaces the whole set and recreates the view over it.
+
+    Indexing happens after the fill has committed because indexing a big
+    table in the transaction that filled it costs about twice as much (its
+    dirty pages spill to the WAL first).
+    """
+    if report is not None:
+        report['plan'], report['flags'] = query_plan(conn, model)
+    # a clustered table is declared before it is filled, which needs the
+    # build's column types, partitions are cut out of a finished build and
+    # a Python model's tables only exist as builds
+    built = _build_temp(conn, model) \
+        if staged or model.clustered_by or model.partition_by or model.python else {}
+    shadows = {}  # statement index -> (target, [(shadow, final name)])
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        for i, stmt in enumerate(model.statements):
+            match = CTAS_RE.match(COMMENT_RE.sub('', stmt))
+            if not match:
+                continue
+            target, select = match.groups()
+            if target == model.table and model.partition_by:
+                shadows[i] = (target, _fill_partitions(conn, model, built[i][1]))
+                continue
+            shadow = f'{target}__shadow'
+            shadows[i] = (target, [(shadow, target)])
+            # left over from a build that failed before its swap
+            conn.execute(f'DROP TABLE IF EXISTS main."{shadow}"')
+            if i in built:
+                for sql in _publish_sql(conn, model, target, built[i][1], shadow):
+                    conn.execute(sql)
+            else:
+                conn.execute(f'CREATE TABLE main."{shadow}" AS {select}')
+        conn.execute("COMMIT")
+
+        targets = {target.lower() for target, _ in shadows.values()}
+        conn.execute("BEGIN IMMEDIATE")
+        for i, stmt in enumerate(model.statements):
+            drop = DROP_RE.match(COMMENT_RE.sub('', stmt))
+            if i in shadows:
+                target, renames = shadows[i]
+                _drop_target(conn, target)
+                for shadow, name in renames:
+                    conn.execute(f'ALTER TABLE main."{shadow}" RENAME TO "{name}"')
+                if target == model.table and model.partition_by:
+                    _partition_view(conn, model)
+            elif drop and drop.group(1).lower() in targets:
+                # the swap drops the target, whether it's a table or a partition view
+                continue
+            else:
+                conn.execute(stmt)
+        _index_table(conn, model, extra_indexes)
+        if on_commit:
+            on_commit()
+        conn.execute("COMMIT")
+    except Exception:
+        if conn.in_transaction:
+            conn.execute("ROLLBACK")
+        raise
+
+
+def _column_max(conn, table, column):
+    # MAX() on a partition view scans every partition, on each partition it's an index lookup
+    maxes = [conn.execute(f'SELECT MAX("{column}") FROM main."{t}"').fetchone()[0]
+             for t in _partitions(conn, table) or [table]]
+    maxes = [m for m in maxes if m is not None]
+    return max(maxes) if maxes else None
+
+
+def _upsert_partitions(conn, model, temp_name, key):
+    """
+    Replace the rows of a partitioned table that share a key with the temp
+    build, writing only to the partitions they are in or go to. A new
+    partition value gets a new partition. Returns the partitions written.
+    """
+    column = model.partition_by
+    existing = _partitions(conn, model.table)
+    touched = set()
+    for partition in existing:
+        deleted = conn.execute(f'DELETE FROM main."{partition}" '
+                               f'WHERE "{key}" IN (SELECT "{key}" FROM temp."{temp_name}")').rowcount
+        if deleted:
+            touched.add(partition)
+    reshaped = False
+    for (value,) in conn.execute(f'SELECT DISTINCT "{column}" FROM temp."{temp_name}"').fetchall():
+        partition = _partition_name(model.table, value)
+        select = f'SELECT * FROM temp."{temp_name}" WHERE "{column}" IS ?'
+        if partition in existing:
+            conn.execute(f'INSERT INTO main."{partition}" {select}', (value,))
+        else:
+            conn.execute(f'CREATE TABLE main."{partition}" AS {select}', (value,))
+            reshaped = True
+        touched.add(partition)
+    if reshaped or any(conn.execute(f'SELECT 1 FROM main."{p}" LIMIT 1').fetchone() is None for p in touched):
+        _partition_view(conn, model)
+    return sorted(touched & set(_partitions(conn, model.table)))
+
+
+def _lower_bound(conn, watermark, lookback):
+    """Watermark minus the lookback window: '3 days' style for timestamps, a number otherwise."""
+    if not lookback:
+        return watermark
+    if isinstance(watermark, str):
+        return conn.execute(
+            "SELECT strftime('%Y-%m-%dT%H:%M:%S', ?, ?)", (watermark, f'-{lookback}')
+        ).fetchone()[0]
+    return watermark - float(lookback)
+
+
+def _run_incremental(conn, model, staged, full_refresh=False, built_state=None, report=None):
+    """
+    Incremental materialization. The first build (or one with the target or
+    its watermark missing, after an edit to the model's SQL, or with
+    full_refresh) is a normal full build. After that only rows of
+    @source past the stored @watermark, less the @lookback window, are
+    processed: a TEMP view with the source's name shadows it for the model's
+    SELECT, limited to every source row sharing a @unique_key with a new
+    row, so aggregates like sessions are recomputed whole. The rebuilt keys
+    then replace the old ones in the target, for a partitioned target only
+    in the partitions that hold or receive them.
+
+    With a @lookback the window behind the watermark is reprocessed on
+    every run, even when the source's maximum hasn't moved: a late row
+    lands behind the maximum and wouldn't move it.
+    """
+    cfg = model.config
+    source, column, key = cfg['source'], cfg['watermark'], cfg['unique_key']
+    lookback = cfg.get('lookback')
+    targets = _ctas_targets(model)
+    if len(targets) != 1:
+        raise ValueError(f"{model.name}: incremental models need exactly one CREATE TABLE ... AS")
+    target = targets[0][0]
+    report = {} if report is None else report
+
+    built_state = built_state or {}
+    watermark, _, sql_hash = model_states(conn).get(model.name, (None, None, None))
+    # read the new high-water mark before building: rows landing mid-build
+    # get processed again next run, which the key upsert makes harmless
+    high = _column_max(conn, source, column)
+
+    if (full_refresh or watermark is None or sql_hash != model.sql_hash
+            or not _table_exists(conn, target)):
+        _run_statements(conn, model, staged, report=report, extra_indexes=[[key]],
+                        on_commit=lambda: _record_state(conn, model, watermark=high, **built_state))
+        return 'full'
+    if high is None or (high <= watermark and not lookback):
+        _record_state(conn, model, **built_state)
+        report['rows'] = 0
+        return 'up to date'
+    high = max(high, watermark)
+
+    lower = conn.execute("SELECT quote(?)", (_lower_bound(conn, watermark, lookback),)).fetchone()[0]
+    changed = f'SELECT "{key}" FROM main."{source}" WHERE "{column}" > {lower}'
+    partitions = _partitions(conn, source)
+    conn.execute(f'DROP VIEW IF EXISTS temp."{source}"')
+    conn.execute(f'DROP TABLE IF EXISTS temp."{source}__changed"')
+    if partitions:
+        # SQLite doesn't push an IN (subquery) down into the branches of a
+        # partition view, so the keys are looked up once and each partition
+        # is filtered on its own
+        conn.execute(f'CREATE TEMP TABLE "{source}__changed" AS {changed}')
+        conn.execute(f'CREATE TEMP VIEW "{source}" AS\n' + '\nUNION ALL\n'.join(
+            f'SELECT * FROM main."{p}" WHERE "{key}" IN (SELECT "{key}" FROM temp."{source}__changed")'
+            for p in partitions))
+    else:
+        conn.execute(f'CREATE TEMP VIEW "{source}" AS SELECT * FROM main."{source}" WHERE "{key}" IN ({changed})')
+    try:
+        # the plan that matters is the one against the shadowed source
+        report['plan'], report['flags'] = query_plan(conn, model)
+        (_, temp_name), = _build_temp(conn, model).values()
+    finally:
+        conn.execute(f'DROP VIEW temp."{source}"')
+        conn.execute(f'DROP TABLE IF EXISTS temp."{source}__changed"')
+    rows = report['rows'] = conn.execute(f'SELECT COUNT(*) FROM temp."{temp_name}"').fetchone()[0]
+
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        if model.partition_by:
+            _index_table(conn, model, [[key]], _upsert_partitions(conn, model, temp_name, key))
+        else:
+            conn.execute(f'DELETE FROM main."{target}" WHERE "{key}" IN (SELECT "{key}" FROM temp."{temp_name}")')
+            conn.execute(f'INSERT INTO main."{target}" SELECT * FROM temp."{temp_name}"')
+            _index_table(conn, model, [[key]])
+        _record_state(conn, model, watermark=high, **built_state)
+        conn.execute("COMMIT")
+    except Exception:
+        conn.execute("ROLLBACK")
+        raise
+    conn.execute(f'DROP TABLE temp."{temp_name}"')
+    return f'incremental, {rows:,} rows'
+
+
+def run_model(model, db_path=None, staged=True, full_refresh=False, fingerprint=None):
+    """
+    Build one model on its own connection. SQLite allows one writer at a
+    time, so when other models run alongside (staged=True) the expensive
+    part — the SELECT behind each CREATE TABLE ... AS — is computed into a
+    connection-private TEMP table first, without holding the write lock,
+    and only copied into its shadow table under it. The swap that puts the
+    shadows in place also records the build's fingerprint.
+
+    Returns a report: seconds, what was done (detail), rows written, bytes
+    the model's tables grew by, and the query plan of its main SELECT with
+    anything worth flagging.
+    """
+    started = time.perf_counter()
+    conn = connect(db_path)
+    report = {}
+    try:
+        bytes_before = _table_bytes(conn, model.creates)
+        built_state = {'fingerprint': fingerprint, 'sql_hash': model.sql_hash}
+        if model.config.get('materialized') == 'incremental':
+            report['detail'] = _run_incremental(conn, model, staged, full_refresh, built_state, report)
+        else:
+            _run_statements(conn, model, staged,
+                            on_commit=lambda: _record_state(conn, model, **built_state), report=report)
+            report['detail'] = 'full'
+        report['seconds'] = time.perf_counter() - started
+        if 'rows' not in report:
+            report['rows'] = sum(conn.execute(f'SELECT COUNT(*) FROM main."{target}"').fetchone()[0]
+                                 for target, _ in _ctas_targets(model))
+        bytes_after = _table_bytes(conn, model.creates)
+        if bytes_before is not None and bytes_after is not None:
+            report['bytes_added'] = bytes_after - bytes_before
+    finally:
+        conn.close()
+    return report
+
+
+def check_incremental(models, db_path=None):
+    """
+    Rebuild each incremental model's table in full, into a TEMP table, and
+    compare it with the table incremental runs have maintained. Returns
+    {table: what differs} for the ones a --full-refresh would change.
+    """
+    conn = connect(db_path)
+    problems = {}
+    try:
+        for name in sorted(models):
+            model = models[name]
+            if model.config.get('materialized') != 'incremental' or not _table_exists(conn, model.table):
+                continue
+            table = model.table
             try:
-                run_sql_file(conn, filepath)
-                print(f"  OK  {name}")
-            except Exception as e:
-                print(f"  ERR {name}: {e}")
+                (_, temp_name), = _build_temp(conn, model).values()
+                rows, full = conn.execute(f'SELECT (SELECT COUNT(*) FROM main."{table}"), '
+                                          f'(SELECT COUNT(*) FROM temp."{temp_name}")').fetchone()
+                # EXCEPT both ways, a row that differs is missing from one and extra in the other
+                missing, extra = (conn.execute(f'SELECT COUNT(*) FROM (SELECT * FROM {a} EXCEPT SELECT * FROM {b})')
+                                  .fetchone()[0] for a, b in [(f'temp."{temp_name}"', f'main."{table}"'),
+                                                              (f'main."{table}"', f'temp."{temp_name}"')])
+                conn.execute(f'DROP TABLE temp."{temp_name}"')
+            except sqlite3.Error as e:
+                problems[table] = f'not comparable: {e}'
+                continue
+            if rows != full or missing or extra:
+                problems[table] = (f'{rows:,} rows vs {full:,} in a full build, '
+                                   f'{missing:,} of those missing, {extra:,} not in it')
+    finally:
+        conn.close()
+    return problems
+
 
+def print_check(models, problems):
+    tables = sorted(m.table for m in models.values() if m.config.get('materialized') == 'incremental')
+    for table in tables:
+        print(f"  {'DIFF' if table in problems else 'same'}  {table}"
+              f"{': ' + problems[table] if table in problems else ''}")
+    print(f"  {len(tables) - len(problems)}/{len(tables)} incremental tables match a full build")
+
+
+def source_version(conn, name):
+    """
+    Cheap row-version of a table the models read but don't build. The raw
+    layer is append-only, so row count plus max rowid changes whenever it
+    does; a view is versioned by its SQL and the tables behind it.
+    """
+    row = conn.execute(
+        "SELECT type, sql FROM sqlite_master WHERE name = ? COLLATE NOCASE", (name,)
+    ).fetchone()
+    if row is None:
+        return None
+    kind, sql = row
+    if kind == 'view':
+        body = COMMENT_RE.sub('', sql)
+        reads = {n.lower() for n in READ_RE.findall(body)} - {n.lower() for n in CTE_RE.findall(body)}
+        return [sql, {t: source_version(conn, t) for t in sorted(reads)}]
+    try:
+        return list(conn.execute(f'SELECT COUNT(*), MAX(rowid) FROM "{name}"').fetchone())
+    except sqlite3.OperationalError:
+        # WITHOUT ROWID
+        return list(conn.execute(f'SELECT COUNT(*) FROM "{name}"').fetchone())
+
+
+def model_fingerprint(model, upstream, sources):
+    """
+    Hash of everything a build depends on: the model's SQL, the fingerprints
+    of the models it reads and the versions of the source tables it reads.
+    `-- @cache: daily` also folds in today's date, so the model rebuilds
+    once a day rather than never, as does SQL that uses 'now' outside its
+    comments. `-- @cache: false` opts a model out.
+    """
+    cache = model.config.get('cache', '').lower()
+    if cache == 'false':
+        # never matches a stored one, and changes what downstream models see
+        return uuid.uuid4().hex
+    inputs = {
+        'sql': model.sql_hash,
+        'models': {name: upstream[name] for name in sorted(model.depends_on)},
+        'sources': {t: sources.get(t) for t in sorted(model.reads) if t in sources},
+    }
+    if cache == 'daily' or (not model.python and "'now'" in COMMENT_RE.sub('', model.sql).lower()):
+        inputs['today'] = time.strftime('%Y-%m-%d')
+    return hashlib.sha256(json.dumps(inputs, sort_keys=True, default=str).encode()).hexdigest()
+
+
+def run_dag(models, workers=None, db_path=None, full_refresh=False, selected=None):
+    """
+    Run models as their dependencies finish, up to `workers` at a time.
+    Only the `selected` names run (default: all), the others are taken as
+    already built. Models whose fingerprint matches their last build are
+    skipped unless full_refresh. A failed model's downstream models are
+    skipped. Returns {name: report} where each report has a status ('ok',
+    'cached', 'error' or 'skipped') and seconds, plus run_model()'s details
+    for built models.
+    """
+    workers = workers or os.cpu_count() or 1
+    selected = set(models) if selected is None else set(selected)
+    pending = {name: models[name].depends_on & selected for name in selected}
+    results = {}
+    # with one worker there is nothing to overlap, so skip the temp staging
+    staged = workers > 1
+
+    conn = connect(db_path)
+    states = model_states(conn)
+    built = set()
+    for model in models.values():
+        built |= model.creates
+    # the raw layer doesn't change during a run, version each source table once
+    sources = {t: source_version(conn, t)
+               for t in sorted({t for m in models.values() for t in m.reads} - built)}
+    # a model outside the selection stands as last built
+    fingerprints = {name: states.get(name, (None, None, None))[1]
+                    for name in models if name not in selected}
+
+    def finished(name):
+        for deps in pending.values():
+            deps.discard(name)
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        running = {}
+        while pending or running:
+            ready = sorted(name for name, deps in pending.items() if not deps)
+            while ready:
+                for name in ready:
+                    del pending[name]
+                    model = models[name]
+                    fingerprints[name] = fp = model_fingerprint(model, fingerprints, sources)
+                    cached = (not full_refresh
+                              and states.get(name, (None, None, None))[1] == fp
+                              and all(_table_exists(conn, t) for t in model.creates))
+                    if cached:
+                        results[name] = {'status': 'cached', 'seconds': 0.0}
+                        print(f"  --  {model.group}/{os.path.basename(model.path)}  (cached)")
+                        finished(name)
+                    else:
+                        future = pool.submit(run_model, model, db_path, staged, full_refresh, fp)
+                        running[future] = name
+                # cache hits can make more models ready straight away
+                ready = sorted(name for name, deps in pending.items() if not deps)
+
+            if not running:
+                break
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                name = running.pop(future)
+                model = models[name]
+                try:
+                    report = results[name] = {'status': 'ok', **future.result()}
+                    note = '' if report['detail'] == 'full' else f", {report['detail']}"
+                    print(f"  OK  {model.group}/{os.path.basename(model.path)}  "
+                          f"({report['seconds']:.2f}s{note})")
+                    finished(name)
+                except Exception as e:
+                    results[name] = {'status': 'error', 'seconds': 0.0, 'error': str(e)}
+                    print(f"  ERR {model.group}/{os.path.basename(model.path)}: {e}")
+                    for skipped in _downstream(models, name) & set(pending):
+                        del pending[skipped]
+                        results[skipped] = {'status': 'skipped', 'seconds': 0.0}
+                        print(f"  SKIP {models[skipped].group}/{skipped} (upstream {name} failed)")
+    conn.close()
+    return results
+
+
+def _downstream(models, name):
+    out, frontier = set(), {name}
+    while frontier:
+        frontier = {m for m, model in models.items() if model.depends_on & frontier} - out
+        out |= frontier
+    return out
+
+
+def critical_path(models, results):
+    """Seconds along the slowest dependency chain — the floor for wall time."""
+    memo = {}
+
+    def finish(name):
+        if name not in memo:
+            seconds = results.get(name, {}).get('seconds', 0.0)
+            memo[name] = seconds + max((finish(d) for d in models[name].depends_on), default=0.0)
+        return memo[name]
+
+    return max((finish(name) for name in models), default=0.0)
+
+
+def run_models(workers=None, full_refresh=False, backend='sqlite', parity=False, select=None, check=False):
+    """
+    Run all SQL models, or those picked by the `select` selectors (see
+    select_models()), as many at once as their dependencies allow,
+    skipping the ones whose inputs haven't changed since their last build.
+    With backend='duckdb' they are built in data/warehouse.duckdb instead,
+    from this warehouse's raw tables. parity=True then compares the model
+    tables of the two. check=True compares each incremental table with a
+    full build of it (see check_incremental()).
+    """
+    conn = connect()
+    create_model_state(conn)
+    models = load_models(conn)
     conn.close()
+    selected = select_models(models, select) if select else set(models)
+
+    if backend == 'duckdb':
+        if select:
+            # DuckDB builds everything from the raw tables, there is nothing to build on
+            raise ValueError("--select only applies to the sqlite backend")
+        # only imported here, the SQLite path doesn't need duckdb installed
+        from etl import duckdb_backend
+        print(f"\n--- {len(models)} models on DuckDB, {workers or 'all'} threads ---")
+        started = time.perf_counter()
+        duckdb_backend.run_models(models, DB_PATH, threads=workers)
+        print(f"\n  wall {time.perf_counter() - started:.2f}s")
+        if parity:
+            print("\n--- parity with the SQLite warehouse ---")
+            duckdb_backend.print_parity(models, duckdb_backend.compare_backends(models, DB_PATH))
+        return
+
+    picked = f"{len(selected)} of {len(models)} models ({' '.join(select)})" if select else f"{len(models)} models"
+    print(f"\n--- {picked}, {workers or os.cpu_count() or 1} workers"
+          f"{', full refresh' if full_refresh else ''} ---")
+    started = time.perf_counter()
+    results = run_dag(models, workers, full_refresh=full_refresh, selected=selected)
+    wall = time.perf_counter() - started
+
+    total = sum(r['seconds'] for r in results.values())
+    cached = sum(1 for r in results.values() if r['status'] == 'cached')
+    path = critical_path(models, results)
+    print(f"\n  wall {wall:.2f}s | sum of models {total:.2f}s | "
+          f"critical path {path:.2f}s | {cached} cached")
+
+    run = {
+        'finished_at': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'workers': workers or os.cpu_count() or 1,
+        'full_refresh': full_refresh,
+        'select': select or [],
+        'wall_seconds': round(wall, 3),
+        'critical_path_seconds': round(path, 3),
+        'models': {
+            name: {'group': models[name].group, **{k: round(v, 3) if k == 'seconds' else v
+                                                     for k, v in results[name].items()}}
+            for name in sorted(results)
+        },
+    }
+    previous = write_run_results(run)
+    if previous:
+        print_comparison(compare_runs(previous, run))
+    if parity:
+        from etl import duckdb_backend
+        print("\n--- parity with the DuckDB warehouse ---")
+        duckdb_backend.print_parity(models, duckdb_backend.compare_backends(models, DB_PATH))
+    if check:
+        print("\n--- incremental tables against a full build ---")
+        print_check(models, check_incremental(models))
     print("\nAll transformations complete.")
 
 
+def drop_old_partitions(keep_months, db_path=None):
+    """
+    Retention for the partitioned models: drop all but the newest
+    keep_months partitions of each, one DROP TABLE per month rather than a
+    big DELETE. Incremental models keep only what they have; a full build
+    (--full-refresh, an edit to the SQL) brings the old months back. The
+    models downstream of a trimmed table lose their build fingerprint, so
+    the next run rebuilds them. Returns {table: [dropped partitions]}.
+    """
+    if keep_months < 1:
+        raise ValueError("keep_months must be at least 1")
+    conn = connect(db_path)
+    create_model_state(conn)
+    models = load_models(conn)
+    dropped = {}
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        for model in models.values():
+            if not model.partition_by or not _table_exists(conn, model.table):
+                continue
+            values = _partition_values(conn, model)
+            # rows without a partition value count as the oldest
+            old = sorted(values, key=lambda p: (values[p] is not None, values[p]))[:-keep_months]
+            if old:
+                for partition in old:
+                    conn.execute(f'DROP TABLE main."{partition}"')
+                _partition_view(conn, model)
+                dropped[model.name] = old
+        stale = set()
+        for name in dropped:
+            stale |= _downstream(models, name)
+        conn.executemany("UPDATE etl_model_state SET fingerprint = NULL WHERE model = ?",
+                         [(name,) for name in sorted(stale)])
+        conn.execute("COMMIT")
+    except Exception:
+        if conn.in_transaction:
+            conn.execute("ROLLBACK")
+        raise
+    finally:
+        conn.close()
+    return {models[name].table: old for name, old in dropped.items()}
+
+
+def write_run_results(run, path=None):
+    """
+    Save this run as run_results.json, keeping the last one next to it as
+    run_results.prev.json. Returns the previous run, if there was one.
+    """
+    path = path or RUN_RESULTS_PATH
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    previous = None
+    if os.path.exists(path):
+        with open(path) as f:
+            previous = json.load(f)
+        os.replace(path, path.replace('.json', '.prev.json'))
+    with open(path, 'w') as f:
+        json.dump(run, f, indent=2)
+    print(f"  run results: {path}")
+    return previous
+
+
+def compare_runs(old, new, min_ratio=1.25, min_seconds=0.05):
+    """
+    Per-model timing between two runs, for models built in both: the ones
+    at least min_ratio times and min_seconds slower or faster, and the ones
+    whose query plan picked up flags it didn't have before. Cached or
+    skipped models are left out, they didn't do the work.
+    """
+    slower, faster, new_flags = [], [], []
+    for name, now in new['models'].items():
+        before = old['models'].get(name)
+        if not before or before['status'] != 'ok' or now['status'] != 'ok':
+            continue
+        if now['seconds'] >= before['seconds'] * min_ratio and now['seconds'] - before['seconds'] >= min_seconds:
+            slower.append((name, before['seconds'], now['seconds']))
+        elif before['seconds'] >= now['seconds'] * min_ratio and before['seconds'] - now['seconds'] >= min_seconds:
+            faster.append((name, before['seconds'], now['seconds']))
+        added = [f for f in now.get('flags', []) if f not in before.get('flags', [])]
+        if added:
+            new_flags.append((name, added))
+    return {
+        'slower': sorted(slower, key=lambda r: r[1] - r[2]),
+        'faster': sorted(faster, key=lambda r: r[2] - r[1]),
+        'new_flags': new_flags,
+    }
+
+
+def print_comparison(diff):
+    for name, before, now in diff.get('faster', []):
+        print(f"  FASTER {name}: {before:.2f}s -> {now:.2f}s ({before / max(now, 1e-9):.1f}x speedup)")
+    if not diff['slower'] and not diff['new_flags']:
+        print("  no regressions against the previous run")
+        return
+    for name, before, now in diff['slower']:
+        print(f"  SLOWER {name}: {before:.2f}s -> {now:.2f}s ({now / max(before, 1e-9):.1f}x)")
+    for name, flags in diff['new_flags']:
+        for flag in flags:
+            print(f"  NEW PLAN STEP {name}: {flag}")
+
+
 if __name__ == '__main__':
-    run_models()
+    parser = argparse.ArgumentParser(description='Run the SQL models against the warehouse.')
+    parser.add_argument('--workers', type=int, default=None,
+                        help='models to run at once (default: CPU count); '
+                             'with --backend duckdb, threads per query')
+    parser.add_argument('--full-refresh', action='store_true',
+                        help='rebuild every model from scratch, ignoring the build cache '
+                             'and incremental watermarks')
+    parser.add_argument('--backend', choices=['sqlite', 'duckdb'], default='sqlite',
+                        help='engine to build the models with (duckdb: data/warehouse.duckdb)')
+    parser.add_argument('--parity', action='store_true',
+                        help='after the run, compare every model table between the SQLite '
+                             'and DuckDB warehouses')
+    parser.add_argument('--check-incremental', action='store_true',
+                        help='after the run, rebuild every incremental model in full and '
+                             'compare it with the table incremental runs have kept')
+    parser.add_argument('--compare', nargs=2, metavar=('OLD', 'NEW'),
+                        help='compare two run_results.json files instead of running')
+    parser.add_argument('--select', '-s', nargs='+', metavar='SELECTOR',
+                        help='run only these models: name, name+ (and downstream), '
+                             '+name (and upstream), or a folder such as marts')
+    parser.add_argument('--keep-months', type=int, metavar='N',
+                        help='instead of running, drop all but the newest N month '
+                             'partitions of every partitioned model')
+    args = parser.parse_args()
+    if args.keep_months is not None:
+        for table, partitions in drop_old_partitions(args.keep_months).items():
+            print(f"  {table}: dropped {len(partitions)} partitions ({', '.join(partitions)})")
+    elif args.compare:
+        with open(args.compare[0]) as f_old, open(args.compare[1]) as f_new:
+            print_comparison(compare_runs(json.load(f_old), json.load(f_new)))
+    else:
+        run_models(workers=args.workers, full_refresh=args.full_refresh,
+                   backend=args.backend, parity=args.parity, select=args.select,
+                   check=args.check_incremental)
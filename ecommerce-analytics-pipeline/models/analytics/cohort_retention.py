@@ -0,0 +1,47 @@
+# COHORT RETENTION ANALYSIS
+# group customers by signup month, track purchasing activity over time
+# this shows if customers stick around or churn
+# active customers per period come from the activity bitmaps in
+# fact_customer_activity (see etl/activity.py), not from the orders
+# @reads: fact_customer_activity, dim_customers, stg_orders
+# @creates: analytics_cohort_retention, analytics_retention
+
+from etl.activity import Retention, period_label
+
+# month keys are year * 12 + month - 1, numpy's months count from 1970-01
+MONTH_KEY_BASE = 1970 * 12
+
+COHORT_COLUMNS = ['cohort_month TEXT', 'activity_month TEXT', 'active_customers INTEGER',
+                  'total_in_cohort INTEGER', 'retention_rate REAL', 'cohort_revenue REAL',
+                  'avg_order_value REAL', 'months_since_signup INTEGER']
+
+# granularity -> periods since signup kept (day 0..30 for daily)
+GRANULARITIES = {'day': 30, 'week': None, 'month': None}
+BREAKDOWNS = ['acquisition_channel']
+
+
+def build(conn):
+    retention = {g: Retention(g, horizon).compute(conn, breakdowns=BREAKDOWNS)
+                 for g, horizon in GRANULARITIES.items()}
+
+    # revenue still needs the order amounts, one grouped pass over them
+    revenue = {(cohort, month): (total, avg) for cohort, month, total, avg in conn.execute("""
+        SELECT c.cohort_month_key, o.order_month_key, SUM(o.total), ROUND(AVG(o.total), 2)
+        FROM stg_orders o
+        JOIN dim_customers c ON c.customer_id = o.customer_id
+        GROUP BY c.cohort_month_key, o.order_month_key
+    """)}
+    cohorts = []
+    for _, cohort, dimension, _, months, active, total, rate in retention['month'][1]:
+        if dimension != 'all':
+            continue
+        key = int(cohort[:4]) * 12 + int(cohort[5:]) - 1
+        activity_key = key + months
+        cohorts.append((cohort, period_label(activity_key - MONTH_KEY_BASE, 'month'), active, total, rate,
+                        *revenue.get((key, activity_key), (None, None)), months))
+
+    return {
+        'analytics_cohort_retention': (COHORT_COLUMNS, cohorts),
+        # daily, weekly and monthly cohorts, overall and per acquisition channel
+        'analytics_retention': (retention['day'][0], [row for _, rows in retention.values() for row in rows]),
+    }
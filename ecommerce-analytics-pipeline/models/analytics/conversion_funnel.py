@@ -0,0 +1,24 @@
+# CONVERSION FUNNEL ANALYSIS
+# track drop-off at each stage of the purchase journey
+# each stage counted on its own, all in one pass over stg_events; pass
+# order='strict' to Funnel to count a stage only after the one before it
+# (see etl/funnel.py)
+# @reads: stg_events
+# @creates: analytics_funnel, analytics_funnel_breakdown, analytics_funnel_timing
+
+from etl.funnel import Funnel
+
+STEPS = ['page_view', 'product_view', 'add_to_cart', 'checkout_start', 'checkout_complete']
+BREAKDOWNS = ['attribution_channel', 'device_type']
+
+
+def build(conn):
+    result = Funnel(STEPS).compute(conn, 'stg_events', BREAKDOWNS)
+    return {
+        'analytics_funnel': result['funnel'],
+        # the same funnel per channel and per device, pct_of_total within each
+        'analytics_funnel_breakdown': result['breakdown'],
+        # seconds from each stage to the next, for the sessions that made it
+        # in order (always strict, so never negative, see etl/funnel.py)
+        'analytics_funnel_timing': result['timing'],
+    }
@@ -16,7 +16,7 @@ SELECT
     -- avg days between first seen and last order
     ROUND(AVG(
         CASE WHEN last_order_date IS NOT NULL
-            THEN julianday(last_order_date) - julianday(first_seen_at)
+            THEN (last_order_epoch - first_seen_epoch) / 86400.0
             ELSE 0
         END
     ), 0) AS avg_days_to_last_order,
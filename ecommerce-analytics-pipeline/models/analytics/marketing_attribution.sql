@@ -7,21 +7,21 @@ DROP TABLE IF EXISTS analytics_attribution;
 CREATE TABLE analytics_attribution AS
 SELECT
     s.attribution_channel AS channel,
-    COUNT(DISTINCT s.session_id) AS total_sessions,
+    COUNT(DISTINCT s.session_key) AS total_sessions,
     COUNT(DISTINCT s.customer_id) AS unique_visitors,
     SUM(s.product_views) AS total_product_views,
     SUM(s.cart_adds) AS total_cart_adds,
     SUM(s.completed_checkout) AS conversions,
     -- conversion rate: sessions that led to a purchase
     ROUND(
-        CAST(SUM(s.completed_checkout) AS REAL) / COUNT(DISTINCT s.session_id) * 100, 2
+        CAST(SUM(s.completed_checkout) AS REAL) / COUNT(DISTINCT s.session_key) * 100, 2
     ) AS conversion_rate,
     -- revenue from this channel
     COALESCE(rev.channel_revenue, 0) AS total_revenue,
     COALESCE(rev.channel_orders, 0) AS total_orders,
     -- revenue per session (key efficiency metric)
     ROUND(
-        COALESCE(rev.channel_revenue, 0) / CAST(COUNT(DISTINCT s.session_id) AS REAL), 2
+        COALESCE(rev.channel_revenue, 0) / CAST(COUNT(DISTINCT s.session_key) AS REAL), 2
     ) AS revenue_per_session,
     -- avg order value by channel
     CASE WHEN COALESCE(rev.channel_orders, 0) > 0
@@ -42,5 +42,7 @@ LEFT JOIN (
     FROM fact_orders
     GROUP BY order_channel
 ) rev ON s.attribution_channel = rev.order_channel
-GROUP BY s.attribution_channel
+-- rev has one row per channel, its columns are listed so engines stricter
+-- than SQLite about bare columns accept the query too
+GROUP BY s.attribution_channel, rev.channel_revenue, rev.channel_orders
 ORDER BY total_revenue DESC
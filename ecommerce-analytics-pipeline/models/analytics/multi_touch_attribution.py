@@ -0,0 +1,14 @@
+# MULTI-TOUCH ATTRIBUTION
+# marketing_attribution.sql credits each order to its own session's channel
+# (last touch); this spreads it over the sessions in the 30 days before it,
+# under first-touch, last-touch, linear, time-decay and position-based models
+# one streamed pass over fact_sessions (see etl/attribution.py)
+# @reads: fact_sessions, fact_orders
+# @creates: analytics_attribution_models
+
+from etl.attribution import Attribution
+
+
+def build(conn):
+    # one row per model and channel, compare a channel's credit across models
+    return {'analytics_attribution_models': Attribution(lookback_days=30, half_life_days=7).compute(conn)}
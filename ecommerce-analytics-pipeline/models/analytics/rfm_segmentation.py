@@ -0,0 +1,21 @@
+# RFM SEGMENTATION (Recency, Frequency, Monetary)
+# classic ecommerce segmentation for targeting and personalization
+# scores come from quantile sketches instead of NTILE sorts (see etl/rfm.py)
+# recency counts days up to the time of the run, so it is rebuilt daily
+# @cache: daily
+# @reads: dim_customers
+# @creates: analytics_rfm, analytics_rfm_breakpoints
+
+import time
+
+from etl.rfm import RFM
+
+
+def build(conn):
+    result = RFM().compute(conn, now=int(time.time()))
+    return {
+        # a SELECT scoring against the breakpoints, SQLite runs it on its own
+        'analytics_rfm': result['rfm'],
+        # the value range behind each score, for reading the segments
+        'analytics_rfm_breakpoints': result['breakpoints'],
+    }
@@ -1,9 +1,13 @@
 -- dimension: customers enriched with order stats
 -- this is what you'd build in dbt as a mart for reporting
+-- @clustered_by: customer_id
 
 DROP TABLE IF EXISTS dim_customers;
 
 CREATE TABLE dim_customers AS
+WITH now AS (
+    SELECT CAST(strftime('%s', 'now') AS INTEGER) AS epoch
+)
 SELECT
     c.customer_id,
     c.full_name,
@@ -12,14 +16,17 @@ SELECT
     c.city,
     c.state,
     c.created_at AS first_seen_at,
+    c.created_epoch AS first_seen_epoch,
     c.last_active_at,
     c.days_active,
-    strftime('%Y-%m', c.created_at) AS cohort_month,
+    c.cohort_month,
+    c.cohort_month_key,
     COALESCE(o.total_orders, 0) AS lifetime_orders,
     COALESCE(o.total_revenue, 0) AS lifetime_revenue,
     COALESCE(o.avg_order_value, 0) AS avg_order_value,
     o.first_order_date,
     o.last_order_date,
+    o.last_order_epoch,
     CASE
         WHEN o.total_orders IS NULL THEN 'never_purchased'
         WHEN o.total_orders = 1 THEN 'one_time'
@@ -28,11 +35,12 @@ SELECT
     END AS customer_segment,
     CASE
         WHEN o.last_order_date IS NULL THEN 'no_purchase'
-        WHEN julianday('now') - julianday(o.last_order_date) <= 30 THEN 'active'
-        WHEN julianday('now') - julianday(o.last_order_date) <= 90 THEN 'at_risk'
+        WHEN (now.epoch - o.last_order_epoch) / 86400.0 <= 30 THEN 'active'
+        WHEN (now.epoch - o.last_order_epoch) / 86400.0 <= 90 THEN 'at_risk'
         ELSE 'churned'
     END AS activity_status
 FROM stg_customers c
+CROSS JOIN now
 LEFT JOIN (
     SELECT
         customer_id,
@@ -40,7 +48,8 @@ LEFT JOIN (
         ROUND(SUM(total), 2) AS total_revenue,
         ROUND(AVG(total), 2) AS avg_order_value,
         MIN(order_date) AS first_order_date,
-        MAX(order_date) AS last_order_date
+        MAX(order_date) AS last_order_date,
+        MAX(order_epoch) AS last_order_epoch
     FROM stg_orders
     GROUP BY customer_id
 ) o ON c.customer_id = o.customer_id
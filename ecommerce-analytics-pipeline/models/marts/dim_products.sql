@@ -1,4 +1,6 @@
 -- dimension: products with aggregated performance metrics
+-- @clustered_by: product_id
+-- @indexes: total_views
 
 DROP TABLE IF EXISTS dim_products;
 
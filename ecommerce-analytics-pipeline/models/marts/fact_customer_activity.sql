@@ -0,0 +1,23 @@
+-- fact table: one row per customer who ordered, with a bitmap of the days
+-- since signup they ordered on (etl/activity.py), for cohort retention at
+-- any granularity without re-joining the order history
+-- incremental: customers with new orders get their whole bitmap rebuilt
+-- @materialized: incremental
+-- @source: stg_orders
+-- @watermark: order_id
+-- @unique_key: customer_id
+
+DROP TABLE IF EXISTS fact_customer_activity;
+
+CREATE TABLE fact_customer_activity AS
+SELECT
+    o.customer_id,
+    c.created_epoch / 86400 AS signup_day_key,
+    c.acquisition_channel,
+    COUNT(*) AS orders,
+    COUNT(DISTINCT o.order_day_key) AS active_days,
+    MAX(o.order_day_key) AS last_active_day_key,
+    activity_bitmap(o.order_day_key - c.created_epoch / 86400) AS activity
+FROM stg_orders o
+JOIN stg_customers c ON o.customer_id = c.customer_id
+GROUP BY o.customer_id, c.created_epoch, c.acquisition_channel
@@ -1,4 +1,6 @@
 -- fact table: orders with all relevant dimensions joined
+-- one table per order month, dashboards filtering on a month read only that one
+-- @partition_by: order_month
 
 DROP TABLE IF EXISTS fact_orders;
 
@@ -17,6 +19,7 @@ SELECT
     o.shipping,
     o.total,
     o.order_date_day,
+    o.order_epoch,
     o.order_month,
     o.session_id,
     -- is this the customer's first order?
@@ -1,17 +1,34 @@
 -- fact table: sessions aggregated from events
--- each row = one user session with metrics
+-- each row = one session as stg_sessions derives it, with metrics
+-- session_key is the derived session, session_id the client's session id
+-- of its first event, which the funnel still counts sessions by
+-- a session's events are its customer's events from its first to its last,
+-- or for an anonymous session those of its client session_id
+-- grouping in the order of the stg_sessions index needs no sort
+-- incremental: the visitors whose sessions stg_sessions just rebuilt (one of
+-- them holds a newly loaded event) get all their sessions replaced, so a
+-- merged or moved session's old key goes with them
+-- @materialized: incremental
+-- @source: stg_sessions
+-- @watermark: last_event_id
+-- @unique_key: visitor_key
+-- fact_daily_visits finds the days to rebuild by last_event_id, then their sessions by session_date
+-- @indexes: (customer_id, session_start_epoch, attribution_channel), last_event_id, session_date
 
 DROP TABLE IF EXISTS fact_sessions;
 
 CREATE TABLE fact_sessions AS
 SELECT
-    e.session_id,
-    e.customer_id,
-    e.attribution_channel,
-    e.device_type,
+    s.session_key,
+    s.client_session_id AS session_id,
+    s.visitor_key,
+    s.customer_id,
+    s.attribution_channel,
+    s.device_type,
     MIN(e.event_timestamp) AS session_start,
+    s.session_start_epoch,
     MAX(e.event_timestamp) AS session_end,
-    DATE(MIN(e.event_timestamp)) AS session_date,
+    MIN(e.event_date) AS session_date,
     COUNT(*) AS total_events,
     SUM(CASE WHEN e.event_type = 'page_view' THEN 1 ELSE 0 END) AS page_views,
     SUM(CASE WHEN e.event_type = 'product_view' THEN 1 ELSE 0 END) AS product_views,
@@ -19,6 +36,13 @@ SELECT
     MAX(CASE WHEN e.event_type = 'checkout_start' THEN 1 ELSE 0 END) AS started_checkout,
     MAX(CASE WHEN e.event_type = 'checkout_complete' THEN 1 ELSE 0 END) AS completed_checkout,
     MAX(CASE WHEN e.event_type = 'checkout_abandon' THEN 1 ELSE 0 END) AS abandoned_checkout,
-    SUM(e.time_on_page_seconds) AS total_time_on_site
-FROM stg_events e
-GROUP BY e.session_id, e.customer_id, e.attribution_channel, e.device_type
+    SUM(e.time_on_page_seconds) AS total_time_on_site,
+    -- event ids only grow: a session with a newly loaded event has a new maximum
+    MAX(e.event_id) AS last_event_id
+FROM stg_sessions s
+JOIN stg_events e
+  ON e.customer_id IS NOT DISTINCT FROM s.customer_id
+ AND (s.customer_id IS NOT NULL OR e.session_id = s.client_session_id)
+ AND e.event_epoch BETWEEN s.session_start_epoch AND s.session_end_epoch
+GROUP BY s.customer_id, s.session_start_epoch, s.session_key, s.attribution_channel, s.device_type,
+         s.client_session_id, s.visitor_key
@@ -15,6 +15,9 @@ SELECT
     state,
     created_at,
     last_active_at,
-    CAST(julianday(last_active_at) - julianday(created_at) AS INTEGER) AS days_active
+    created_epoch,
+    substr(created_at, 1, 7) AS cohort_month,
+    created_month_key AS cohort_month_key,
+    (last_active_epoch - created_epoch) / 86400 AS days_active
 FROM raw_customers
 WHERE customer_id IS NOT NULL
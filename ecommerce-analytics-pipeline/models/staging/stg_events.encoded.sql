@@ -0,0 +1,33 @@
+-- staging: clean behavior events (encoded storage mode)
+-- used instead of stg_events.sql when the loader stores events dictionary-encoded.
+-- a view, not a table: scans read the narrow raw_events_encoded rows and
+-- decode through the lookup tables, whose values were LOWER()ed once each
+
+DROP VIEW IF EXISTS stg_events;
+
+CREATE VIEW stg_events AS
+SELECT
+    e.event_id,
+    e.customer_id,
+    e.session_id,
+    t.normalized AS event_type,
+    e.product_id,
+    ch.normalized AS attribution_channel,
+    d.normalized AS device_type,
+    u.value AS page_url,
+    COALESCE(e.time_on_page, 0) AS time_on_page_seconds,
+    e.event_timestamp,
+    e.event_epoch,
+    e.event_day_key,
+    e.event_month_key,
+    -- ISO text: the first 10 chars are the date
+    substr(e.event_timestamp, 1, 10) AS event_date,
+    -- extract hour for time-of-day analysis
+    (e.event_epoch % 86400) / 3600 AS event_hour,
+    CASE WHEN e.customer_id IS NOT NULL THEN 'c:' || e.customer_id ELSE 's:' || e.session_id END AS visitor_key
+FROM raw_events_encoded e
+LEFT JOIN lkp_event_type t ON t.code = e.event_type_code
+LEFT JOIN lkp_attribution_channel ch ON ch.code = e.channel_code
+LEFT JOIN lkp_device_type d ON d.code = e.device_code
+LEFT JOIN lkp_page_url u ON u.code = e.page_url_code
+WHERE e.event_timestamp IS NOT NULL
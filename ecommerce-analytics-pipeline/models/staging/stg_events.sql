@@ -1,5 +1,18 @@
 -- staging: clean behavior events
 -- normalize event types and extract date parts
+-- date parts come from the integer epoch/day/month keys the loader writes,
+-- not from parsing event_timestamp on every row
+-- incremental: only events loaded since the last run (event_id only grows)
+-- @materialized: incremental
+-- @source: raw_events
+-- @watermark: event_id
+-- @unique_key: event_id
+-- the funnel groups by all four session columns, so it reads them in index
+-- order without a sort. stg_sessions streams each customer's events in time
+-- order from the second index, and fact_sessions looks a session's events
+-- up by its (customer_id, event_epoch) prefix. an incremental stg_sessions
+-- run looks up the events of the visitors with new ones by visitor_key
+-- @indexes: (session_id, customer_id, attribution_channel, device_type), (customer_id, event_epoch, event_id, session_id, attribution_channel, device_type), visitor_key
 
 DROP TABLE IF EXISTS stg_events;
 
@@ -15,8 +28,15 @@ SELECT
     page_url,
     COALESCE(time_on_page, 0) AS time_on_page_seconds,
     event_timestamp,
-    DATE(event_timestamp) AS event_date,
+    event_epoch,
+    event_day_key,
+    event_month_key,
+    -- ISO text: the first 10 chars are the date
+    substr(event_timestamp, 1, 10) AS event_date,
     -- extract hour for time-of-day analysis
-    CAST(strftime('%H', event_timestamp) AS INTEGER) AS event_hour
+    (event_epoch % 86400) / 3600 AS event_hour,
+    -- who stg_sessions sessionizes the event for: its customer, or its
+    -- client session_id when anonymous
+    CASE WHEN customer_id IS NOT NULL THEN 'c:' || customer_id ELSE 's:' || session_id END AS visitor_key
 FROM raw_events
 WHERE event_timestamp IS NOT NULL
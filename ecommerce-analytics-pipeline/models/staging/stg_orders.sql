@@ -1,4 +1,5 @@
 -- staging: orders with calculated fields
+-- @indexes: customer_id
 
 DROP TABLE IF EXISTS stg_orders;
 
@@ -15,8 +16,11 @@ SELECT
     LOWER(attribution_channel) AS attribution_channel,
     session_id,
     created_at AS order_date,
-    DATE(created_at) AS order_date_day,
-    strftime('%Y-%m', created_at) AS order_month,
+    created_epoch AS order_epoch,
+    created_day_key AS order_day_key,
+    created_month_key AS order_month_key,
+    substr(created_at, 1, 10) AS order_date_day,
+    substr(created_at, 1, 7) AS order_month,
     completed_at
 FROM raw_orders
 WHERE order_id IS NOT NULL
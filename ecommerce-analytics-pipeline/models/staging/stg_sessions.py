@@ -0,0 +1,23 @@
+# staging: sessions derived from events, not from the client's session_id
+# a customer's session ends after 30 idle minutes or at midnight UTC
+# one streamed pass over stg_events (see etl/sessionize.py)
+# fact_sessions reads it in index order, one customer's sessions at a time
+# incremental: a visitor (customer, or client session_id when anonymous) with
+# a newly loaded event is sessionized again from all its events, and its
+# sessions replace the old ones whole, so a late event that merges two
+# sessions or moves one's start leaves nothing behind
+# @reads: stg_events
+# @creates: stg_sessions
+# @materialized: incremental
+# @source: stg_events
+# @watermark: event_id
+# @unique_key: visitor_key
+# @indexes: (customer_id, session_start_epoch, session_key, attribution_channel, device_type, client_session_id, visitor_key), last_event_id
+
+from etl.sessionize import Sessionizer
+
+GAP_MINUTES = 30
+
+
+def build(conn):
+    return {'stg_sessions': Sessionizer(GAP_MINUTES, split_at_midnight=True).compute(conn, 'stg_events')}
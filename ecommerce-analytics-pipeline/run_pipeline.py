@@ -4,29 +4,30 @@ Main pipeline runner — executes the full analytics workflow:
 2. Transform: run dbt-style SQL models (staging -> marts -> analytics)
 3. Analyze: generate visualizations and insights report
 
-Usage: python run_pipeline.py
+Usage: python run_pipeline.py [load options, see --help]
 """
 
+import argparse
 import sys
 import os
 
 # add project root to path
 sys.path.insert(0, os.path.dirname(__file__))
 
-from etl.extract_load import main as run_extract_load
+from etl.extract_load import main as run_extract_load, add_load_arguments, load_options
 from etl.transform import run_models
 from analysis.run_analysis import main as run_analysis
 from analysis.generate_report import generate as run_report
 
 
-def main():
+def main(load=None):
     print("=" * 60)
     print("E-Commerce Analytics Pipeline")
     print("=" * 60)
 
     print("\n[1/4] EXTRACT & LOAD")
     print("-" * 40)
-    run_extract_load()
+    run_extract_load(**(load or {}))
 
     print("\n[2/4] TRANSFORM (SQL Models)")
     print("-" * 40)
@@ -48,4 +49,5 @@ def main():
 
 
 if __name__ == '__main__':
-    main()
+    parser = add_load_arguments(argparse.ArgumentParser(description='Run the whole analytics pipeline.'))
+    main(load_options(parser.parse_args()))
@@ -0,0 +1,98 @@
+# tests for multi-touch attribution
+
+import sys
+import os
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+import sqlite3
+from collections import defaultdict
+
+import numpy as np
+import pytest
+import etl.attribution
+from etl.attribution import DAY, MODELS, Attribution
+
+CHANNELS = ["organic", "paid_search", "email", "social", "direct"]
+START = 1_767_225_600  # 2026-01-01
+
+
+@pytest.fixture(scope="module")
+def conn():
+    rng = np.random.default_rng(11)
+    conn = sqlite3.connect(":memory:")
+    conn.execute("CREATE TABLE fact_sessions (customer_id INTEGER, session_start_epoch INTEGER, attribution_channel TEXT)")
+    conn.execute("CREATE TABLE fact_orders (customer_id INTEGER, order_epoch INTEGER, total REAL, order_channel TEXT)")
+    sessions, orders = [], []
+    for customer in range(1, 60):
+        # a customer's sessions start at distinct times, so first and last are never a tie
+        starts = START + rng.choice(90 * 24, size=rng.integers(0, 25), replace=False) * 3600
+        sessions += [(customer, int(s), str(rng.choice(CHANNELS))) for s in starts]
+        # some orders before any session, some long after the last one
+        orders += [(customer, int(START + rng.integers(-5, 120) * DAY), round(float(rng.uniform(5, 500)), 2),
+                    str(rng.choice(CHANNELS))) for _ in range(rng.integers(0, 6))]
+    sessions += [(None, START, "direct")]
+    orders += [(None, START + DAY, 10.0, "direct")]
+    rng.shuffle(sessions)
+    conn.executemany("INSERT INTO fact_sessions VALUES (?, ?, ?)", sessions)
+    conn.executemany("INSERT INTO fact_orders VALUES (?, ?, ?, ?)", orders)
+    conn.execute("CREATE INDEX ix ON fact_sessions (customer_id, session_start_epoch, attribution_channel)")
+    return conn
+
+
+def reference(conn, lookback_days, half_life_days):
+    """Each order's path built and credited on its own, straight from the model definitions."""
+    sessions = defaultdict(list)
+    for customer, start, channel in conn.execute("SELECT * FROM fact_sessions WHERE customer_id IS NOT NULL"):
+        sessions[customer].append((start, channel))
+    totals = defaultdict(float)
+    for customer, when, revenue, order_channel in conn.execute("SELECT * FROM fact_orders WHERE customer_id IS NOT NULL"):
+        since = -np.inf if lookback_days is None else when - lookback_days * DAY
+        path = sorted(s for s in sessions[customer] if since <= s[0] <= when) or [(when, order_channel)]
+        n = len(path)
+        decay = [2 ** (-(when - start) / (half_life_days * DAY)) for start, _ in path]
+        for i, (start, channel) in enumerate(path):
+            totals["touchpoints", channel] += 1
+            totals["first", channel] += i == 0
+            totals["last", channel] += i == n - 1
+            if n == 1:
+                position = 1.0
+            elif n == 2:
+                position = 0.5
+            else:
+                position = 0.4 if i in (0, n - 1) else 0.2 / (n - 2)
+            shares = {"first_touch": float(i == 0), "last_touch": float(i == n - 1), "linear": 1 / n,
+                      "time_decay": decay[i] / sum(decay), "position_based": position}
+            for model, share in shares.items():
+                totals[model, "orders", channel] += share
+                totals[model, "revenue", channel] += share * revenue
+    return totals
+
+
+class TestAgainstReference:
+
+    @pytest.mark.parametrize("chunk", [1, 7, 1_000_000])
+    @pytest.mark.parametrize("lookback_days", [30, 7, None])
+    def test_totals(self, conn, monkeypatch, chunk, lookback_days):
+        monkeypatch.setattr(etl.attribution, "CHUNK", chunk)
+        _, rows = Attribution(lookback_days=lookback_days, half_life_days=7).compute(conn)
+        expected = reference(conn, lookback_days, 7)
+        assert {(row[0], row[1]) for row in rows} == {(m, c) for m in MODELS for c in CHANNELS}
+        for model, channel, orders, revenue, _, touchpoints, first, last in rows:
+            assert orders == pytest.approx(expected[model, "orders", channel], abs=0.006)
+            assert revenue == pytest.approx(expected[model, "revenue", channel], abs=0.006)
+            assert touchpoints == expected["touchpoints", channel]
+            assert first == expected["first", channel]
+            assert last == expected["last", channel]
+
+    def test_every_order_credited_once(self, conn):
+        _, rows = Attribution().compute(conn)
+        n, revenue = conn.execute("SELECT COUNT(*), SUM(total) FROM fact_orders WHERE customer_id IS NOT NULL").fetchone()
+        for model in MODELS:
+            mine = [row for row in rows if row[0] == model]
+            assert sum(row[2] for row in mine) == pytest.approx(n, abs=0.05)
+            assert sum(row[3] for row in mine) == pytest.approx(revenue, abs=0.05)
+            assert sum(row[4] for row in mine) == pytest.approx(100, abs=0.05)
+
+    def test_unknown_model(self):
+        with pytest.raises(ValueError):
+            Attribution(models=["first_touch", "w_shaped"])
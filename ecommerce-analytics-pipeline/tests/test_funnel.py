@@ -0,0 +1,39 @@
+# tests for the session funnel
+
+import sys
+import os
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+import sqlite3
+
+import pytest
+from etl.funnel import Funnel
+
+STEPS = ["page_view", "product_view", "add_to_cart"]
+
+
+@pytest.fixture
+def conn():
+    conn = sqlite3.connect(":memory:")
+    conn.execute("CREATE TABLE e (session_id TEXT, customer_id INTEGER, event_type TEXT, event_epoch INTEGER)")
+    conn.executemany("INSERT INTO e VALUES (?, ?, ?, ?)", [
+        # add_to_cart before page_view: reached out of order
+        ("s", 1, "page_view", 100), ("s", 1, "add_to_cart", 50), ("s", 1, "product_view", 200),
+        ("t", 2, "page_view", 0), ("t", 2, "product_view", 10), ("t", 2, "add_to_cart", 40),
+    ])
+    return conn
+
+
+class TestTiming:
+
+    @pytest.mark.parametrize("order", ["strict", "any", "none"])
+    def test_timing_is_strict_for_every_order(self, conn, order):
+        timing = Funnel(STEPS, order).compute(conn, "e")["timing"][1]
+        assert timing == Funnel(STEPS, "strict").compute(conn, "e")["timing"][1]
+        # s reached product_view 100s after page_view but never add_to_cart after it
+        assert [(row[0], row[3], row[4]) for row in timing] == [
+            ("page_view", 2, 55.0), ("product_view", 1, 30.0)]
+
+    def test_none_still_counts_out_of_order(self, conn):
+        funnel = Funnel(STEPS, "none").compute(conn, "e")["funnel"][1]
+        assert [row[2] for row in funnel] == [2, 2, 2]
@@ -0,0 +1,103 @@
+# tests for the HyperLogLog distinct counts
+
+import sys
+import os
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+import sqlite3
+
+import numpy as np
+import pytest
+from etl.hll import HyperLogLog, register, standard_error
+
+# the hashes are fixed, so each estimate is too; 4 standard errors leaves room
+# for any of them without hiding a biased estimator
+BOUND = 4
+
+
+def sketch_of(values, precision=14):
+    sketch = HyperLogLog(precision)
+    sketch.update(list(values))
+    return sketch
+
+
+class TestEstimate:
+
+    @pytest.mark.parametrize("n", [1_000, 20_000, 300_000])
+    @pytest.mark.parametrize("precision", [12, 14])
+    def test_within_error_bound(self, n, precision):
+        estimate = sketch_of(range(n), precision).count()
+        assert abs(estimate - n) / n <= BOUND * standard_error(precision)
+
+    def test_strings_and_floats(self):
+        n = 50_000
+        values = [f"visitor-{i}" for i in range(n)] + [i + 0.5 for i in range(n)]
+        assert abs(sketch_of(values).count() - 2 * n) / (2 * n) <= BOUND * standard_error()
+
+    def test_empty(self):
+        assert HyperLogLog().count() == 0
+        assert sketch_of([None, None]).count() == 0
+
+    @pytest.mark.parametrize("n", [1, 2, 10, 100])
+    def test_small_sets(self, n):
+        # far below the register count nearly every value has a register to
+        # itself, a collision or two is all that's off
+        assert abs(sketch_of(range(n)).count() - n) <= 2
+
+    def test_duplicates_ignored(self):
+        assert sketch_of(list(range(500)) * 20).count() == sketch_of(range(500)).count()
+
+    def test_bad_precision(self):
+        with pytest.raises(ValueError):
+            HyperLogLog(4)
+
+
+class TestMerge:
+
+    def test_merge_is_sketch_of_union(self):
+        a, b = sketch_of(range(0, 60_000)), sketch_of(range(40_000, 100_000))
+        a.merge(b)
+        union = sketch_of(range(100_000))
+        assert np.array_equal(a.registers, union.registers)
+        assert a.count() == union.count()
+
+    def test_merge_precision_mismatch(self):
+        with pytest.raises(ValueError):
+            sketch_of(range(10), 12).merge(sketch_of(range(10), 14))
+
+    def test_bytes_round_trip(self):
+        sketch = sketch_of(range(5_000))
+        again = HyperLogLog.from_bytes(sketch.to_bytes())
+        assert again.precision == sketch.precision
+        assert np.array_equal(again.registers, sketch.registers)
+
+
+class TestSqlFunctions:
+
+    @pytest.fixture
+    def conn(self):
+        conn = register(sqlite3.connect(":memory:"))
+        conn.execute("CREATE TABLE t (day INTEGER, visitor INTEGER)")
+        # each day's visitors overlap the next day's by half
+        conn.executemany("INSERT INTO t VALUES (?, ?)",
+                         [(day, v) for day in range(4) for v in range(day * 5_000, day * 5_000 + 10_000)])
+        conn.execute("INSERT INTO t VALUES (0, NULL)")
+        return conn
+
+    def test_merged_daily_sketches_match_direct_count(self, conn):
+        direct = conn.execute("SELECT approx_count_distinct(visitor) FROM t").fetchone()[0]
+        merged = conn.execute("""
+            SELECT hll_count(hll_merge(sketch))
+            FROM (SELECT hll_sketch(visitor) AS sketch FROM t GROUP BY day)
+        """).fetchone()[0]
+        exact = conn.execute("SELECT COUNT(DISTINCT visitor) FROM t").fetchone()[0]
+        assert merged == direct
+        assert abs(direct - exact) / exact <= BOUND * standard_error()
+
+    def test_precision_argument(self, conn):
+        blob = conn.execute("SELECT hll_sketch(visitor, 12) FROM t").fetchone()[0]
+        assert HyperLogLog.from_bytes(blob).precision == 12
+
+    def test_null_sketch(self, conn):
+        assert conn.execute("SELECT hll_count(NULL)").fetchone()[0] is None
+        assert conn.execute("SELECT hll_merge(NULL)").fetchone()[0] is None
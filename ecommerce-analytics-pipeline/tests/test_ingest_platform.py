@@ -0,0 +1,32 @@
+# tests for the platform export ingest
+
+import sys
+import os
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+import time
+
+import pytest
+from etl.ingest_platform import _timestamp
+
+
+class TestTimestamp:
+
+    @pytest.fixture(params=["UTC", "America/New_York", "Asia/Tokyo"])
+    def host_tz(self, request, monkeypatch):
+        monkeypatch.setenv("TZ", request.param)
+        time.tzset()
+        yield request.param
+        monkeypatch.undo()
+        time.tzset()
+
+    def test_no_offset_is_utc(self, host_tz):
+        assert _timestamp("2026-01-01T10:00:00") == "2026-01-01T10:00:00"
+
+    def test_offset_converted(self, host_tz):
+        assert _timestamp("2026-01-01T10:00:00+02:00") == "2026-01-01T08:00:00"
+
+    def test_mongo_shapes(self):
+        assert _timestamp({"$date": "2026-01-01T10:00:00.000Z"}) == "2026-01-01T10:00:00.000"
+        assert _timestamp({"$date": {"$numberLong": "1767225600000"}}) == "2026-01-01T00:00:00"
+        assert _timestamp(None) is None
@@ -0,0 +1,89 @@
+# tests for the KLL quantile sketch
+
+import sys
+import os
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+import numpy as np
+import pytest
+from etl.quantiles import KLL
+
+FRACTIONS = np.linspace(0.01, 0.99, 99)
+
+
+def rank_error(values, fractions, estimates):
+    # how far off each estimate's rank is, as a fraction of the stream; with
+    # ties, any rank the value takes counts as hitting the fraction
+    ordered = np.sort(values)
+    low = np.searchsorted(ordered, estimates, side="left") / len(ordered)
+    high = np.searchsorted(ordered, estimates, side="right") / len(ordered)
+    return np.max(np.maximum(low - fractions, fractions - high).clip(0))
+
+
+def sketch_of(values, k=200, batch=10_000):
+    sketch = KLL(k)
+    for start in range(0, len(values), batch):
+        sketch.update(values[start:start + batch])
+    return sketch
+
+
+def streams():
+    rng = np.random.default_rng(3)
+    return {
+        "uniform": rng.random(200_000),
+        "lognormal": rng.lognormal(3, 1, 200_000),
+        "sorted": np.arange(200_000, dtype=np.float64),
+        "reversed": np.arange(200_000, 0, -1, dtype=np.float64),
+        "ties": rng.integers(0, 20, 200_000).astype(np.float64),
+    }
+
+
+class TestRankError:
+
+    @pytest.mark.parametrize("name", list(streams()))
+    @pytest.mark.parametrize("k", [100, 200])
+    def test_within_bound(self, name, k):
+        values = streams()[name]
+        estimates = sketch_of(values, k).quantiles(FRACTIONS)
+        # the docstring's ~1.7 / k is typical, allow twice that for the worst of 99 fractions
+        assert rank_error(values, FRACTIONS, estimates) <= 2 * 1.7 / k
+
+    @pytest.mark.parametrize("batch", [1_000, 200_000])
+    def test_batching_within_bound(self, batch):
+        values = streams()["lognormal"]
+        estimates = sketch_of(values, batch=batch).quantiles(FRACTIONS)
+        assert rank_error(values, FRACTIONS, estimates) <= 2 * 1.7 / 200
+
+    def test_retains_a_few_hundred_values(self):
+        sketch = sketch_of(streams()["uniform"])
+        assert sketch.count == 200_000
+        assert sum(len(level) for level in sketch.levels) < 3 * 200
+
+
+class TestEdges:
+
+    def test_small_stream_exact(self):
+        values = np.arange(1, 101, dtype=np.float64)
+        sketch = KLL()
+        sketch.update(values)
+        assert sketch.quantiles([0.0, 0.5, 1.0]).tolist() == [1.0, 50.0, 100.0]
+
+    def test_empty(self):
+        assert np.isnan(KLL().quantiles([0.5])).all()
+
+    def test_nan_skipped(self):
+        sketch = KLL()
+        sketch.update([1.0, np.nan, 3.0])
+        assert sketch.count == 2
+        assert sketch.quantiles([1.0]).tolist() == [3.0]
+
+    def test_same_stream_same_sketch(self):
+        values = streams()["uniform"]
+        assert np.array_equal(sketch_of(values).quantiles(FRACTIONS), sketch_of(values).quantiles(FRACTIONS))
+
+    def test_complex_pairs_sort_by_value_then_id(self):
+        # value + 1j * id: equal values still give distinct, ordered items
+        values = np.repeat(np.arange(10.0), 1_000) + 1j * np.arange(10_000)
+        estimates = sketch_of(values).quantiles(FRACTIONS)
+        assert np.all(np.diff(estimates.real) >= 0)
+        assert rank_error(values.real, FRACTIONS, estimates.real) <= 2 * 1.7 / 200
@@ -0,0 +1,123 @@
+# tests for event-based sessionization
+
+import sys
+import os
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+import sqlite3
+
+import numpy as np
+import pytest
+import etl.sessionize
+from etl.sessionize import DAY, SESSION_COLUMNS, Sessionizer
+
+MIDNIGHT = 1_767_225_600  # 2026-01-01 00:00 UTC
+MIN = 60
+NAMES = [c.split()[0] for c in SESSION_COLUMNS]
+
+
+def events_table(events):
+    """stg_events with (event_id, customer_id, session_id, event_epoch, channel, device) rows."""
+    conn = sqlite3.connect(":memory:")
+    conn.execute("""CREATE TABLE stg_events (event_id INTEGER, customer_id INTEGER, session_id TEXT,
+                    event_epoch INTEGER, attribution_channel TEXT, device_type TEXT)""")
+    conn.executemany("INSERT INTO stg_events VALUES (?, ?, ?, ?, ?, ?)", events)
+    return conn
+
+
+def sessions(conn, **kwargs):
+    columns, rows = Sessionizer(**kwargs).compute(conn)
+    assert columns == SESSION_COLUMNS
+    return [dict(zip(NAMES, row)) for row in rows]
+
+
+@pytest.fixture(scope="module")
+def mixed():
+    rng = np.random.default_rng(5)
+    events = []
+    for event_id in range(1, 3_001):
+        customer = int(rng.integers(1, 40)) if rng.random() < 0.8 else None
+        # bursts near midnight, gaps around the 30 minutes
+        when = MIDNIGHT + int(rng.integers(0, 3)) * DAY + int(rng.integers(-2 * 60, 2 * 60)) * MIN
+        events.append((event_id, customer, str(rng.choice(["unknown", "x1", "x2"])), when,
+                       str(rng.choice(["email", "direct"])), str(rng.choice(["mobile", "desktop"]))))
+    return events_table(events)
+
+
+class TestSplits:
+
+    def test_gap(self):
+        conn = events_table([(1, 7, "a", MIDNIGHT + 60 * MIN, "email", "mobile"),
+                             (2, 7, "a", MIDNIGHT + 90 * MIN, "direct", "desktop"),  # exactly the gap: same session
+                             (3, 7, "a", MIDNIGHT + 121 * MIN, "organic", "desktop")])
+        out = sessions(conn)
+        assert [(s["session_start_epoch"], s["session_end_epoch"], s["events"]) for s in out] == [
+            (MIDNIGHT + 60 * MIN, MIDNIGHT + 90 * MIN, 2), (MIDNIGHT + 121 * MIN, MIDNIGHT + 121 * MIN, 1)]
+        # a session takes its first event's channel and device
+        assert (out[0]["attribution_channel"], out[0]["device_type"]) == ("email", "mobile")
+
+    def test_midnight(self):
+        conn = events_table([(1, 7, "a", MIDNIGHT - 10 * MIN, "email", "mobile"),
+                             (2, 7, "a", MIDNIGHT + 5 * MIN, "email", "mobile")])
+        assert [s["events"] for s in sessions(conn)] == [1, 1]
+        assert [s["events"] for s in sessions(conn, split_at_midnight=False)] == [2]
+
+    def test_event_at_midnight_starts_the_day(self):
+        conn = events_table([(1, 7, "a", MIDNIGHT - 1, "email", "mobile"),
+                             (2, 7, "a", MIDNIGHT, "email", "mobile"),
+                             (3, 7, "a", MIDNIGHT + 1, "email", "mobile")])
+        assert [s["events"] for s in sessions(conn)] == [1, 2]
+
+    def test_visitors_never_share_a_session(self):
+        conn = events_table([(1, 7, "a", MIDNIGHT + MIN, "email", "mobile"),
+                             (2, 8, "a", MIDNIGHT + 2 * MIN, "email", "mobile")])
+        assert [s["visitor_key"] for s in sessions(conn)] == ["c:7", "c:8"]
+
+    def test_bad_gap(self):
+        with pytest.raises(ValueError):
+            Sessionizer(gap_minutes=0)
+
+
+class TestKeys:
+
+    def test_anonymous_split_per_session_id(self):
+        conn = events_table([(1, None, "unknown", MIDNIGHT + MIN, "email", "mobile"),
+                             (2, None, "unknown", MIDNIGHT + 3 * 60 * MIN, "email", "mobile"),
+                             (3, None, "x1", MIDNIGHT + 2 * MIN, "email", "mobile"),
+                             (4, 7, "unknown", MIDNIGHT + 2 * MIN, "email", "mobile")])
+        out = sessions(conn)
+        assert [(s["session_key"], s["visitor_key"], s["customer_id"], s["client_session_id"]) for s in out] == [
+            (f"c:7:{MIDNIGHT + 2 * MIN}", "c:7", 7, "unknown"),
+            (f"s:unknown:{MIDNIGHT + MIN}", "s:unknown", None, "unknown"),
+            (f"s:unknown:{MIDNIGHT + 180 * MIN}", "s:unknown", None, "unknown"),
+            (f"s:x1:{MIDNIGHT + 2 * MIN}", "s:x1", None, "x1"),
+        ]
+
+    def test_last_event_id_is_the_newest_load(self):
+        # event 9 loaded late, but it happened first
+        conn = events_table([(9, 7, "a", MIDNIGHT + MIN, "email", "mobile"),
+                             (2, 7, "a", MIDNIGHT + 5 * MIN, "email", "mobile"),
+                             (3, 7, "a", MIDNIGHT + 3 * 60 * MIN, "email", "mobile")])
+        assert [s["last_event_id"] for s in sessions(conn)] == [9, 3]
+
+
+class TestChunks:
+
+    @pytest.mark.parametrize("chunk", [1, 2, 7, 100])
+    def test_same_sessions_at_any_chunk_size(self, mixed, monkeypatch, chunk):
+        whole = sessions(mixed)
+        monkeypatch.setattr(etl.sessionize, "CHUNK", chunk)
+        assert sessions(mixed) == whole
+
+    def test_one_session_across_chunks(self, monkeypatch):
+        # one visitor's ten events a minute apart, read three at a time
+        conn = events_table([(i, 7, "a", MIDNIGHT + i * MIN, "email", "mobile") for i in range(10)])
+        monkeypatch.setattr(etl.sessionize, "CHUNK", 3)
+        out = sessions(conn)
+        assert [(s["events"], s["last_event_id"]) for s in out] == [(10, 9)]
+
+    def test_every_event_in_one_session(self, mixed):
+        out = sessions(mixed)
+        assert sum(s["events"] for s in out) == 3_000
+        assert len({s["session_key"] for s in out}) == len(out)
+        assert all(s["session_start_epoch"] // DAY == s["session_end_epoch"] // DAY for s in out)